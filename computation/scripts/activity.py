@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+#
+""" Frame level activity of the speakers of each file, built once from an
+    rttm, from which the speech detection rates of the chunks are computed
+    as vectorized reductions.
+
+    The activity of a file is a (labels x frames) boolean matrix, at a
+    fixed frame duration (10ms by default), stored as bits: each row is
+    packed in bytes (np.packbits), so that a file of 2 hours with 4
+    speakers takes 360KB at 10ms. Frame i covers [i * frame_dur,
+    (i + 1) * frame_dur), and a segment covers the frames between its
+    rounded onset and offset.
+
+    The union of the speakers (speech) is computed on the packed bytes, and
+    the durations of correct detection, false alarm and miss of each chunk
+    by cumulative sums over the frames.
+
+    The activities of an rttm can be cached in a folder:
+
+        {cache}/{rttm}.{path}.{frame_ms}ms.npy: the bytes of all the files
+        {cache}/{rttm}.{path}.{frame_ms}ms.json: for each file, its labels,
+            number of frames and position in the npy, plus the size and
+            modification time of the rttm (the cache is rebuilt when the
+            rttm changes)
+
+    where {rttm} is the name of the rttm and {path} the beginning of the
+    sha1 of its absolute path, so that the rttms of the same name in
+    different folders (e.g. the ref.rttm of each corpus) have their own
+    files.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+from collections import OrderedDict
+
+FRAME_DUR = 0.01
+VERSION = 1
+# number of hexadecimal digits of the sha1 of the path in the cache names
+PATH_DIGITS = 12
+
+_ACTIVITIES = dict()
+
+
+def to_frames(times, frame_dur=FRAME_DUR):
+    """ convert times in seconds to frame indices (rounded)"""
+    return np.round(np.asarray(times, dtype=np.float64) / frame_dur
+                    ).astype(np.int64)
+
+
+def chunk_sums(active, starts):
+    """ number of active frames in each chunk of a boolean array of frames,
+        the chunks starting at the indices starts (sorted) and the last one
+        ending at the end of the array"""
+    starts = np.clip(np.asarray(starts, dtype=np.int64), 0, len(active))
+    cumsum = np.r_[0, np.cumsum(active, dtype=np.int64)]
+    ends = np.r_[starts[1:], len(active)]
+    return cumsum[ends] - cumsum[starts]
+
+
+def chunk_frames(onsets, end, frame_dur=FRAME_DUR):
+    """ frame bounds of chunks starting at onsets (seconds) and ending at end
+        OUTPUT
+        ------
+            first, last: frames [first, last) covered by the chunks
+            starts: first frame of each chunk, relative to first
+    """
+    starts = to_frames(onsets, frame_dur)
+    last = int(to_frames(end, frame_dur))
+    first = int(starts[0]) if len(starts) else last
+    return first, last, starts - first
+
+
+class Activity(object):
+    """ activity of the speakers of a file
+        ATTRIBUTES
+        ----------
+            labels: list of the labels, in order of first appearance
+            bits: uint8 array (labels x bytes), row i is the packed activity
+                  of labels[i]
+            n_frames: number of frames (up to the last offset)
+            frame_dur: duration of a frame, in seconds
+    """
+
+    def __init__(self, labels, bits, n_frames, frame_dur=FRAME_DUR):
+        self.labels = list(labels)
+        self.bits = bits
+        self.n_frames = n_frames
+        self.frame_dur = frame_dur
+
+    @classmethod
+    def from_segments(cls, onsets, offsets, labels, frame_dur=FRAME_DUR):
+        """ INPUT
+            -----
+                onsets, offsets: arrays of (possibly overlapping) segments
+                labels: label of each segment
+        """
+        starts = np.maximum(to_frames(onsets, frame_dur), 0)
+        ends = np.maximum(to_frames(offsets, frame_dur), starts)
+        n_frames = int(ends.max()) if len(ends) else 0
+
+        names = list(OrderedDict.fromkeys(labels))
+        index = {label: i for i, label in enumerate(names)}
+        label_idx = np.array([index[label] for label in labels], dtype=np.int64)
+
+        bits = np.zeros((len(names), (n_frames + 7) // 8), dtype=np.uint8)
+        for i in range(len(names)):
+            sel = label_idx == i
+            # +1 at each start, -1 at each end: frames with a positive
+            # cumulative sum are covered by a segment
+            diff = np.zeros(n_frames + 1, dtype=np.int32)
+            np.add.at(diff, starts[sel], 1)
+            np.add.at(diff, ends[sel], -1)
+            bits[i] = np.packbits(np.cumsum(diff[:-1]) > 0)
+        return cls(names, bits, n_frames, frame_dur)
+
+    def __len__(self):
+        return self.n_frames
+
+    def _row(self, packed, start=0, end=None):
+        """ unpack a packed row to a boolean array of frames [start, end),
+            the frames after the last offset being inactive"""
+        end = self.n_frames if end is None else end
+        out = np.zeros(max(end - start, 0), dtype=bool)
+        lo, hi = max(start, 0), min(end, self.n_frames)
+        if hi > lo:
+            byte_lo = lo // 8
+            frames = np.unpackbits(packed[byte_lo:(hi + 7) // 8])
+            out[lo - start:hi - start] = frames[lo - byte_lo * 8:
+                                                hi - byte_lo * 8]
+        return out
+
+    @property
+    def speech(self):
+        """ packed frames where at least one label is active"""
+        if not len(self.labels):
+            return np.zeros(self.bits.shape[1], dtype=np.uint8)
+        return np.bitwise_or.reduce(self.bits, axis=0)
+
+    def speech_frames(self, start=0, end=None):
+        return self._row(self.speech, start, end)
+
+
+def chunk_rates(ref, sys, onsets, end):
+    """ durations of correct detection, false alarm and miss of the speech
+        of sys against ref, in each chunk, the chunks starting at onsets
+        (seconds) and the last one ending at end
+        OUTPUT
+        ------
+            true, false, miss: arrays of durations (seconds) per chunk
+    """
+    first, last, starts = chunk_frames(onsets, end, ref.frame_dur)
+    ref_speech = ref.speech_frames(first, last)
+    sys_speech = sys.speech_frames(first, last)
+    return tuple(chunk_sums(active, starts) * ref.frame_dur
+                 for active in [ref_speech & sys_speech,
+                                sys_speech & ~ref_speech,
+                                ref_speech & ~sys_speech])
+
+
+def cache_paths(rttm, frame_dur, cache_dir):
+    path = hashlib.sha1(os.path.abspath(rttm).encode('utf-8')).hexdigest()
+    prefix = os.path.join(cache_dir, '{}.{}.{}ms'.format(
+        os.path.basename(rttm), path[:PATH_DIGITS],
+        int(round(frame_dur * 1000))))
+    return prefix + '.npy', prefix + '.json'
+
+
+def build_activities(rttm, frame_dur=FRAME_DUR):
+    """ activity of each file of an rttm (dict {uri: Activity})"""
+    segments = OrderedDict()
+    with open(rttm, 'r') as fin:
+        for line in fin:
+            fields = line.split()
+            if len(fields) < 8:
+                continue
+            wav, onset, dur, label = fields[1], float(fields[3]), \
+                float(fields[4]), fields[7]
+            if dur > 0:
+                segments.setdefault(wav, []).append((onset, onset + dur, label))
+
+    activities = OrderedDict()
+    for wav, segs in segments.items():
+        onsets, offsets, labels = zip(*segs)
+        activities[wav] = Activity.from_segments(onsets, offsets, labels,
+                                                 frame_dur)
+    return activities
+
+
+def save_activities(activities, rttm, frame_dur, cache_dir):
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    npy, meta = cache_paths(rttm, frame_dur, cache_dir)
+    stat = os.stat(rttm)
+    files = OrderedDict()
+    position = 0
+    for wav, act in activities.items():
+        files[wav] = [act.labels, act.n_frames, position]
+        position += act.bits.size
+    bits = [act.bits.ravel() for act in activities.values()]
+    np.save(npy, np.concatenate(bits) if bits else np.zeros(0, np.uint8))
+    with open(meta, 'w') as fout:
+        json.dump({'version': VERSION, 'size': stat.st_size,
+                   'mtime_ns': stat.st_mtime_ns, 'frame_dur': frame_dur,
+                   'files': files}, fout)
+
+
+def read_activities(rttm, frame_dur, cache_dir):
+    """ read the cached activities of an rttm, None if they are missing or
+        outdated"""
+    npy, meta = cache_paths(rttm, frame_dur, cache_dir)
+    stat = os.stat(rttm)
+    try:
+        with open(meta, 'r') as fin:
+            info = json.load(fin)
+        if (info['version'] != VERSION or info['size'] != stat.st_size or
+                info['mtime_ns'] != stat.st_mtime_ns):
+            return None
+        bits = np.load(npy, mmap_mode='r')
+    except (IOError, ValueError, KeyError):
+        return None
+
+    activities = OrderedDict()
+    for wav, (labels, n_frames, position) in info['files'].items():
+        shape = (len(labels), (n_frames + 7) // 8)
+        activities[wav] = Activity(
+            labels, np.asarray(bits[position:position + shape[0] * shape[1]]
+                               ).reshape(shape), n_frames, frame_dur)
+    return activities
+
+
+def load_activities(rttm, frame_dur=FRAME_DUR, cache_dir=None):
+    """ return the activities of the files of an rttm (dict {uri: Activity}),
+        built once per process, and cached in cache_dir if given"""
+    assert os.path.isfile(rttm), '{} does not exist! exiting...'.format(rttm)
+    stat = os.stat(rttm)
+    key = (os.path.abspath(rttm), frame_dur)
+    if key in _ACTIVITIES and _ACTIVITIES[key][0] == (stat.st_size,
+                                                      stat.st_mtime_ns):
+        return _ACTIVITIES[key][1]
+
+    activities = None
+    if cache_dir is not None:
+        activities = read_activities(rttm, frame_dur, cache_dir)
+    if activities is None:
+        activities = build_activities(rttm, frame_dur)
+        if cache_dir is not None:
+            save_activities(activities, rttm, frame_dur, cache_dir)
+
+    _ACTIVITIES[key] = ((stat.st_size, stat.st_mtime_ns), activities)
+    return activities
+
+
+def empty_activity(frame_dur=FRAME_DUR):
+    """ activity of a file without any annotation"""
+    return Activity([], np.zeros((0, 0), dtype=np.uint8), 0, frame_dur)
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+#
+""" Corpus level summaries (count, mean, variance) of the per file and per
+    speaker descriptors.
+
+    Each (corpus, subset, role) group keeps one accumulator per column.
+    Accumulators are updated as the rows are produced and can be merged
+    (Chan et al. parallel algorithm), so that summaries computed by several
+    workers, or by reruns of a single subset, are combined without
+    re-reading the csv's.
+    The state is stored in results/.aggregates/aggregates.json (computed
+    from the csv's of the results folder when it doesn't exist yet), the
+    summaries are written in results/_averages.csv,
+    results/_averagesPerSpeaker.csv (mean per corpus, as
+    description/system.Rmd) and results/.aggregates/summaries.csv (count,
+    mean and variance per corpus, subset and role). The .aggregates folder
+    is local to each checkout and isn't versioned.
+
+    Example of use, to regenerate the summaries from an existing state:
+
+        `python aggregates.py`
+"""
+
+import os
+import csv
+import json
+import math
+import argparse
+
+from collections import defaultdict
+
+RESULTS_DIR = os.path.join('..', 'results')
+# state of the aggregates, relative to the results folder
+STATE_DIR = '.aggregates'
+STATE = os.path.join(STATE_DIR, 'aggregates.json')
+ROWS = os.path.join(STATE_DIR, 'aggregate_rows.json')
+SUMMARIES = os.path.join(STATE_DIR, 'summaries.csv')
+
+FILE_COLUMNS = ['clip_length', 'nb_diff_speakers', 'nb_children', 'nb_fem_ad',
+                'nb_mal_ad', 'nb_uncertain', 'prop_ovl_speech',
+                'prop_nonovl_speech', 'avg_voc_dur', 'snr']
+SPEAKER_COLUMNS = ['tot_ovl_speech', 'tot_nonovl_speech', 'snr']
+
+# role used for the per file descriptors
+ALL_ROLES = ''
+
+
+def corpus_group(corpus):
+    """ corpus of the averages of a corpus name, without its variant
+        (SRI_far is averaged with SRI, gsub("_.*", "") in system.Rmd)"""
+    return corpus.split('_')[0]
+
+
+class RunningStats(object):
+    """ streaming count, mean and sum of squared differences to the mean.
+        Missing values (None, "NA", NaN) are counted apart, and make the
+        summaries NA (as R's mean and var)."""
+
+    def __init__(self, count=0, mean=0., m2=0., missing=0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.missing = missing
+
+    def add(self, value):
+        """ Welford update with a single value"""
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = float('nan')
+        if math.isnan(value):
+            self.missing += 1
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """ combine with the statistics of another set of values"""
+        self.missing += other.missing
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def available(self):
+        """ True if the summaries are defined: some values, none missing"""
+        return self.count > 0 and not self.missing
+
+    @property
+    def variance(self):
+        """ unbiased variance (same as R's var), NaN if less than 2 values"""
+        return self.m2 / (self.count - 1) if self.count > 1 else float('nan')
+
+    def to_list(self):
+        return [self.count, self.mean, self.m2, self.missing]
+
+
+class Aggregates(object):
+    """ RunningStats per (corpus, subset, role) group and per column"""
+
+    def __init__(self):
+        self.files = defaultdict(lambda: defaultdict(RunningStats))
+        self.speakers = defaultdict(lambda: defaultdict(RunningStats))
+
+    def add_file(self, corpus, subset, row):
+        """ row: dict {column: value} of a per file descriptor"""
+        group = self.files[(corpus, subset, ALL_ROLES)]
+        for col in FILE_COLUMNS:
+            group[col].add(row.get(col))
+
+    def add_speaker(self, corpus, subset, role, row):
+        """ row: dict {column: value} of a per speaker descriptor"""
+        group = self.speakers[(corpus, subset, role)]
+        for col in SPEAKER_COLUMNS:
+            group[col].add(row.get(col))
+
+    def reset(self, corpus, subset):
+        """ forget a subset, before computing it again"""
+        for table in [self.files, self.speakers]:
+            for key in [key for key in table
+                        if key[0] == corpus and key[1] == subset]:
+                del table[key]
+
+    def merge(self, other):
+        """ merge the accumulators of another Aggregates, group by group"""
+        for table, other_table in [(self.files, other.files),
+                                   (self.speakers, other.speakers)]:
+            for key, group in other_table.items():
+                for col, stats in group.items():
+                    table[key][col].merge(stats)
+        return self
+
+    def summary(self, table, by=('corpus',), group_corpora=False):
+        """ merge the groups sharing the same values for the fields in "by".
+            With group_corpora, the variants of a corpus (SRI_far) are
+            merged with the corpus (SRI), as in description/system.Rmd.
+            OUTPUT
+            ------
+                dict {key: {column: RunningStats}}, sorted by key
+        """
+        fields = ['corpus', 'subset', 'role']
+        out = defaultdict(lambda: defaultdict(RunningStats))
+        for key, group in getattr(self, table).items():
+            if group_corpora:
+                key = (corpus_group(key[0]),) + tuple(key[1:])
+            out_key = tuple(key[fields.index(field)] for field in by)
+            for col, stats in group.items():
+                out[out_key][col].merge(stats)
+        return dict(sorted(out.items()))
+
+    def to_dict(self):
+        return {table: [[list(key), {col: stats.to_list()
+                                     for col, stats in group.items()}]
+                        for key, group in sorted(getattr(self, table).items())]
+                for table in ['files', 'speakers']}
+
+    @classmethod
+    def from_dict(cls, state):
+        aggregates = cls()
+        for table in ['files', 'speakers']:
+            for key, group in state.get(table, []):
+                for col, values in group.items():
+                    getattr(aggregates, table)[tuple(key)][col] = \
+                        RunningStats(*values)
+        return aggregates
+
+
+class AggregateRows(object):
+    """ rows given to an Aggregates, stored to be added later in another
+        order. Used by the shards of a run: adding the rows of all the
+        shards in the order of a single run gives exactly the same
+        summaries (merging the RunningStats would only give the same
+        summaries up to rounding errors).
+        The rows must contain the column "file".
+    """
+
+    def __init__(self, rows=None):
+        self.rows = [] if rows is None else rows
+
+    def add_file(self, corpus, subset, row):
+        self.rows.append(['files', corpus, subset, ALL_ROLES, row])
+
+    def add_speaker(self, corpus, subset, role, row):
+        self.rows.append(['speakers', corpus, subset, role, row])
+
+    def extend(self, other):
+        self.rows.extend(other.rows)
+        return self
+
+    def replay(self, aggregates, orders):
+        """ add the rows to aggregates, in the order of their file
+            INPUT
+            -----
+                aggregates: Aggregates
+                orders: dict {subset: list of files}
+        """
+        ranks = {subset: {wav: i for i, wav in enumerate(order)}
+                 for subset, order in orders.items()}
+        # the sort is stable: the rows of a file keep their order
+        rows = sorted(self.rows, key=lambda r: ranks.get(r[2], {}).get(
+            r[4]['file'], float('inf')))
+        for table, corpus, subset, role, row in rows:
+            if table == 'files':
+                aggregates.add_file(corpus, subset, row)
+            else:
+                aggregates.add_speaker(corpus, subset, role, row)
+        return aggregates
+
+
+def load_aggregate_rows(path):
+    if not os.path.isfile(path):
+        return AggregateRows()
+    with open(path, 'r') as fin:
+        return AggregateRows(json.load(fin))
+
+
+def make_parent(path):
+    """ create the folder of path if needed"""
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+
+
+def save_aggregate_rows(rows, path):
+    make_parent(path)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fout:
+        json.dump(rows.rows, fout)
+    os.replace(tmp, path)
+
+
+def load_aggregates(path, results_dir=None):
+    """ read a saved state. If it doesn't exist, the aggregates are computed
+        from the csv's of results_dir if given (so that the corpora already
+        in the results are kept in the averages), empty otherwise."""
+    if not os.path.isfile(path):
+        if results_dir is not None and os.path.isdir(results_dir):
+            return aggregates_from_results(results_dir)
+        return Aggregates()
+    with open(path, 'r') as fin:
+        return Aggregates.from_dict(json.load(fin))
+
+
+def save_aggregates(aggregates, path):
+    make_parent(path)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fout:
+        json.dump(aggregates.to_dict(), fout, indent=1)
+    os.replace(tmp, path)
+
+
+def replace_subsets(aggregates, incoming):
+    """ merge incoming in aggregates, the (corpus, subset) found in incoming
+        replacing the ones already known"""
+    for corpus, subset, _ in set(incoming.files) | set(incoming.speakers):
+        aggregates.reset(corpus, subset)
+    return aggregates.merge(incoming)
+
+
+def aggregates_from_results(results_dir=RESULTS_DIR):
+    """ compute the aggregates by reading the per file and per speaker csv's
+        of the results folder"""
+    aggregates = Aggregates()
+    for fname in sorted(os.listdir(results_dir)):
+        if not fname.endswith('.csv') or fname.startswith('_'):
+            continue
+        name, _ = os.path.splitext(fname)
+        per_speaker = name.endswith('_perSpeaker')
+        if per_speaker:
+            name = name[:-len('_perSpeaker')]
+        try:
+            corpus, subset = name.rsplit('_', 1)
+        except ValueError:
+            continue
+
+        with open(os.path.join(results_dir, fname), 'r') as fin:
+            for row in csv.DictReader(fin):
+                if per_speaker:
+                    aggregates.add_speaker(corpus, subset, row['role'], row)
+                else:
+                    aggregates.add_file(corpus, subset, row)
+    return aggregates
+
+
+def write_averages(aggregates, results_dir=RESULTS_DIR):
+    """ write the summaries:
+            _averages.csv, _averagesPerSpeaker.csv: mean per corpus, in the
+                same format as the tables written by description/system.Rmd
+            .aggregates/summaries.csv: count, mean and variance of each
+                column per corpus, subset and role
+    """
+    for table, columns, fname in [
+            ('files', FILE_COLUMNS, '_averages.csv'),
+            ('speakers', SPEAKER_COLUMNS, '_averagesPerSpeaker.csv')]:
+        with open(os.path.join(results_dir, fname), 'w') as fout:
+            fout.write(u' '.join('"{}"'.format(col)
+                                 for col in ['Group.1'] + columns) + '\n')
+            summary = aggregates.summary(table, group_corpora=True)
+            for (corpus,), group in summary.items():
+                # 15 significant digits, as R's write.table
+                means = ['{:.15g}'.format(group[col].mean)
+                         if group[col].available else 'NA'
+                         for col in columns]
+                fout.write(u'"{}" {}\n'.format(corpus, ' '.join(means)))
+
+    path = os.path.join(results_dir, SUMMARIES)
+    make_parent(path)
+    with open(path, 'w') as fout:
+        fout.write(u'table,corpus,subset,role,column,count,missing,mean,var\n')
+        for table, columns in [('files', FILE_COLUMNS),
+                               ('speakers', SPEAKER_COLUMNS)]:
+            summary = aggregates.summary(table, by=('corpus', 'subset', 'role'))
+            for (corpus, subset, role), group in summary.items():
+                for col in columns:
+                    stats = group[col]
+                    fout.write(u'{},{},{},{},{},{},{},{},{}\n'.format(
+                        table, corpus, subset, role, col, stats.count,
+                        stats.missing,
+                        stats.mean if stats.available else 'NA',
+                        stats.variance if stats.available and stats.count > 1
+                        else 'NA'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('states', type=str, nargs='*',
+                        help='(Optional) states to merge in the results state,'
+                             ' for example the states written by other '
+                             'workers.')
+    parser.add_argument('--results', type=str, default=RESULTS_DIR,
+                        help='(Optional) path to the results folder')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='(Optional) initialise the state by reading all '
+                             'the csv\'s of the results folder once.')
+    args = parser.parse_args()
+
+    state = os.path.join(args.results, STATE)
+    if args.rebuild:
+        aggregates = aggregates_from_results(args.results)
+    else:
+        aggregates = load_aggregates(state, args.results)
+
+    # the subsets found in the given states replace the ones already known
+    incoming = Aggregates()
+    for path in args.states:
+        incoming.merge(load_aggregates(path))
+    replace_subsets(aggregates, incoming)
+
+    save_aggregates(aggregates, state)
+    write_averages(aggregates, args.results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+#
+""" In-process access to the statistics of speaker_info_per_file.py and to
+    the per speaker scores of metrics_by_speaker.py, for callers that have
+    the annotations and the audio in memory (e.g. to evaluate a checkpoint
+    inside a training loop): nothing is read from, or written to, the disk.
+
+    The annotations are either pyannote Annotations, or lists of
+    (onset, offset, label). The audio is either an array of samples (with
+    its sample rate), or an object with the interface of
+    energy.SignalEnergy (e.g. an energy_index.EnergyIndex).
+
+    Example of use:
+
+        from api import compute_file_stats, score_by_speaker, role_scores
+
+        stats = compute_file_stats(reference, samples, rate=16000)
+        scores = score_by_speaker(reference, system, collars=[0., 0.25])
+        for row in role_scores(scores):
+            print(row.config, row.role, row.miss_speech)
+"""
+
+import numpy as np
+
+from collections import namedtuple, OrderedDict
+
+from spk_map import spk_map
+from energy import SignalEnergy
+from intervals import intersection, total_duration
+from roles import FIELDS as SCORE_FIELDS
+from scoring import make_configs, score_speakers
+from speaker_info_per_file import count_labels, measure_overlap, \
+                                  get_silence_times, estimate_snr
+
+FileStats = namedtuple('FileStats', [
+    'duration', 'nb_diff_speakers', 'nb_children', 'nb_fem_ad', 'nb_mal_ad',
+    'nb_uncertain', 'prop_ovl_speech', 'prop_nonovl_speech', 'avg_voc_dur',
+    'snr', 'speakers'])
+SpeakerStats = namedtuple('SpeakerStats', [
+    'speaker', 'role', 'tot_ovl_speech', 'tot_nonovl_speech', 'tot_speech',
+    'snr'])
+SpeakerScore = namedtuple('SpeakerScore',
+                          ['config', 'speaker', 'role'] + SCORE_FIELDS)
+RoleScore = namedtuple('RoleScore', ['config', 'role', 'n'] + SCORE_FIELDS)
+
+# name of the file in the dicts expected by speaker_info_per_file
+URI = 'in_memory'
+
+
+def as_segments(annotation):
+    """ list of (onset, offset, label) of an annotation (pyannote Annotation,
+        or already a list of segments), sorted by onsets and offsets"""
+    if hasattr(annotation, 'itertracks'):
+        annotation = [(segment.start, segment.end, label)
+                      for segment, _, label
+                      in annotation.itertracks(yield_label=True)]
+    return sorted((float(on), float(off), label)
+                  for on, off, label in annotation)
+
+
+def as_energy(audio, rate=None):
+    """ object computing the rms of segments of the audio"""
+    if hasattr(audio, 'rms_each'):
+        return audio
+    assert rate is not None, 'the sample rate of the audio is needed'
+    return SignalEnergy(rate, np.asarray(audio))
+
+
+def _float(value):
+    """ the SNRs are 'NA' when they can't be computed"""
+    return np.nan if value == 'NA' else float(value)
+
+
+def speaker_overlap(segments):
+    """ overlapping and non overlapping speech of each speaker: the
+        overlap of a speaker is the time during which they speak at the same
+        time as another label, the rest of their speech (counted once if
+        their own segments overlap) is non overlapping
+        OUTPUT
+        ------
+            dur_ovl, dur_nonovl: dicts {label: seconds}
+    """
+    dur_ovl, dur_nonovl = {}, {}
+    for spk in set(label for _, _, label in segments):
+        own = [(on, off) for on, off, label in segments if label == spk]
+        others = [(on, off) for on, off, label in segments if label != spk]
+        own_on, own_off = zip(*own)
+        speech = total_duration(own_on, own_off)
+        overlap = 0.
+        if others:
+            overlap = total_duration(*intersection(own_on, own_off,
+                                                   *zip(*others)))
+        dur_ovl[spk] = overlap
+        dur_nonovl[spk] = speech - overlap
+    return dur_ovl, dur_nonovl
+
+
+def compute_file_stats(annotation, audio, rate=None):
+    """ statistics of a file, as in the rows of speaker_info_per_file.py
+        INPUT
+        -----
+            annotation: reference of the file (pyannote Annotation, or list
+                        of (onset, offset, label)), the labels that are
+                        not in spk_map get the role NA
+            audio: array of samples (samples or samples x channels), or
+                   object with the interface of energy.SignalEnergy
+            rate: sample rate of the samples
+        OUTPUT
+        ------
+            stats: FileStats, the SNRs being NaN when they can't be computed,
+                   and speakers a list of SpeakerStats, whose overlap is
+                   computed by speaker_overlap
+    """
+    segments = as_segments(annotation)
+    assert segments, 'no speech in the annotation'
+    energy = as_energy(audio, rate)
+
+    annot = {URI: segments}
+    info = {URI: [energy.duration]}
+    info_perSpk = {URI: []}
+    info = count_labels(annot, info)
+    info, info_perSpk = measure_overlap(annot, info, info_perSpk)
+    sils = get_silence_times(annot, info)
+    info, info_perSpk = estimate_snr(annot, None, None, sils, info,
+                                     info_perSpk, sources={URI: energy})
+
+    values = info[URI]
+    _, _, dur_speech, snr = info_perSpk[URI]
+    dur_ovl, dur_nonovl = speaker_overlap(segments)
+    speakers = [SpeakerStats(spk, spk_map.get(spk, 'NA'), dur_ovl[spk],
+                             dur_nonovl[spk], dur_speech[spk],
+                             _float(snr[spk]))
+                for spk in dur_speech]
+    return FileStats(*(values[:-1] + [_float(values[-1]), speakers]))
+
+
+def score_by_speaker(reference, system, collars=(0.,), overlap='include',
+                     vad=False, mapping=None):
+    """ per speaker scores of a system, as in the tables of
+        metrics_by_speaker.py, for each scoring configuration (see
+        scoring.make_configs), computed in one sweep over the file
+        INPUT
+        -----
+            reference, system: pyannote Annotations, or lists of
+                               (onset, offset, label)
+            collars: collars in seconds
+            overlap: 'include', 'exclude' or 'both'
+            vad: if True, the system is scored as a speech activity
+                 detection, and the speaker errors are NaN
+            mapping: dict {system label: reference label}, by default the
+                     optimal mapping of each configuration
+        OUTPUT
+        ------
+            scores: list of SpeakerScore, by configuration then by speaker
+    """
+    configs = make_configs(collars, overlap)
+    r_segments = list(zip(*as_segments(reference))) or ([], [], [])
+    s_segments = list(zip(*as_segments(system))) or ([], [], [])
+    results = score_speakers(r_segments, s_segments, configs, mapping, vad)
+
+    scores = []
+    for name, _, _ in configs:
+        correct, FA_spk, FA_spch, miss_spk, miss_spch = results[name]
+        for spk in correct:
+            values = [correct[spk], miss_spk[spk], miss_spch[spk],
+                      FA_spk[spk], FA_spch[spk]]
+            if vad:
+                values[1] = values[3] = np.nan
+            scores.append(SpeakerScore(name, spk, spk_map.get(spk, 'NA'),
+                                       *values))
+    return scores
+
+
+def role_scores(scores):
+    """ sum the scores of the speakers by configuration and role (as the
+        rows of the roles in roles.py)
+        INPUT
+        -----
+            scores: list of SpeakerScore, e.g. of several files
+        OUTPUT
+        ------
+            rows: list of RoleScore, in order of first appearance
+    """
+    sums = OrderedDict()
+    for score in scores:
+        key = (score.config, score.role)
+        n, values = sums.get(key, (0, np.zeros(len(SCORE_FIELDS))))
+        sums[key] = (n + 1, values + [getattr(score, field)
+                                      for field in SCORE_FIELDS])
+    return [RoleScore(config, role, n, *values.tolist())
+            for (config, role), (n, values) in sums.items()]
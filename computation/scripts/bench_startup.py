@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+""" Measure the cold start time of the scripts: each script is imported in
+    a new python process (as a job of a large run would), several times,
+    and the median wall time is reported, along with the time of a python
+    process that only imports numpy.
+
+    With --details, the slowest imports of each script are listed (from
+    `python -X importtime`).
+
+    Example of use:
+
+        `python bench_startup.py --repeat 10`
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+import numpy as np
+
+SCRIPTS = ['speaker_info_per_file', 'speaker_info_per_chunk',
+           'metrics_by_speaker', 'overlap_depth', 'bootstrap',
+           'energy_index', 'results_store']
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_import(module, extra=()):
+    """ import module in a new python process, return (seconds, stderr)"""
+    start = time.time()
+    proc = subprocess.run([sys.executable] + list(extra) +
+                          ['-c', 'import {}'.format(module)],
+                          cwd=HERE, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.time() - start
+    if proc.returncode != 0:
+        return None, proc.stderr
+    return elapsed, proc.stderr
+
+
+def startup_time(module, repeat=5):
+    """ median cold start time of module, None if it can't be imported
+        (e.g. a missing optional dependency)"""
+    times = []
+    for _ in range(repeat):
+        elapsed, _ = run_import(module)
+        if elapsed is None:
+            return None
+        times.append(elapsed)
+    return float(np.median(times))
+
+
+def slowest_imports(module, n=5):
+    """ the n direct imports of module with the largest cumulated time (in
+        seconds)"""
+    _, stderr = run_import(module, ['-X', 'importtime'])
+    imports = []
+    # the imports are printed after their own imports, and indented by two
+    # spaces per level: the direct imports of module are the lines at depth
+    # 1 just before module (at depth 0)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        if depth == 0:
+            if name == module:
+                break
+            imports = []
+        elif depth == 1:
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scripts', type=str, nargs='*', default=SCRIPTS,
+                        help='(Optional) modules to import, by default the '
+                             'scripts of this folder')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='(Optional) number of imports of each script')
+    parser.add_argument('--details', action='store_true',
+                        help='(Optional) list the slowest imports of each script')
+    args = parser.parse_args()
+
+    baseline = startup_time('numpy', args.repeat)
+    print('{:<25} {:>8}'.format('script', 'seconds'))
+    print('{:<25} {:>8.3f}'.format('(python + numpy)', baseline))
+    for script in args.scripts:
+        seconds = startup_time(script, args.repeat)
+        if seconds is None:
+            print('{:<25} {:>8}'.format(script, 'failed'))
+            continue
+        print('{:<25} {:>8.3f}'.format(script, seconds))
+        if args.details:
+            for cumulative, name in slowest_imports(script):
+                print('    {:<21} {:>8.3f}'.format(name, cumulative))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+#
+""" Bootstrap confidence intervals of the error rates of one or several
+    systems, and of the difference between two systems evaluated on the
+    same files.
+
+    The inputs are either pyannote-metrics reports (see system_eval.py), or
+    the tables written by `metrics_by_speaker.py --roles` (see roles.py),
+    for which the rates are given per role. The files are resampled with
+    replacement: a block of resamples is drawn at once as a matrix of counts
+    (resamples x files), and the durations of each resample are the product
+    of this matrix with the durations of the files (the rates are ratios of
+    summed durations, never averages of per file ratios). When systems are
+    compared, the same resamples are used for both (paired bootstrap), on
+    the files they have in common.
+
+    The rates are in %, as in the pyannote reports:
+
+        report: diarization_error_rate, false_alarm, missed_detection and
+                confusion (detection_error_rate, false_alarm and miss for a
+                detection report), over the total duration of the reference
+        roles:  miss_speech, miss_speaker, FA_speech and FA_speaker, over
+                the duration of the reference speakers of the role
+                (correct + miss_speaker + miss_speech). The tables scored
+                as a speech activity detection (metrics_by_speaker.py
+                without --vad), where the speaker errors are nan, only give
+                miss_speech and FA_speech, over correct + miss_speech
+
+    Example of use:
+
+        `python bootstrap.py ../../system_eval/BabyTrain_RNN.txt ../../system_eval/BabyTrain_ConvRNN.txt --compare`
+"""
+
+import os
+import argparse
+import numpy as np
+
+from collections import OrderedDict
+
+from system_eval import load_report
+from roles import FIELDS as ROLE_FIELDS
+
+REFERENCE = ['correct', 'miss_speaker', 'miss_speech']
+# reference of the speech activity detection tables, without speaker errors
+VAD_REFERENCE = ['correct', 'miss_speech']
+
+# metric: (numerator fields, denominator fields)
+REPORT_METRICS = OrderedDict([
+    ('diarization_error_rate', (['false_alarm', 'missed_detection',
+                                 'confusion'], ['total'])),
+    ('false_alarm', (['false_alarm'], ['total'])),
+    ('missed_detection', (['missed_detection'], ['total'])),
+    ('confusion', (['confusion'], ['total']))])
+DETECTION_METRICS = OrderedDict([
+    ('detection_error_rate', (['false_alarm', 'miss'], ['total'])),
+    ('false_alarm', (['false_alarm'], ['total'])),
+    ('miss', (['miss'], ['total']))])
+ROLE_METRICS = OrderedDict([
+    ('miss_speech', (['miss_speech'], REFERENCE)),
+    ('miss_speaker', (['miss_speaker'], REFERENCE)),
+    ('FA_speech', (['FA_speech'], REFERENCE)),
+    ('FA_speaker', (['FA_speaker'], REFERENCE))])
+VAD_METRICS = OrderedDict([
+    ('miss_speech', (['miss_speech'], VAD_REFERENCE)),
+    ('FA_speech', (['FA_speech'], VAD_REFERENCE))])
+
+
+class FileStats(object):
+    """ durations of each file of a system, per group (role, or ALL)
+        ATTRIBUTES
+        ----------
+            name: name of the system
+            uri: list of files
+            groups: list of groups
+            fields: list of duration fields
+            values: array (files x groups x fields) of durations
+            metrics: OrderedDict {metric: (numerator, denominator)}
+    """
+
+    def __init__(self, name, uri, groups, fields, values, metrics):
+        self.name = name
+        self.uri = list(uri)
+        self.groups = list(groups)
+        self.fields = list(fields)
+        self.values = values
+        self.metrics = metrics
+
+    def select(self, uris):
+        """ durations of the given files (array files x groups x fields)"""
+        index = {u: i for i, u in enumerate(self.uri)}
+        return self.values[[index[u] for u in uris]]
+
+
+def report_stats(path):
+    """ durations of the files of a pyannote-metrics report"""
+    report = load_report(path)
+    metrics = REPORT_METRICS
+    if report.task == 'Detection':
+        metrics = DETECTION_METRICS
+    fields = list(OrderedDict.fromkeys(
+        field for num, den in metrics.values() for field in den + num))
+    values = np.stack([report[field] for field in fields], axis=1)
+    return FileStats(report.name, report.uri, ['ALL'], fields,
+                     values[:, None, :], metrics)
+
+
+def role_stats(path, config=None):
+    """ durations of the files of a table of metrics_by_speaker.py --roles,
+        per role, for the given configuration (by default, the first one)"""
+    rows = []
+    with open(path, 'r') as fin:
+        header = fin.readline().rstrip('\n').split('|')
+        for line in fin:
+            row = dict(zip(header, line.rstrip('\n').split('|')))
+            if row['Level'] != 'role':
+                continue
+            if config is None:
+                config = row['Config']
+            if row['Config'] == config:
+                rows.append(row)
+
+    uri = list(OrderedDict.fromkeys(row['File'] for row in rows))
+    groups = list(OrderedDict.fromkeys(row['Role'] for row in rows))
+    file_idx = {u: i for i, u in enumerate(uri)}
+    group_idx = {g: i for i, g in enumerate(groups)}
+    values = np.zeros((len(uri), len(groups), len(ROLE_FIELDS)))
+    for row in rows:
+        values[file_idx[row['File']], group_idx[row['Role']]] = [
+            float(row[field]) for field in ROLE_FIELDS]
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    # scored as a speech activity detection: no speaker errors
+    metrics = ROLE_METRICS
+    if len(uri) and np.isnan(
+            values[..., ROLE_FIELDS.index('miss_speaker')]).all():
+        metrics = VAD_METRICS
+    return FileStats(name, uri, groups, ROLE_FIELDS, values, metrics)
+
+
+def load_stats(path, config=None):
+    """ read a report or a roles table, depending on its first line"""
+    with open(path, 'r') as fin:
+        first = fin.readline()
+    if first.startswith('Level|'):
+        return role_stats(path, config)
+    return report_stats(path)
+
+
+def rates(sums, fields, metrics):
+    """ rates (%) of summed durations
+        INPUT
+        -----
+            sums: array (... x fields) of durations
+        OUTPUT
+        ------
+            rates: array (... x metrics)
+    """
+    index = {field: i for i, field in enumerate(fields)}
+    out = []
+    for num, den in metrics.values():
+        numerator = sums[..., [index[f] for f in num]].sum(axis=-1)
+        denominator = sums[..., [index[f] for f in den]].sum(axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out.append(np.where(denominator > 0,
+                                100. * numerator / denominator, np.nan))
+    return np.stack(out, axis=-1)
+
+
+def resample_rates(values, fields, metrics, n_boot=10000, seed=0, block=1000):
+    """ rates of n_boot resamples of the files, for each system
+        INPUT
+        -----
+            values: list of arrays (files x groups x fields), one per
+                    system, on the same files
+            n_boot: number of resamples
+            seed: seed of the random generator
+            block: number of resamples drawn at once
+        OUTPUT
+        ------
+            boot: list of arrays (n_boot x groups x metrics), one per system
+    """
+    rng = np.random.RandomState(seed)
+    n_files = values[0].shape[0]
+    flat = [v.reshape(n_files, -1) for v in values]
+    boot = [[] for _ in values]
+    for start in range(0, n_boot, block):
+        size = min(block, n_boot - start)
+        # number of times each file is drawn, in each resample
+        counts = rng.multinomial(n_files, np.full(n_files, 1. / n_files),
+                                 size=size).astype(np.float64)
+        for b, v, full in zip(boot, flat, values):
+            sums = np.dot(counts, v).reshape((size,) + full.shape[1:])
+            b.append(rates(sums, fields, metrics))
+    return [np.concatenate(b, axis=0) for b in boot]
+
+
+def interval(boot, alpha):
+    """ percentile interval of the resamples (axis 0)"""
+    return (np.nanpercentile(boot, 100 * alpha / 2., axis=0),
+            np.nanpercentile(boot, 100 * (1 - alpha / 2.), axis=0))
+
+
+def bootstrap(stats, n_boot=10000, seed=0, alpha=0.05, compare=False):
+    """ confidence intervals of the rates of each system, and of the
+        differences between the first system and each other system
+        (paired, on the files they have in common) if compare
+        OUTPUT
+        ------
+            rows: list of dicts with the keys system, group, metric, value,
+                  low, high (and p_value for the differences, the two sided
+                  bootstrap p-value of a difference of 0)
+    """
+    first = stats[0]
+    rows = []
+    pairs = [(s,) for s in stats]
+    if compare:
+        for other in stats[1:]:
+            assert (other.fields, other.metrics) == \
+                (first.fields, first.metrics), \
+                'cannot compare {} and {}: different inputs'.format(
+                    first.name, other.name)
+        pairs += [(first, other) for other in stats[1:]]
+
+    for systems in pairs:
+        # files in common, with the groups of the first system
+        uris = [u for u in systems[0].uri
+                if all(u in s.uri for s in systems[1:])]
+        groups = systems[0].groups
+        values = []
+        for s in systems:
+            v = np.zeros((len(uris), len(groups), len(s.fields)))
+            sel = s.select(uris)
+            for g, group in enumerate(groups):
+                if group in s.groups:
+                    v[:, g] = sel[:, s.groups.index(group)]
+            values.append(v)
+
+        fields, metrics = systems[0].fields, systems[0].metrics
+        boot = resample_rates(values, fields, metrics, n_boot, seed)
+        point = [rates(v.sum(axis=0), fields, metrics) for v in values]
+        if len(systems) == 1:
+            name, value, boot = systems[0].name, point[0], boot[0]
+        else:
+            name = '{} - {}'.format(systems[0].name, systems[1].name)
+            value, boot = point[0] - point[1], boot[0] - boot[1]
+        low, high = interval(boot, alpha)
+
+        for g, group in enumerate(groups):
+            for m, metric in enumerate(metrics):
+                row = OrderedDict([('system', name), ('group', group),
+                                   ('metric', metric),
+                                   ('n_files', len(uris)),
+                                   ('value', value[g, m]),
+                                   ('low', low[g, m]), ('high', high[g, m])])
+                if len(systems) > 1:
+                    diffs = boot[:, g, m]
+                    diffs = diffs[~np.isnan(diffs)]
+                    p_value = np.nan
+                    if len(diffs):
+                        p_value = min(1., 2 * min(np.mean(diffs <= 0),
+                                                  np.mean(diffs >= 0)))
+                    row['p_value'] = p_value
+                rows.append(row)
+    return rows
+
+
+def write_rows(rows, output):
+    columns = ['system', 'group', 'metric', 'n_files', 'value', 'low', 'high',
+               'p_value']
+    with open(output, 'w') as fout:
+        fout.write(u','.join(columns) + '\n')
+        for row in rows:
+            fout.write(u','.join(
+                'NA' if isinstance(row.get(col), float) and np.isnan(row[col])
+                else str(row.get(col, 'NA')) for col in columns) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', type=str, nargs='+',
+                        help='pyannote-metrics reports, or tables of '
+                             'metrics_by_speaker.py --roles')
+    parser.add_argument('-o', '--output', type=str, default='bootstrap.csv',
+                        help='(Optional) path to the output csv')
+    parser.add_argument('-n', '--n_boot', type=int, default=10000,
+                        help='(Optional) number of resamples (default 10000)')
+    parser.add_argument('--alpha', type=float, default=0.05,
+                        help='(Optional) 1 - level of the intervals (default '
+                             '0.05, for 95%% intervals)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='(Optional) seed of the resampling')
+    parser.add_argument('--compare', action='store_true',
+                        help='(Optional) also compare the first system to each '
+                             'of the others (paired, on the files in common)')
+    parser.add_argument('--config', type=str, default=None,
+                        help='(Optional) configuration of the --roles tables '
+                             '(e.g. collar0ms), by default the first one')
+    args = parser.parse_args()
+
+    stats = [load_stats(path, args.config) for path in args.inputs]
+    rows = bootstrap(stats, args.n_boot, args.seed, args.alpha, args.compare)
+    write_rows(rows, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+""" Access to the files of a corpus, shared by the scripts: paths of the
+    wavs, energy of the wavs (from their samples or from their energy
+    index) and segments of the rttm's and uem's.
+
+    This module only imports light modules, the audio backends (scipy's
+    wav reader, sox) being imported when a wav is read, so that the
+    scripts that only need the annotations start fast.
+
+        $corpus/
+                [train|dev|test]/
+                    *.rttm, *.uem
+                    wav/
+                        *.wav
+"""
+
+import os
+
+from collections import defaultdict
+
+from energy import SignalEnergy
+from energy_index import load_index
+from rttm_index import read_lines, UEM_FIELD
+
+
+def get_wav_path(corpus_path, subset, wav):
+    return os.path.join(corpus_path, subset, "wav", "{}.wav".format(wav))
+
+
+def get_energy(corpus_path, subset, wav, energy_dir=None, sources=None):
+    """ return the object used to compute the energy of segments of a wav:
+        its energy index if energy_dir is given, otherwise its (memory mapped)
+        samples. Both have the same rms(onsets, offsets) and
+        rms_each(onsets, offsets) methods.
+        If the wav is in sources (a dict {wav: energy}, e.g. already read
+        by a Prefetcher), it's taken from there.
+    """
+    if sources is not None and sources.get(wav) is not None:
+        return sources[wav]
+    wav_path = get_wav_path(corpus_path, subset, wav)
+    if energy_dir is not None:
+        return load_index(wav_path, energy_dir)
+    return SignalEnergy.from_wav(wav_path)
+
+
+def load_energy(corpus_path, subset, wav, energy_dir=None):
+    """ same as get_energy, but read in memory, to be called by a
+        Prefetcher"""
+    wav_path = get_wav_path(corpus_path, subset, wav)
+    if energy_dir is not None:
+        return load_index(wav_path, energy_dir, mmap=False).preload()
+    return SignalEnergy.load(wav_path)
+
+
+def get_segments(rttm, uris=None):
+    """ rttm format used by jsalt is tab separated, the columns are the following:
+            SPEAKER file_name 1 onset duration <NA> <NA> label <NA>
+        
+        INPUT
+        -----
+            rttm: the path to the all_${SET}.rttm that contains all the annotations
+                  of the set
+            uris: (optional) only read the annotations of these files (using
+                  the index of the rttm, see rttm_index.py)
+        OUTPUT
+        ------
+            annot: a dict {file : [(onset, offset, label), ...]} of the
+                   segments of positive duration
+    """
+    assert os.path.isfile(rttm), '{} does not exist! exiting...'.format(rttm)
+    return parse_lines(read_lines(rttm, uris))
+
+
+def parse_lines(lines):
+    """ same as get_segments, for the lines of a rttm already read (e.g. sent
+        to service.py)"""
+    annot = defaultdict(list)
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            _, wav, _, onset, dur, _, _, label, _ = line.split()
+        except:
+            # some annotations are different 
+            # TODO Look into, they should all be the same (not latest version ?)
+            _, wav, _, onset, dur, _, _, label, _ , _= line.split()
+
+        if float(dur) > 0:
+            annot[wav].append((float(onset), float(onset) + float(dur), label))
+
+    return annot
+
+
+def read_uem(uem, uris=None):
+    '''for each wav get beginning and end with uem file (only for the
+       given uris, if not None)'''
+    uem_dict = {line.split()[0]: (float(line.split()[2]), float(line.split()[3]))
+                for line in read_lines(uem, uris, UEM_FIELD)}
+    return uem_dict
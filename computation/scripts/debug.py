@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+#
+""" Debugger hook of the scripts, installed with their --debug flag: an
+    uncaught exception starts a post mortem debugger (ipdb if it's
+    installed, pdb otherwise) instead of exiting. The debugger is only
+    imported when an exception happens.
+"""
+
+import sys
+import traceback
+
+
+def post_mortem(exc_type, exc_value, exc_tb):
+    traceback.print_exception(exc_type, exc_value, exc_tb)
+    try:
+        import ipdb as debugger
+    except ImportError:
+        import pdb as debugger
+    debugger.post_mortem(exc_tb)
+
+
+def install_debugger():
+    """ start a post mortem debugger on uncaught exceptions"""
+    sys.excepthook = post_mortem
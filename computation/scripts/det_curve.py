@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+#
+""" Miss and false alarm of a speech activity detector at all the
+    thresholds of its frame level scores, from one sorted pass, instead of
+    scoring one rttm per threshold with `metrics_by_speaker.py --vad`.
+
+    The scores of each file are read from {scores}/{uri}.npy (one score per
+    frame, frame i covering [i * frame_dur, (i + 1) * frame_dur)), and a
+    frame is speech at threshold t if its score is >= t. For each frame, the
+    duration of reference speech and of non speech it covers are computed
+    exactly (intervals.frame_coverage), and summed by unique score: the miss
+    at threshold t is the speech of the frames scored below t, the false
+    alarm the non speech of the frames scored from t, which are cumulative
+    sums over the sorted scores. The files are merged by unique score too,
+    so the curve of the corpus has a point at each score of its frames.
+
+    The curve is given for the whole corpus (ALL) and for each role (from
+    spk_map): the miss of a role is the speech of its speakers that is
+    missed, the false alarms are the ones of the whole corpus (they don't
+    belong to a role). The speech of the reference outside of the frames of
+    the scores is always missed. The output is a csv with the following
+    columns:
+
+        group, threshold, miss, false_alarm, speech, non_speech, miss_rate,
+        false_alarm_rate
+
+    where the rates are in % of speech and non speech, and the last point
+    of each group (threshold inf) is the detector that never says speech.
+    The equal error rate of each group is printed.
+
+    Example of use:
+
+        `python det_curve.py /home/${USER}/BabyTrain/test/all_test.rttm /home/${USER}/vad_scores/ --uem /home/${USER}/BabyTrain/test/all_test.uem -o det_test.csv`
+"""
+
+import os
+import argparse
+import numpy as np
+
+from collections import OrderedDict
+
+from spk_map import spk_map
+from intervals import frame_coverage, total_duration
+from corpus import get_segments, read_uem
+
+COLUMNS = ['group', 'threshold', 'miss', 'false_alarm', 'speech',
+           'non_speech', 'miss_rate', 'false_alarm_rate']
+
+
+def load_scores(scores_dir, uri):
+    """ frame scores of a file, None if they are missing"""
+    path = os.path.join(scores_dir, '{}.npy'.format(uri))
+    if not os.path.isfile(path):
+        return None
+    return np.load(path).astype(np.float64).ravel()
+
+
+def clip(segments, start, end):
+    """ onsets and offsets of the segments inside [start, end]"""
+    onsets = np.clip([on for on, off, lab in segments], start, end)
+    offsets = np.clip([off for on, off, lab in segments], start, end)
+    keep = offsets > onsets
+    return onsets[keep], offsets[keep]
+
+
+def file_weights(segments, scores, frame_dur, uem=None):
+    """ speech and non speech of the frames of a file, summed by unique score
+        INPUT
+        -----
+            segments: list of (onset, offset, label) of the reference
+            scores: array of frame scores
+            uem: (start, end) of the scored part of the file, by default
+                 from 0 to the end of the frames or of the reference
+        OUTPUT
+        ------
+            thresholds: sorted unique scores
+            non_speech: array (thresholds) of non speech durations
+            speech: OrderedDict {group: array (thresholds) of speech
+                    durations}, ALL and the roles
+            unscored: dict {group: speech outside of the frames}
+    """
+    n_frames = len(scores)
+    if uem is not None:
+        start, end = uem
+    else:
+        start = 0.
+        end = max([n_frames * frame_dur] + [off for on, off, lab in segments])
+    thresholds, inverse = np.unique(scores, return_inverse=True)
+
+    def by_score(weights):
+        return np.bincount(inverse.ravel(), weights=weights,
+                           minlength=len(thresholds))
+
+    groups = OrderedDict([('ALL', segments)])
+    for on, off, label in segments:
+        groups.setdefault(spk_map.get(label, 'NA'), []).append(
+            (on, off, label))
+
+    speech = OrderedDict()
+    unscored = dict()
+    for group, group_segments in groups.items():
+        onsets, offsets = clip(group_segments, start, end)
+        covered = frame_coverage(onsets, offsets, n_frames, frame_dur)
+        if group == 'ALL':
+            all_covered = covered
+        speech[group] = by_score(covered)
+        unscored[group] = max(0., total_duration(onsets, offsets) -
+                              covered.sum())
+    scored = frame_coverage([start], [end], n_frames, frame_dur)
+    non_speech = by_score(np.maximum(scored - all_covered, 0.))
+    return thresholds, non_speech, speech, unscored
+
+
+def merge_files(weights):
+    """ merge the weights of several files (see file_weights) by unique
+        score, with zeros for the roles a file doesn't have"""
+    groups = list(OrderedDict.fromkeys(
+        group for _, _, speech, _ in weights for group in speech))
+    thresholds, inverse = np.unique(
+        np.concatenate([t for t, _, _, _ in weights]), return_inverse=True)
+    inverse = inverse.ravel()
+
+    def merged(arrays):
+        return np.bincount(inverse, weights=np.concatenate(arrays),
+                           minlength=len(thresholds))
+
+    non_speech = merged([n for _, n, _, _ in weights])
+    speech = OrderedDict(
+        (group, merged([s.get(group, np.zeros(len(t)))
+                        for t, _, s, _ in weights]))
+        for group in groups)
+    unscored = {group: sum(u.get(group, 0.) for _, _, _, u in weights)
+                for group in groups}
+    return thresholds, non_speech, speech, unscored
+
+
+def curve(thresholds, speech, non_speech, unscored=0.):
+    """ miss and false alarm at each threshold, and at inf
+        OUTPUT
+        ------
+            thresholds, miss, false_alarm: arrays (thresholds + 1)
+    """
+    miss = unscored + np.r_[0., np.cumsum(speech)]
+    false_alarm = np.sum(non_speech) - np.r_[0., np.cumsum(non_speech)]
+    return np.r_[thresholds, np.inf], miss, np.maximum(false_alarm, 0.)
+
+
+def rates(miss, false_alarm, speech, non_speech):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (np.where(speech > 0, 100. * miss / speech, np.nan),
+                np.where(non_speech > 0, 100. * false_alarm / non_speech,
+                         np.nan))
+
+
+def equal_error_rate(thresholds, miss_rate, false_alarm_rate):
+    """ (threshold, rate) where the miss and false alarm rates are the
+        closest"""
+    k = np.nanargmin(np.abs(miss_rate - false_alarm_rate))
+    return thresholds[k], (miss_rate[k] + false_alarm_rate[k]) / 2.
+
+
+def subsample(n_points, max_points):
+    """ indices of at most max_points points, evenly spaced, with the first
+        and the last one"""
+    if not max_points or n_points <= max_points:
+        return np.arange(n_points)
+    return np.unique(np.linspace(0, n_points - 1, max_points).round()
+                     .astype(np.int64))
+
+
+def det_curve(ref_rttm, scores_dir, output, frame_dur=0.01, uem=None,
+              max_points=1000):
+    """ write the curve of the corpus and of each role"""
+    ref = get_segments(ref_rttm)
+    uem_dict = read_uem(uem) if uem is not None else dict()
+    files = list(ref) + [wav for wav in uem_dict if wav not in ref]
+
+    weights = []
+    for wav in files:
+        scores = load_scores(scores_dir, wav)
+        if scores is None:
+            print('no scores for {}, skipped'.format(wav))
+            continue
+        weights.append(file_weights(ref.get(wav, []), scores, frame_dur,
+                                    uem_dict.get(wav)))
+    assert weights, 'no scores found in {}'.format(scores_dir)
+    thresholds, non_speech, speech, unscored = merge_files(weights)
+    total_non_speech = np.sum(non_speech)
+
+    with open(output, 'w') as fout:
+        fout.write(u','.join(COLUMNS) + '\n')
+        for group in speech:
+            points, miss, false_alarm = curve(thresholds, speech[group],
+                                              non_speech, unscored[group])
+            total_speech = np.sum(speech[group]) + unscored[group]
+            miss_rate, fa_rate = rates(miss, false_alarm, total_speech,
+                                       total_non_speech)
+            for k in subsample(len(points), max_points):
+                fout.write(u'{},{},{},{},{},{},{},{}\n'.format(
+                    group, points[k], miss[k], false_alarm[k], total_speech,
+                    total_non_speech, miss_rate[k], fa_rate[k]))
+            if total_speech > 0 and total_non_speech > 0:
+                print('{}: EER {:.2f}% at threshold {}'.format(
+                    group, *equal_error_rate(points, miss_rate, fa_rate)[::-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('reference', type=str,
+                        help='path to the reference rttm')
+    parser.add_argument('scores', type=str,
+                        help='folder of the frame scores of the system, one '
+                             '{uri}.npy per file')
+    parser.add_argument('--frame_dur', type=float, default=0.01,
+                        help='(Optional) duration in seconds of the frames of '
+                             'the scores (default 0.01)')
+    parser.add_argument('--uem', type=str, default=None,
+                        help='(Optional) uem of the reference, only the annotated '
+                             'part of the files is scored')
+    parser.add_argument('--max_points', type=int, default=1000,
+                        help='(Optional) number of points of each curve written '
+                             '(evenly spaced among the thresholds, default '
+                             '1000), 0 for all the thresholds')
+    parser.add_argument('-o', '--output', type=str, default='det_curve.csv',
+                        help='(Optional) path to the output csv')
+    args = parser.parse_args()
+
+    det_curve(args.reference, args.scores, args.output, args.frame_dur,
+              args.uem, args.max_points)
+
+
+if __name__ == '__main__':
+    main()
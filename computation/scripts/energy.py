@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#
+""" Energy (sum of squares) and RMS of PCM signals.
+
+    scipy.io.wavfile returns the samples in their PCM type (int16 for our
+    corpora), in which the squares silently wrap around. The functions of
+    this module read the signal by blocks, convert each block to float64
+    (exact for 16 bit PCM) and accumulate the sums of squares in float64,
+    so that no copy of the whole signal is made, and slices of memory
+    mapped wavs are never entirely loaded.
+    int8/uint8/int16/int32 and float PCM are supported.
+"""
+
+import io
+import wave
+import numpy as np
+
+# number of samples converted to float64 at once
+BLOCK = 1 << 16
+
+
+# BUGFIX FOR AMI
+# from https://github.com/pyannote/pyannote-audio/issues/146#issuecomment-463657241
+def normalize_wav(input_file, output_file):
+    with wave.open(input_file, "rb") as r_wav, wave.open(output_file, "wb") as w_wav:
+        w_wav.setparams(r_wav.getparams())
+        w_wav.writeframes(r_wav.readframes(w_wav.getnframes()))
+
+
+def read_wav(wav_path, mmap=False):
+    """ read a wav with scipy, rewriting its header if scipy can't read it
+        INPUT
+        -----
+            wav_path: path to the wav, or file object
+            mmap: memory map the samples (only for paths)
+        OUTPUT
+        ------
+            rate, sig: sample rate and array of samples
+    """
+    # imported here, scipy.io is slow to import and only needed to read wavs
+    import scipy.io.wavfile
+    try:
+        return scipy.io.wavfile.read(wav_path, mmap=mmap)
+    except ValueError:
+        if hasattr(wav_path, 'seek'):
+            wav_path.seek(0)
+        buff = io.BytesIO()
+        normalize_wav(wav_path, buff)
+        buff.seek(0)
+        return scipy.io.wavfile.read(buff)
+
+
+def _as_float(block, dtype):
+    """ convert a block of PCM samples to float64, 8 bit PCM is unsigned"""
+    block = np.asarray(block, dtype=np.float64)
+    if dtype == np.uint8:
+        block -= 128.
+    return block
+
+
+def sum_squares(sig, beg=0, end=None, block=BLOCK):
+    """ sum of squares of sig[beg:end], accumulated by blocks in float64
+        OUTPUT
+        ------
+            energy: sum of squares
+            n: number of samples (times number of channels)
+    """
+    end = len(sig) if end is None else min(end, len(sig))
+    beg = max(0, beg)
+    energy = 0.
+    n = 0
+    for start in range(beg, end, block):
+        x = _as_float(sig[start:min(start + block, end)], sig.dtype).ravel()
+        energy += np.dot(x, x)
+        n += x.size
+    return energy, n
+
+
+def segments_sum_squares(sig, starts, ends, block=BLOCK):
+    """ sum of squares and number of samples of each sig[starts[i]:ends[i]]
+        The blocks of samples touched by the segments are read once, in
+        order, and the sum of a segment is the difference of the
+        cumulative sums of squares (at the bounds of the segments) of the
+        blocks of its bounds, plus the sums of the blocks in between. The
+        work is done by numpy on whole blocks (which releases the GIL, see
+        parallel.py), and the sums are exact for integer PCM up to 2**53.
+    """
+    sig_len = len(sig)
+    starts = np.clip(np.asarray(starts, dtype=np.int64), 0, sig_len)
+    ends = np.clip(np.asarray(ends, dtype=np.int64), starts, sig_len)
+    energy = np.zeros(len(starts), dtype=np.float64)
+    n = (ends - starts) * int(np.prod(sig.shape[1:], dtype=np.int64))
+    keep = np.flatnonzero(ends > starts)
+    if len(keep) == 0:
+        return energy, n
+
+    # block of the first and of the last sample of each segment, and
+    # position of its bounds in these blocks
+    first = starts[keep] // block
+    last = (ends[keep] - 1) // block
+    k_min = first.min()
+    n_blocks = last.max() - k_min + 1
+    positions = np.r_[starts[keep] - first * block, ends[keep] - last * block]
+    blocks = np.r_[first, last] - k_min
+    order = np.argsort(blocks, kind='mergesort')
+    bounds = np.searchsorted(blocks[order], np.arange(n_blocks + 1))
+
+    # only the blocks inside a segment are read
+    cover = np.zeros(n_blocks + 1, dtype=np.int64)
+    np.add.at(cover, first - k_min, 1)
+    np.add.at(cover, last - k_min + 1, -1)
+    touched = np.flatnonzero(np.cumsum(cover[:-1]) > 0)
+
+    # cumulative sums at the bounds, and sum of each block (the last one
+    # is a 0, for the reduceat below)
+    cumulated = np.zeros(len(positions), dtype=np.float64)
+    totals = np.zeros(n_blocks + 1, dtype=np.float64)
+    for k in touched:
+        beg = (k_min + k) * block
+        squares = np.square(_as_float(sig[beg:beg + block], sig.dtype))
+        if squares.ndim > 1:
+            squares = squares.sum(axis=1)
+        # sums of the squares between the bounds found in the block
+        idx = order[bounds[k]:bounds[k + 1]]
+        cuts = np.unique(np.r_[0, positions[idx]])
+        cuts = cuts[cuts < len(squares)]
+        sums = np.r_[0., np.cumsum(np.add.reduceat(squares, cuts))]
+        totals[k] = sums[-1]
+        cumulated[idx] = sums[np.searchsorted(np.r_[cuts, len(squares)],
+                                              positions[idx])]
+
+    at_start, at_end = cumulated[:len(keep)], cumulated[len(keep):]
+    single = first == last
+    energy[keep] = np.where(single, at_end - at_start,
+                            totals[first - k_min] - at_start + at_end)
+    # sums of the blocks strictly between the first and the last one
+    inner = np.flatnonzero(last - first > 1)
+    if len(inner):
+        pairs = np.c_[first[inner] - k_min + 1, last[inner] - k_min].ravel()
+        energy[keep[inner]] += np.add.reduceat(totals, pairs)[::2]
+    return energy, n
+
+
+def rms(x):
+    'compute RMS of signal x'
+    energy, n = sum_squares(x)
+    if n == 0:
+        return np.nan
+    return np.sqrt(energy / n)
+
+
+def frame_energy(sig, frame_len, block_frames=1 << 10):
+    """ sum of squares of the samples of each frame of frame_len samples
+        (the last frame can be shorter), summed over channels"""
+    n_samples = len(sig)
+    n_frames = -(-n_samples // frame_len)
+    energy = np.zeros(n_frames, dtype=np.float64)
+    block = block_frames * frame_len
+    for beg in range(0, n_samples, block):
+        x = _as_float(sig[beg:beg + block], sig.dtype)
+        x = x.reshape(len(x), -1)
+        pad = -len(x) % frame_len
+        if pad:
+            x = np.concatenate([x, np.zeros((pad, x.shape[1]))])
+        frames = np.square(x).reshape(-1, frame_len * x.shape[1]).sum(axis=1)
+        energy[beg // frame_len:beg // frame_len + len(frames)] = frames
+    return energy
+
+
+class SignalEnergy(object):
+    """ energy of segments of a signal, computed from the samples. Same
+        interface as energy_index.EnergyIndex, but sample exact.
+    """
+
+    def __init__(self, rate, sig):
+        self.rate = rate
+        self.sig = sig
+        self.n_samples = len(sig)
+
+    @classmethod
+    def from_wav(cls, wav_path):
+        """ memory map the wav (when possible)"""
+        rate, sig = read_wav(wav_path, mmap=True)
+        return cls(rate, sig)
+
+    @classmethod
+    def load(cls, wav_path):
+        """ read the whole wav in memory instead of memory mapping it (the
+            file is read at once, without holding the GIL, so that it can be
+            done in a background thread)"""
+        with open(wav_path, 'rb') as fin:
+            buff = io.BytesIO(fin.read())
+        rate, sig = read_wav(buff)
+        return cls(rate, sig)
+
+    @property
+    def duration(self):
+        return self.n_samples / float(self.rate)
+
+    def sample_bounds(self, onsets, offsets):
+        """ same sample indices as extract_wav_from_label"""
+        onsets = np.asarray(onsets, dtype=np.float64)
+        offsets = np.asarray(offsets, dtype=np.float64)
+        beg = np.clip((self.rate * onsets).astype(np.int64), 0, self.n_samples)
+        end = np.clip((self.rate * offsets).astype(np.int64), 0,
+                      self.n_samples)
+        return beg, np.maximum(beg, end)
+
+    def sum_squares(self, onsets, offsets):
+        """ energy and number of samples of each segment"""
+        beg, end = self.sample_bounds(onsets, offsets)
+        return segments_sum_squares(self.sig, beg, end)
+
+    def rms(self, onsets, offsets):
+        """ RMS of the concatenation of the segments (None if empty)"""
+        energy, n = self.sum_squares(onsets, offsets)
+        total = np.sum(n)
+        if total == 0:
+            return None
+        return np.sqrt(np.sum(energy) / total)
+
+    def rms_each(self, onsets, offsets):
+        """ RMS of each segment (NaN for empty segments)"""
+        energy, n = self.sum_squares(onsets, offsets)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(energy / n)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+#
+""" Index the energy of the wav files, so that the SNR's can be computed
+    without reading the audio.
+
+    For each wav, a sidecar is written in the index folder:
+
+        {uri}.energy.npy: float32 sum of squares of the samples of each
+                          10ms frame (memory mappable)
+        {uri}.energy.json: sample rate, number of samples, frame length and
+                           fingerprint (size, mtime and hash of the first and
+                           last bytes) of the wav
+
+    The sidecar is rebuilt when the fingerprint of the wav changes.
+    The RMS of a set of segments is then computed from the cumulative sum
+    of the frames that are entirely inside the segments (so that the energy
+    of the speech doesn't leak in the surrounding silences).
+
+    Example of use, to index all the wavs of a corpus:
+
+        `python energy_index.py /home/${USER}/BabyTrain /home/${USER}/BabyTrain_energy`
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+
+from energy import read_wav, frame_energy
+
+FRAME_DUR = 0.01
+VERSION = 1
+
+# number of bytes hashed at the beginning and at the end of the wav
+FINGERPRINT_BYTES = 1 << 16
+
+
+def fingerprint(wav_path):
+    """ cheap identifier of the content of a wav"""
+    stat = os.stat(wav_path)
+    sha = hashlib.sha1()
+    with open(wav_path, 'rb') as fin:
+        sha.update(fin.read(FINGERPRINT_BYTES))
+        if stat.st_size > FINGERPRINT_BYTES:
+            fin.seek(max(FINGERPRINT_BYTES, stat.st_size - FINGERPRINT_BYTES))
+            sha.update(fin.read())
+    return [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+
+
+def sidecar_paths(wav_path, index_dir):
+    uri = os.path.splitext(os.path.basename(wav_path))[0]
+    prefix = os.path.join(index_dir, '{}.energy'.format(uri))
+    return prefix + '.npy', prefix + '.json'
+
+
+def build_index(wav_path, index_dir, frame_dur=FRAME_DUR):
+    """ compute the frame energies of a wav and write its sidecar"""
+    rate, sig = read_wav(wav_path, mmap=True)
+    frame_len = max(1, int(round(rate * frame_dur)))
+    energy = frame_energy(sig, frame_len)
+
+    if not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    npy, meta = sidecar_paths(wav_path, index_dir)
+    # written in temporary files and renamed, so that concurrent runs
+    # indexing the same wav never read a partial sidecar
+    tmp = '.{}.tmp'.format(os.getpid())
+    with open(npy + tmp, 'wb') as fout:
+        np.save(fout, energy.astype(np.float32))
+    with open(meta + tmp, 'w') as fout:
+        json.dump({'version': VERSION, 'rate': int(rate),
+                   'n_samples': int(len(sig)), 'frame_len': frame_len,
+                   'fingerprint': fingerprint(wav_path)}, fout)
+    os.replace(npy + tmp, npy)
+    os.replace(meta + tmp, meta)
+    return EnergyIndex(npy, meta)
+
+
+def load_index(wav_path, index_dir, build=True, mmap=True):
+    """ return the EnergyIndex of a wav, (re)building it if it doesn't exist
+        or if the wav changed since it was built. If mmap is False, the
+        energies are read in memory."""
+    npy, meta = sidecar_paths(wav_path, index_dir)
+    try:
+        with open(meta, 'r') as fin:
+            info = json.load(fin)
+        if (info['version'] == VERSION and
+                info['fingerprint'] == fingerprint(wav_path)):
+            return EnergyIndex(npy, meta, mmap)
+    except (IOError, ValueError, KeyError):
+        pass
+    if not build:
+        return None
+    index = build_index(wav_path, index_dir)
+    return index if mmap else EnergyIndex(*sidecar_paths(wav_path, index_dir),
+                                          mmap=False)
+
+
+class EnergyIndex(object):
+    """ energy of the frames of a wav
+        ATTRIBUTES
+        ----------
+            rate: sample rate of the wav
+            n_samples: number of samples of the wav
+            frame_len: number of samples per frame
+            energy: array (memory mapped if mmap) of the sum of squares of
+                    each frame
+    """
+
+    def __init__(self, npy, meta, mmap=True):
+        with open(meta, 'r') as fin:
+            info = json.load(fin)
+        self.rate = info['rate']
+        self.n_samples = info['n_samples']
+        self.frame_len = info['frame_len']
+        self.energy = np.load(npy, mmap_mode='r' if mmap else None)
+        self._cumsum = None
+
+    @property
+    def duration(self):
+        return self.n_samples / float(self.rate)
+
+    def preload(self):
+        """ compute the cumulative energy now (e.g. in the thread of a
+            Prefetcher) instead of at the first query, return the index"""
+        if self._cumsum is None:
+            self._cumsum = np.r_[0., np.cumsum(self.energy, dtype=np.float64)]
+        return self
+
+    @property
+    def cumsum(self):
+        """ cumulative energy, cumsum[i] is the energy of the frames [0, i)"""
+        return self.preload()._cumsum
+
+    def frame_bounds(self, onsets, offsets):
+        """ convert segments in seconds to [first, last) frames, and number
+            of samples covered by these frames"""
+        onsets = np.asarray(onsets, dtype=np.float64)
+        offsets = np.asarray(offsets, dtype=np.float64)
+        # same sample indices as extract_wav_from_label
+        beg = np.clip((self.rate * onsets).astype(np.int64), 0, self.n_samples)
+        end = np.clip((self.rate * offsets).astype(np.int64), 0,
+                      self.n_samples)
+        # only keep the frames entirely inside the segments, except the
+        # last (shorter) frame of the wav
+        first = -(-beg // self.frame_len)
+        last = np.where(end == self.n_samples, len(self.energy),
+                        end // self.frame_len)
+        last = np.maximum(first, last)
+        n = np.minimum(last * self.frame_len, self.n_samples) \
+            - first * self.frame_len
+        return first, last, np.maximum(n, 0)
+
+    def sum_squares(self, onsets, offsets):
+        """ energy and number of samples of each segment"""
+        first, last, n = self.frame_bounds(onsets, offsets)
+        return self.cumsum[last] - self.cumsum[first], n
+
+    def rms(self, onsets, offsets):
+        """ RMS of the concatenation of the segments (None if empty)"""
+        energy, n = self.sum_squares(onsets, offsets)
+        total = np.sum(n)
+        if total == 0:
+            return None
+        return np.sqrt(np.sum(energy) / total)
+
+    def rms_each(self, onsets, offsets):
+        """ RMS of each segment (NaN for empty segments)"""
+        energy, n = self.sum_squares(onsets, offsets)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(energy / n)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus', type=str,
+                        help='path to the corpus')
+    parser.add_argument('index', type=str,
+                        help='path to the folder in which the sidecars are '
+                             'written')
+    parser.add_argument('--force', action='store_true',
+                        help='(Optional) rebuild the sidecars even if the wavs '
+                             'did not change')
+    args = parser.parse_args()
+
+    for subset in ['train', 'dev', 'test']:
+        wav_dir = os.path.join(args.corpus, subset, 'wav')
+        if not os.path.isdir(wav_dir):
+            continue
+        for fname in sorted(os.listdir(wav_dir)):
+            if not fname.endswith('.wav'):
+                continue
+            wav_path = os.path.join(wav_dir, fname)
+            if args.force:
+                build_index(wav_path, args.index)
+            else:
+                load_index(wav_path, args.index)
+
+
+if __name__ == '__main__':
+    main()
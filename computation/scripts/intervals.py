@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+#
+""" Vectorized operations on sets of intervals given as arrays of onsets and
+    offsets (in seconds).
+
+    The union is computed by sorting the intervals, taking the cumulative
+    maximum of the offsets and starting a new interval each time an onset
+    comes after all the previous offsets. Touching intervals are merged.
+    Everything is O(n log n) and done in numpy.
+"""
+
+import numpy as np
+
+
+def as_arrays(onsets, offsets):
+    """ convert onsets and offsets to float arrays"""
+    return (np.asarray(onsets, dtype=np.float64).ravel(),
+            np.asarray(offsets, dtype=np.float64).ravel())
+
+
+def merge(onsets, offsets):
+    """ merge overlapping (or touching) intervals, and keep track of which
+        interval went into which merged interval
+        INPUT
+        -----
+            onsets, offsets: arrays of the same length, in any order
+        OUTPUT
+        ------
+            order: permutation that sorts the input intervals
+            starts: for each merged interval, index (in the sorted intervals)
+                    of its first interval
+            onsets, offsets: arrays of sorted, disjoint merged intervals
+    """
+    onsets, offsets = as_arrays(onsets, offsets)
+    if len(onsets) == 0:
+        return (np.array([], dtype=np.int64), np.array([], dtype=np.int64),
+                onsets, offsets)
+
+    order = np.lexsort((offsets, onsets))
+    onsets, offsets = onsets[order], offsets[order]
+
+    # offset of the current merged interval at each position
+    run_max = np.maximum.accumulate(offsets)
+    starts = np.flatnonzero(np.r_[True, onsets[1:] > run_max[:-1]])
+    ends = np.r_[starts[1:] - 1, len(onsets) - 1]
+    return order, starts, onsets[starts], run_max[ends]
+
+
+def union(onsets, offsets):
+    """ merge overlapping (or touching) intervals
+        INPUT
+        -----
+            onsets, offsets: arrays of the same length, in any order
+        OUTPUT
+        ------
+            onsets, offsets: arrays of sorted, disjoint intervals
+    """
+    _, _, onsets, offsets = merge(onsets, offsets)
+    return onsets, offsets
+
+
+def gaps(onsets, offsets, start=None, end=None):
+    """ complement of the union of the intervals inside [start, end]
+        INPUT
+        -----
+            onsets, offsets: arrays of intervals, in any order
+            start, end: boundaries of the support. By default, the beginning
+                        of the first interval and the end of the last one.
+        OUTPUT
+        ------
+            onsets, offsets: arrays of sorted, disjoint gaps
+    """
+    onsets, offsets = union(onsets, offsets)
+    if len(onsets) == 0:
+        if start is None or end is None or end <= start:
+            return onsets, offsets
+        return np.array([start], dtype=np.float64), \
+            np.array([end], dtype=np.float64)
+
+    start = onsets[0] if start is None else start
+    end = offsets[-1] if end is None else end
+
+    gap_on = np.maximum(np.r_[start, offsets], start)
+    gap_off = np.minimum(np.r_[onsets, end], end)
+    keep = gap_off > gap_on
+    return gap_on[keep], gap_off[keep]
+
+
+def total_duration(onsets, offsets):
+    """ duration covered by the intervals, counting overlaps only once"""
+    onsets, offsets = union(onsets, offsets)
+    return float(np.sum(offsets - onsets))
+
+
+def covered_until(onsets, offsets, times):
+    """ duration covered by the intervals before each time, counting
+        overlaps only once: it is piecewise linear in t, and is interpolated
+        between the bounds of the intervals
+        OUTPUT
+        ------
+            durations: array (times) of covered durations
+    """
+    onsets, offsets = union(onsets, offsets)
+    times = np.asarray(times, dtype=np.float64)
+    if len(onsets) == 0:
+        return np.zeros(times.shape)
+    covered = np.cumsum(offsets - onsets)
+    return np.interp(times, np.c_[onsets, offsets].ravel(),
+                     np.c_[covered - (offsets - onsets), covered].ravel())
+
+
+def frame_coverage(onsets, offsets, n_frames, frame_dur):
+    """ duration covered by the intervals in each frame [i * frame_dur,
+        (i + 1) * frame_dur), counting overlaps only once (see
+        covered_until)
+        OUTPUT
+        ------
+            durations: array (n_frames) of covered durations
+    """
+    return np.diff(covered_until(onsets, offsets,
+                                 np.arange(n_frames + 1) * frame_dur))
+
+
+def intersection(a_onsets, a_offsets, b_onsets, b_offsets):
+    """ intervals covered by both sets of intervals
+        OUTPUT
+        ------
+            onsets, offsets: arrays of sorted, disjoint intervals
+    """
+    a_on, a_off = union(a_onsets, a_offsets)
+    b_on, b_off = union(b_onsets, b_offsets)
+    i, j, _ = overlap_pairs(a_on, a_off, b_on, b_off)
+    return union(np.maximum(a_on[i], b_on[j]), np.minimum(a_off[i], b_off[j]))
+
+
+def overlap_pairs(a_onsets, a_offsets, b_onsets, b_offsets):
+    """ all the pairs of overlapping intervals between two sets, found in
+        one sweep over the intervals of b sorted by onset: the intervals of
+        b that overlap a[i] are between the first one whose running
+        maximum offset is after a[i]'s onset and the last one starting
+        before a[i]'s offset.
+        INPUT
+        -----
+            a_onsets, a_offsets, b_onsets, b_offsets: arrays of intervals,
+                                                      in any order
+        OUTPUT
+        ------
+            i, j: indices of the overlapping pairs (a[i], b[j])
+            durations: duration of the intersection of each pair (> 0)
+    """
+    a_on, a_off = as_arrays(a_onsets, a_offsets)
+    b_on, b_off = as_arrays(b_onsets, b_offsets)
+    if len(a_on) == 0 or len(b_on) == 0:
+        return (np.array([], dtype=np.int64), np.array([], dtype=np.int64),
+                np.array([], dtype=np.float64))
+
+    order = np.argsort(b_on, kind='mergesort')
+    b_on, b_off = b_on[order], b_off[order]
+    run_max = np.maximum.accumulate(b_off)
+    lo = np.searchsorted(run_max, a_on, side='right')
+    hi = np.searchsorted(b_on, a_off, side='left')
+    counts = np.maximum(hi - lo, 0)
+
+    # candidate pairs, b[lo[i]:hi[i]] for each a[i]
+    i = np.repeat(np.arange(len(a_on)), counts)
+    j = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+         + np.repeat(lo, counts))
+    durations = np.minimum(a_off[i], b_off[j]) - np.maximum(a_on[i], b_on[j])
+    keep = durations > 0
+    return i[keep], order[j[keep]], durations[keep]
+
+
+class MergedSegments(object):
+    """ sorted, disjoint segments of a file, obtained by merging the
+        overlapping segments of an annotation, with the set of labels
+        active in each merged segment stored as a bitmask.
+
+        ATTRIBUTES
+        ----------
+            onsets, offsets: arrays of the merged segments
+            masks: array of bitmasks, bit i is set if labels[i] speaks in the
+                   merged segment (uint64, or python ints if there are more
+                   than 64 labels)
+            labels: list of the labels, in order of first appearance
+    """
+
+    def __init__(self, onsets=(), offsets=(), labels=None):
+        """ INPUT
+            -----
+                onsets, offsets: arrays of (possibly overlapping) segments
+                labels: label of each segment, or None
+        """
+        labels = [None] * len(onsets) if labels is None else list(labels)
+
+        self.labels = []
+        index = dict()
+        label_idx = []
+        for label in labels:
+            if label not in index:
+                index[label] = len(self.labels)
+                self.labels.append(label)
+            label_idx.append(index[label])
+
+        order, starts, self.onsets, self.offsets = merge(onsets, offsets)
+        if len(self.labels) <= 64:
+            bits = np.left_shift(np.uint64(1),
+                                 np.array(label_idx, dtype=np.uint64))
+        else:
+            bits = np.array([1 << i for i in label_idx], dtype=object)
+        if len(starts):
+            self.masks = np.bitwise_or.reduceat(bits[order], starts)
+        else:
+            self.masks = bits
+
+    def __len__(self):
+        return len(self.onsets)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        return (self.onsets[i], self.offsets[i], self.labels_of(self.masks[i]))
+
+    def labels_of(self, mask):
+        """ return the list of labels whose bits are set in mask"""
+        mask = int(mask)
+        return [label for i, label in enumerate(self.labels)
+                if (mask >> i) & 1]
+
+    def overlap_range(self, begin, end):
+        """ return (first, last) such that the segments [first, last)
+            are the ones overlapping [begin, end)"""
+        # segments are disjoint and sorted: offsets are sorted too
+        first = np.searchsorted(self.offsets, begin, side='right')
+        last = np.searchsorted(self.onsets, end, side='left')
+        return first, max(first, last)
+
+    def overlap(self, begin, end):
+        """ list of (onset, offset, labels) of the segments overlapping
+            [begin, end), same as IntervalTree.overlap"""
+        first, last = self.overlap_range(begin, end)
+        return [self[i] for i in range(first, last)]
+
+    def gaps(self, start=None, end=None):
+        """ return the silences between the segments as MergedSegments"""
+        onsets, offsets = gaps(self.onsets, self.offsets, start, end)
+        return MergedSegments(onsets, offsets)
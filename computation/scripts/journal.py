@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+""" Journal of the files processed by a long run, so that a run that
+    crashed (or was killed) can be restarted without computing again the
+    files that were already done.
+
+    The journal is a jsonl file, with one line appended (and flushed) each
+    time a file is done or failed:
+
+        {"task": "info", "subset": "dev", "file": "S02_U01", "result": ...}
+        {"task": "info", "subset": "dev", "file": "S03_U01", "error": "..."}
+
+    When a run is restarted, the results of the files that are done are
+    read from the journal, and the files that failed are computed again.
+    The journal is removed at the end of a run in which no file failed.
+"""
+
+import os
+import sys
+import json
+import traceback
+
+
+def journal_key(task, subset, wav):
+    return (task, subset, wav)
+
+
+def load_journal(path):
+    """ read a journal, the last entry of a file replacing the previous
+        ones. A truncated last line (killed while writing) is ignored.
+        OUTPUT
+        ------
+            entries: dict {(task, subset, file): entry}
+    """
+    entries = dict()
+    if not os.path.isfile(path):
+        return entries
+    with open(path, 'r') as fin:
+        for line in fin:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[journal_key(entry['task'], entry['subset'],
+                                entry['file'])] = entry
+    return entries
+
+
+class Journal(object):
+    """ append only journal of the files of a run
+        ATTRIBUTES
+        ----------
+            path: path to the jsonl file
+            entries: dict {(task, subset, file): last entry}
+    """
+
+    def __init__(self, path, restart=False, debug=False):
+        """ INPUT
+            -----
+                path: path to the journal
+                restart: if True, forget the existing journal
+                debug: if True, the errors are raised instead of recorded
+                       (to be caught by a debugger)
+        """
+        self.path = path
+        self.debug = debug
+        if restart and os.path.isfile(path):
+            os.remove(path)
+        self.entries = load_journal(path)
+        self.fout = None
+        n_done = sum(1 for entry in self.entries.values() if 'error' not in entry)
+        if n_done:
+            print('resuming from {}: {} files already done'.format(path, n_done))
+
+    def done(self, task, subset, wav):
+        entry = self.entries.get(journal_key(task, subset, wav))
+        return entry is not None and 'error' not in entry
+
+    def record(self, task, subset, wav, result=None, error=None):
+        """ append an entry to the journal"""
+        entry = {'task': task, 'subset': subset, 'file': wav}
+        if error is None:
+            entry['result'] = result
+        else:
+            entry['error'] = error
+        if self.fout is None:
+            self.fout = open(self.path, 'a')
+        self.fout.write(json.dumps(entry) + '\n')
+        self.fout.flush()
+        self.entries[journal_key(task, subset, wav)] = entry
+
+    def run(self, task, subset, wav, func, *args):
+        """ return func(*args), the result of task for wav, computed only if
+            it's not already in the journal. If func raises an exception, it
+            is recorded and None is returned.
+            As results are stored in json, tuples are returned as lists.
+        """
+        key = journal_key(task, subset, wav)
+        if self.done(task, subset, wav):
+            return self.entries[key]['result']
+        if self.debug:
+            result = func(*args)
+            self.record(task, subset, wav, result=result)
+            return json.loads(json.dumps(result))
+        try:
+            result = func(*args)
+        except Exception as err:
+            error = '{}: {}'.format(type(err).__name__, err)
+            sys.stderr.write('{} failed on {} ({}):\n{}'.format(
+                task, wav, subset, traceback.format_exc()))
+            self.record(task, subset, wav, error=error)
+            return None
+        self.record(task, subset, wav, result=result)
+        return json.loads(json.dumps(result))
+
+    def failures(self):
+        """ list of (task, subset, file, error) of the files that failed"""
+        return [key + (entry['error'],)
+                for key, entry in sorted(self.entries.items())
+                if 'error' in entry]
+
+    def close(self):
+        """ close the journal, and remove it if no file failed"""
+        if self.fout is not None:
+            self.fout.close()
+            self.fout = None
+        failures = self.failures()
+        for task, subset, wav, error in failures:
+            print('{} failed on {} ({}): {}'.format(task, wav, subset, error))
+        if failures:
+            print('{} files failed, rerun to compute them again (see '
+                  '{})'.format(len(failures), self.path))
+        elif os.path.isfile(self.path):
+            os.remove(self.path)
+        return failures
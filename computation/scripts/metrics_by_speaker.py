@@ -23,50 +23,99 @@
 
 import os
 import sys
-import ipdb
 import numpy
 import argparse
-import pyannote
-import pyannote.metrics
 
 from collections import defaultdict
-from pyannote.database import get_protocol
-from speaker_info_per_file import vad_no_ovl
-from pyannote.database.util import load_rttm
-from pyannote.core import Segment, Timeline, Annotation
-from pyannote.metrics.detection import DetectionErrorRate
-from pyannote.metrics.diarization import DiarizationErrorRate
+from intervals import total_duration, overlap_pairs
+from scoring import optimal_mapping, make_configs, score_speakers
+from roles import RoleTable
+from debug import install_debugger
+from service import serve
+from score_cache import ScoreCache
 
-def get_mapping(reference, system):
-    """ get speaker mapping between system and reference"""
+# pyannote is only imported when it's used (it's slow to import): in main to
+# read the protocol and the system, and in get_mapping if native is False
 
+def get_segments(annot):
+    """ return the onsets, offsets and labels of the tracks of an annotation"""
+    tracks = [(segment.start, segment.end, label)
+              for segment, _, label in annot.itertracks(yield_label=True)]
+    if not tracks:
+        return numpy.array([]), numpy.array([]), []
+    onsets, offsets, labels = zip(*tracks)
+    return numpy.array(onsets), numpy.array(offsets), list(labels)
+
+def cooccurrence(r_segments, s_segments):
+    """ return the duration during which each reference label and each
+        system label are both active, summed over all the pairs of
+        overlapping segments (as pyannote's Annotation product)
+        INPUT
+        -----
+            r_segments, s_segments: (onsets, offsets, labels) of the
+                                    reference and of the system
+        OUTPUT
+        ------
+            r_names, s_names: sorted labels of the reference and the system
+            matrix: array (len(r_names) x len(s_names)) of durations
+    """
+    r_on, r_off, r_lab = r_segments
+    s_on, s_off, s_lab = s_segments
+    r_names, r_idx = numpy.unique(numpy.array(r_lab, dtype=str),
+                                  return_inverse=True)
+    s_names, s_idx = numpy.unique(numpy.array(s_lab, dtype=str),
+                                  return_inverse=True)
+
+    i, j, dur = overlap_pairs(r_on, r_off, s_on, s_off)
+    n_sys = len(s_names)
+    matrix = numpy.bincount(r_idx[i] * n_sys + s_idx[j], weights=dur,
+                            minlength=len(r_names) * n_sys)
+    return ([str(name) for name in r_names], [str(name) for name in s_names],
+            matrix.reshape(len(r_names), n_sys))
+
+def native_mapping(r_segments, s_segments):
+    """ get speaker mapping between system and reference from their
+        co-occurrence matrix (dict {system label: reference label})"""
+    r_names, s_names, matrix = cooccurrence(r_segments, s_segments)
+    return optimal_mapping(matrix, r_names, s_names)
+
+def get_mapping(reference, system, native=True):
+    """ get speaker mapping between system and reference
+        If native is False, use pyannote's DiarizationErrorRate (slower,
+        same mapping).
+    """
+    if native:
+        return native_mapping(get_segments(reference), get_segments(system))
+
+    from pyannote.metrics.diarization import DiarizationErrorRate
     metric = DiarizationErrorRate()
     mapping = metric.optimal_mapping(reference, system)
 
     return mapping
 
+def pyannote_mappings(reference, system, configs):
+    """ mapping of pyannote's DiarizationErrorRate for each configuration
+        (computed on the part of the file it scores, as in pyannote)
+        OUTPUT
+        ------
+            mappings: dict {config name: {system label: reference label}}
+    """
+    from pyannote.metrics.diarization import DiarizationErrorRate
+    metric = DiarizationErrorRate()
+    mappings = dict()
+    for name, collar, skip_overlap in configs:
+        r_annot, s_annot = metric.uemify(reference, system, collar=collar,
+                                         skip_overlap=skip_overlap)
+        mappings[name] = metric.optimal_mapping(r_annot, s_annot)
+    return mappings
+
 def get_speech_duration(annot, uri):
     """ return the speech duration (counting overlapping segments only once)
 
     """
-    #if uri == 'namibia_uebn_20161112_19980':
-    #    ipdb.set_trace()
     timeline = annot.get_timeline()
-    dur = 0
-    prev_on = timeline[0][0]
-    prev_off = timeline[0][1]
-    for i, (on, off) in enumerate(timeline):
-        if on > prev_off: 
-            dur += prev_off - prev_on
-            prev_on = on
-            prev_off = off
-        elif on < prev_off and off > prev_off:
-            prev_off = off
-            if i == len(timeline) - 1:
-                dur += prev_off - prev_on
-        elif i == len(timeline) - 1 and off <= prev_off:
-            dur += prev_off - prev_on
-    return dur
+    return total_duration([segment.start for segment in timeline],
+                          [segment.end for segment in timeline])
 
 
 def accumulate_reference(r_labels, s_labels, mapping, dur):
@@ -125,6 +174,48 @@ def  accumulate_system(r_labels, s_labels, mapping, dur):
 
     return correct, FA_spk, FA_speech
 
+def score_file(r_annot, s_annot, configs=None, vad=False, native=True):
+    """ fill the results table of the speakers of a file, with pyannote, or
+        for each scoring configuration if configs is given (with the mapping
+        of pyannote for each configuration if native is False)
+        OUTPUT
+        ------
+            results: (correct, FA_spk, FA_speech, miss_spk, miss_speech),
+                     or dict {config name: (correct, ...)} if configs is
+                     given
+    """
+    if configs is not None:
+        r_segments, s_segments = get_segments(r_annot), get_segments(s_annot)
+        if native or vad:
+            # all the configurations, from one sweep over the boundaries
+            return score_speakers(r_segments, s_segments, configs, vad=vad)
+
+        # one sweep per configuration, with the mapping of pyannote
+        mappings = pyannote_mappings(r_annot, s_annot, configs)
+        results = dict()
+        for config in configs:
+            results.update(score_speakers(r_segments, s_segments, [config],
+                                          mappings[config[0]]))
+        return results
+
+    r_labels = {lab: r_annot.label_timeline(lab) for lab in r_annot.labels()}
+    s_labels = {lab: s_annot.label_timeline(lab) for lab in s_annot.labels()}
+
+    if not vad:
+        mapping = get_mapping(r_annot, s_annot, native=native)
+    else:
+        mapping = None
+
+    # accumulate results, reference side
+    dur = get_speech_duration(r_annot, r_annot.uri)
+    print(dur)
+    correct, miss_spk, miss_speech = accumulate_reference(r_labels, s_labels, mapping, dur)
+
+    # Both "correct" should be the same
+    _, FA_spk, FA_speech = accumulate_system(r_labels, s_labels, mapping, dur)
+
+    return (correct, FA_spk, FA_speech, miss_spk, miss_speech)
+
 def write_evaluation(results, vad):
     ''' Write the results in a table reporting the time spent in 
         each of the following cell:
@@ -157,7 +248,36 @@ def write_evaluation(results, vad):
                            ID=spk, sp_sp=correct[spk], sp_osp=miss_spk[spk],
                            sp_nosp=miss_spch[spk], osp_sp=FA_spk[spk],
                            osp_osp='NA', osp_nosp='NA'))
-                            
+
+def write_configs(results, configs, vad, output):
+    ''' Write the results of all the scoring configurations in a single
+        table, with the same cells as write_evaluation, one row per
+        configuration, file, speaker and cell.
+        INPUT
+        -----
+            results: dict {uri: {config name: (correct, FA_spk, FA_speech,
+                     miss_spk, miss_speech)}}
+            configs: list of (name, collar, skip_overlap)
+    '''
+    with open(output, 'w') as fout:
+        fout.write('Config|File|ID|Ref|System|Duration\n')
+        for name, _, _ in configs:
+            for uri in results:
+                correct, FA_spk, FA_spch, miss_spk, miss_spch = results[uri][name]
+                for spk in correct:
+                    if vad:
+                        FA_spk[spk] = numpy.nan
+                        miss_spk[spk] = numpy.nan
+                    cells = [('speaker', 'speaker', correct[spk]),
+                             ('speaker', 'other-speaker', miss_spk[spk]),
+                             ('speaker', 'no-speaker', miss_spch[spk]),
+                             ('other-speaker', 'speaker', FA_spk[spk]),
+                             ('other-speaker', 'other-speaker', 'NA'),
+                             ('other-speaker', 'no-speaker', 'NA')]
+                    for ref, sys, dur in cells:
+                        fout.write('{}|{}|{}|{}|{}|{}\n'.format(
+                            name, uri, spk, ref, sys, dur))
+
 def main():
     argparser = argparse.ArgumentParser()
     argparser.add_argument('system', type=str,
@@ -174,8 +294,75 @@ def main():
                            help='(OPTIONNAL) Enable if Evaluation a VAD system'
                                 ', this way only speech/non speech metrics '
                                 'will be reported.')
+    argparser.add_argument('--pyannote_mapping', action='store_true',
+                           help='(OPTIONNAL) Compute the speaker mapping with '
+                                'pyannote\'s DiarizationErrorRate instead of '
+                                'the co-occurrence matrix (slower, same '
+                                'mapping).')
+    argparser.add_argument('--collars', type=float, nargs='+', default=None,
+                           help='(OPTIONNAL) Score with each of these collars '
+                                '(in seconds, total duration removed around '
+                                'each reference boundary, e.g. 0 0.25 0.5), '
+                                'in a single pass, and write all the results in '
+                                'one table (see --output).')
+    argparser.add_argument('--overlap', type=str, default=None,
+                           choices=['include', 'exclude', 'both'],
+                           help='(OPTIONNAL) Score with the overlapping speech '
+                                'of the reference included, excluded, or both '
+                                '(crossed with --collars), in a single pass.')
+    argparser.add_argument('--roles', action='store_true',
+                           help='(OPTIONNAL) Write the scores of the speakers, '
+                                'and their sums by role (KCHI, CHI, FEM, MAL...) '
+                                'for each file and for the whole subset, in a '
+                                'single table (see --output and roles.py).')
+    argparser.add_argument('--output', type=str, default='perSpk.txt',
+                           help='(OPTIONNAL) Table written when --collars, '
+                                '--overlap or --roles is given. Default is '
+                                'perSpk.txt.')
+
+    argparser.add_argument('--cache', type=str, default=None,
+                           help='(OPTIONNAL) Path to a store of the scores of '
+                                'each file (see score_cache.py): the files whose '
+                                'reference, system and options did not change '
+                                'since a previous run are not scored again.')
+    argparser.add_argument('--serve', type=int, default=None,
+                           help='(OPTIONNAL) PORT, read the reference once and '
+                                'serve the scores of the systems sent over HTTP '
+                                'on localhost (see service.py), the system '
+                                'argument is then ignored (e.g. -).')
+    argparser.add_argument('--debug', action='store_true',
+                           help='(OPTIONNAL) Start a debugger (ipdb, or pdb) on '
+                                'errors.')
 
     args = argparser.parse_args()
+    if args.debug:
+        install_debugger()
+    from pyannote.database import get_protocol
+    from pyannote.database.util import load_rttm
+
+    if args.serve is not None:
+        protocol = get_protocol(args.protocol)
+        reference = {item['uri']: get_segments(item['annotation'])
+                     for item in getattr(protocol, args.subset)()}
+        # same default as the command line (args.vad is True unless --vad)
+        serve(reference, args.serve, vad=args.vad)
+        return
+
+    configs = None
+    if args.collars is not None or args.overlap is not None or args.roles:
+        configs = make_configs(args.collars or [0.], args.overlap or 'include')
+
+    # the speakers are written as soon as their file is scored
+    table = None
+    if args.roles:
+        fout = open(args.output, 'w')
+        table = RoleTable(fout)
+
+    # the scores of the files that didn't change are reused
+    cache = None
+    if args.cache is not None:
+        cache = ScoreCache(args.cache, {'configs': configs, 'vad': args.vad,
+                                        'pyannote_mapping': args.pyannote_mapping})
 
     # Create timeline for both reference & system
     system = load_rttm(args.system)
@@ -199,30 +386,33 @@ def main():
         except:
             continue
 
-        r_labels = {lab: r_annot.label_timeline(lab) for lab in r_annot.labels()}
-        s_labels = {lab: s_annot.label_timeline(lab) for lab in s_annot.labels()}
-        
-        if not args.vad:
-            mapping = get_mapping(r_annot, s_annot)
-        else:
-            mapping = None
-        
-        # accumulate results, reference side
-        dur = get_speech_duration(r_annot, uri)
         print(uri)
-        print(dur)
-        correct, miss_spk, miss_speech = accumulate_reference(r_labels, s_labels, mapping, dur)
-        
-        # Both "correct" should be the same
-        _, FA_spk, FA_speech = accumulate_system(r_labels, s_labels, mapping, dur)
+        score_args = (r_annot, s_annot, configs, args.vad,
+                      not args.pyannote_mapping)
+        if cache is not None:
+            scores = cache.run(uri, get_segments(r_annot),
+                               get_segments(s_annot), score_file, *score_args)
+        else:
+            scores = score_file(*score_args)
 
-        results[uri] = (correct, FA_spk, FA_speech, miss_spk, miss_speech)
+        if table is not None:
+            table.add(uri, scores, args.vad)
+        else:
+            results[uri] = scores
     # evaluate each wav referenced in system:
     # IF not vad:
     # for each label (FEM, MAL, CHI, KCHI), measure the time
     # in Correct/False alarm Speaker, False alarm Speech/Missed speaker/
     # Missed Speech
-    write_evaluation(results, args.vad)
+    if cache is not None:
+        cache.close()
+    if table is not None:
+        table.write_roles()
+        fout.close()
+    elif configs is not None:
+        write_configs(results, configs, args.vad, args.output)
+    else:
+        write_evaluation(results, args.vad)
 
 
 if __name__ == '__main__': 
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+""" Split the errors of a system by overlap depth: the time of each file is
+    split by the number of reference speakers speaking at the same time
+    (0, 1, 2, 3+ by default), and the speech of the reference, the correct,
+    false alarm, miss and confusion durations are given for each depth, per
+    file and per role (see scoring.depth_errors), in a single sweep over the
+    boundaries of each file.
+
+    The output is a csv with the following columns:
+
+        file, role, depth, duration, speech, correct, false_alarm, miss,
+        confusion
+
+    where role is ALL for the rows of the whole file, and file is ALL for
+    the rows of the whole subset. duration is the time spent at each depth,
+    speech counts the time of each reference speaker (at depth 2, it's
+    twice the duration). The false alarms don't belong to a reference
+    speaker, and are NA in the rows of the roles.
+
+    Example of use:
+
+        `python overlap_depth.py /home/${USER}/CHiME5/dev/allU01_dev.rttm /home/${USER}/system_dev.rttm --uem /home/${USER}/CHiME5/dev/allU01_dev.uem -o overlap_depth_dev.csv`
+"""
+
+import argparse
+import numpy as np
+
+from collections import OrderedDict
+
+from spk_map import spk_map
+from scoring import depth_errors
+from corpus import get_segments, read_uem
+
+COLUMNS = ['file', 'role', 'depth', 'duration', 'speech', 'correct',
+           'false_alarm', 'miss', 'confusion']
+
+
+def depth_names(max_depth):
+    """ names of the depths, e.g. ['0', '1', '2', '3+']"""
+    return [str(d) for d in range(max_depth)] + ['{}+'.format(max_depth)]
+
+
+def file_depths(ref_segs, sys_segs, max_depth=3, uem=None):
+    """ errors by depth of the file with the given segments (lists of
+        (onset, offset, label)), and of its roles
+        OUTPUT
+        ------
+            totals: array (depths x 6), see scoring.depth_errors
+            roles: OrderedDict {role: array (depths x 4)}
+    """
+    start, end = uem if uem is not None else (None, None)
+    r_segments = list(zip(*ref_segs)) if ref_segs else ([], [], [])
+    s_segments = list(zip(*sys_segs)) if sys_segs else ([], [], [])
+    r_names, totals, speakers = depth_errors(r_segments, s_segments,
+                                             max_depth, start, end)
+    roles = OrderedDict()
+    for name, errors in zip(r_names, speakers):
+        role = spk_map.get(name, 'NA')
+        roles[role] = roles.get(role, 0) + errors
+    return totals, roles
+
+
+def format_row(uri, role, depth, values):
+    return u','.join([uri, role, depth] + [
+        'NA' if value is None else '{}'.format(value) for value in values]) + '\n'
+
+
+def overlap_depth(ref_rttm, sys_rttm, output, uem=None, max_depth=3):
+    """ write the errors by depth of each file of ref_rttm (and of the
+        files of the uem), of their roles, and of the whole subset"""
+    ref = get_segments(ref_rttm)
+    system = get_segments(sys_rttm)
+    uem_dict = read_uem(uem) if uem is not None else dict()
+    files = list(ref) + [wav for wav in uem_dict if wav not in ref]
+    names = depth_names(max_depth)
+
+    all_totals = np.zeros((max_depth + 1, 6))
+    all_roles = OrderedDict()
+    with open(output, 'w') as fout:
+        fout.write(u','.join(COLUMNS) + '\n')
+        for wav in files:
+            totals, roles = file_depths(ref.get(wav), system.get(wav),
+                                        max_depth, uem_dict.get(wav))
+            all_totals += totals
+            for depth, values in zip(names, totals):
+                fout.write(format_row(wav, 'ALL', depth, values))
+            for role, errors in roles.items():
+                all_roles[role] = all_roles.get(role, 0) + errors
+                for depth, (speech, correct, miss, conf) in zip(names, errors):
+                    fout.write(format_row(wav, role, depth, [
+                        None, speech, correct, None, miss, conf]))
+
+        for depth, values in zip(names, all_totals):
+            fout.write(format_row('ALL', 'ALL', depth, values))
+        for role, errors in all_roles.items():
+            for depth, (speech, correct, miss, conf) in zip(names, errors):
+                fout.write(format_row('ALL', role, depth, [
+                    None, speech, correct, None, miss, conf]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('reference', type=str,
+                        help='path to the reference rttm')
+    parser.add_argument('system', type=str,
+                        help='path to the system rttm')
+    parser.add_argument('--uem', type=str, default=None,
+                        help='(Optional) uem of the reference, only the annotated '
+                             'part of the files is scored')
+    parser.add_argument('--max_depth', type=int, default=3,
+                        help='(Optional) the depths from max_depth are counted '
+                             'together (default 3, for 0, 1, 2, 3+)')
+    parser.add_argument('-o', '--output', type=str, default='overlap_depth.csv',
+                        help='(Optional) path to the output csv')
+    args = parser.parse_args()
+
+    overlap_depth(args.reference, args.system, args.output, args.uem,
+                  args.max_depth)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#
+""" Read the next files of a loop in a background thread, while the
+    current one is processed.
+
+    The loaded files are put in a queue of bounded depth: the reader
+    thread waits when `depth` files are loaded and not yet used, so that at
+    most depth + 2 files are in memory (the queue, the one being read and
+    the one being processed).
+    Reading a file releases the GIL, so that the reads overlap with the
+    numpy computations of the main thread.
+
+    Example:
+
+        prefetch = Prefetcher(load, files, depth=2)
+        for wav in files:
+            data = prefetch.get(wav)  # None if the loading failed
+            ...
+        prefetch.close()
+        print(prefetch.report())
+"""
+
+import time
+import queue
+import threading
+
+
+class Prefetcher(object):
+    """ load the files of a list, in order, in a background thread
+        ATTRIBUTES
+        ----------
+            depth: maximum number of loaded files waiting to be used, no
+                   file is prefetched if depth is 0
+            n_loaded: number of files loaded
+            load_time: total time spent loading the files, in seconds
+            wait_time: total time the main thread waited for a file
+    """
+
+    def __init__(self, load, keys, depth=2):
+        """ INPUT
+            -----
+                load: function called on each key, in the reader thread
+                keys: keys of the files, in the order in which they will
+                      be requested
+                depth: maximum number of loaded files waiting to be used
+        """
+        self.load = load
+        self.keys = list(keys)
+        self.depth = depth
+        self.pending = set(self.keys)
+        self.n_loaded = 0
+        self.load_time = 0.
+        self.wait_time = 0.
+
+        self._stop = threading.Event()
+        self._queue = queue.Queue(maxsize=max(depth, 1))
+        self._thread = None
+        if depth > 0 and self.keys:
+            self._thread = threading.Thread(target=self._read)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _read(self):
+        for key in self.keys:
+            if self._stop.is_set():
+                break
+            start = time.time()
+            try:
+                value = self.load(key)
+            except Exception:
+                # the file will be read (and fail) in the main thread
+                value = None
+            self.load_time += time.time() - start
+            self.n_loaded += 1
+            self._put((key, value))
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, key):
+        """ return the loaded file of key, or None if it was not prefetched
+            (or its loading failed). The files requested before key and
+            not used are dropped."""
+        if self._thread is None or key not in self.pending:
+            return None
+        start = time.time()
+        while True:
+            got, value = self._queue.get()
+            self.pending.discard(got)
+            if got == key:
+                break
+        self.wait_time += time.time() - start
+        return value
+
+    def close(self):
+        """ stop the reader thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.pending = set()
+
+    @property
+    def hidden_time(self):
+        """ time spent loading files while the main thread was working"""
+        return max(0., self.load_time - self.wait_time)
+
+    def report(self):
+        return ('prefetched {} files: {:.1f}s of reading, {:.1f}s waiting, '
+                '{:.1f}s of reading hidden'.format(
+                    self.n_loaded, self.load_time, self.wait_time,
+                    self.hidden_time))
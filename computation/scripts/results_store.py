@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+#
+""" Fast access to the csv's stored in computation/results.
+
+    The first load reads every csv describing the corpora
+    (``{corpus}_{subset}.csv``, ``{corpus}_{subset}_perSpeaker.csv``,
+    ``snr/10schunks_SNR/{corpus}_{subset}_{chunk_dur}.csv`` and
+    ``snr/local_SNR/{corpus}/{file}_snr.csv``) and consolidates them in
+    a cache folder (``results/.store``) containing one .npy per column,
+    so that the next loads only memory-map the arrays.
+    String columns (corpus, subset, file, speaker, role...) are interned
+    as integer codes. The rows of the chunk and local SNR tables are grouped
+    per (corpus, subset, file) and sorted by onset, which allows to select
+    a file with a slice and a time range with a binary search.
+
+    The cache is rebuilt automatically, table per table, as soon as one of
+    its source csv is added, removed or modified.
+
+    Example of use:
+
+        >>> from results_store import load_results
+        >>> store = load_results()
+        >>> store.speakers(corpus='BabyTrain', role=['CHI', 'KCHI'])
+        >>> store.local_snr(file='S02_U01', start=60, end=70)
+"""
+
+import os
+import re
+import csv
+import json
+import itertools
+import argparse
+import numpy as np
+
+from collections import defaultdict
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'results')
+CACHE_DIR = '.store'
+CACHE_VERSION = 2
+
+# duration of the windows used in speaker_info_per_file.local_snr
+LOCAL_SNR_STEP = 0.1
+
+FILE_COLUMNS = ['key_child_age', 'clip_length', 'nb_diff_speakers',
+                'nb_children', 'nb_fem_ad', 'nb_mal_ad', 'nb_uncertain',
+                'prop_ovl_speech', 'prop_nonovl_speech', 'avg_voc_dur', 'snr']
+SPEAKER_COLUMNS = ['tot_ovl_speech', 'tot_nonovl_speech', 'snr']
+# seconds of speech of each role and number of speakers of the chunks (NaN
+# for the csv's written before they were added)
+CHUNK_COLUMNS = ['KCHI', 'CHI', 'FEM', 'MAL', 'SPEECH', 'nb_speakers']
+
+# tables, and the columns that are interned strings
+TABLES = {'files': ['corpus', 'subset', 'file'],
+          'speakers': ['corpus', 'subset', 'file', 'speaker', 'role'],
+          'chunks': ['group', 'labels'],
+          'local': ['group']}
+
+PER_FILE = re.compile(r'^(?P<corpus>.+)_(?P<subset>train|dev|test)\.csv$')
+PER_SPEAKER = re.compile(r'^(?P<corpus>.+)_(?P<subset>train|dev|test)'
+                         r'_perSpeaker\.csv$')
+PER_CHUNK = re.compile(r'^(?P<corpus>.+)_(?P<subset>train|dev|test)'
+                       r'_(?P<chunk_dur>\d+)\.csv$')
+
+
+def to_float(value):
+    """ convert a csv field to float, empty fields and "NA" become NaN"""
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def list_sources(results_dir):
+    """ list the csv's of the results folder, for each table.
+        OUTPUT
+        ------
+            sources: dict {table: {relative path: (size, mtime_ns)}}
+    """
+    sources = {table: dict() for table in TABLES}
+
+    def add(table, relpath):
+        stat = os.stat(os.path.join(results_dir, relpath))
+        sources[table][relpath] = (stat.st_size, stat.st_mtime_ns)
+
+    for fname in sorted(os.listdir(results_dir)):
+        if PER_SPEAKER.match(fname):
+            add('speakers', fname)
+        elif PER_FILE.match(fname):
+            add('files', fname)
+
+    chunk_dir = os.path.join('snr', '10schunks_SNR')
+    if os.path.isdir(os.path.join(results_dir, chunk_dir)):
+        for fname in sorted(os.listdir(os.path.join(results_dir, chunk_dir))):
+            if PER_CHUNK.match(fname):
+                add('chunks', os.path.join(chunk_dir, fname))
+
+    local_dir = os.path.join('snr', 'local_SNR')
+    if os.path.isdir(os.path.join(results_dir, local_dir)):
+        for corpus in sorted(os.listdir(os.path.join(results_dir, local_dir))):
+            corpus_dir = os.path.join(local_dir, corpus)
+            if not os.path.isdir(os.path.join(results_dir, corpus_dir)):
+                continue
+            for fname in sorted(os.listdir(os.path.join(results_dir,
+                                                        corpus_dir))):
+                if fname.endswith('_snr.csv'):
+                    add('local', os.path.join(corpus_dir, fname))
+
+    return sources
+
+
+class Vocabulary(object):
+    """ intern strings as consecutive integer codes"""
+
+    def __init__(self, words=()):
+        self.words = list(words)
+        self.index = {word: code for code, word in enumerate(self.words)}
+
+    def code(self, word):
+        if word not in self.index:
+            self.index[word] = len(self.words)
+            self.words.append(word)
+        return self.index[word]
+
+    def codes(self, words):
+        """ return the codes of the requested words, ignoring unknown ones"""
+        if isinstance(words, str):
+            words = [words]
+        return np.array([self.index[w] for w in words if w in self.index],
+                        dtype=np.int32)
+
+    def decode(self, codes):
+        return np.array(self.words, dtype=object)[codes] if self.words \
+            else np.array([], dtype=object)
+
+
+def read_per_file(results_dir, relpaths, vocab):
+    """ read the {corpus}_{subset}.csv's"""
+    columns = defaultdict(list)
+    for relpath in relpaths:
+        match = PER_FILE.match(os.path.basename(relpath))
+        with open(os.path.join(results_dir, relpath), 'r') as fin:
+            for row in csv.DictReader(fin):
+                columns['corpus'].append(vocab.code(match.group('corpus')))
+                columns['subset'].append(vocab.code(match.group('subset')))
+                columns['file'].append(vocab.code(row['file']))
+                for col in FILE_COLUMNS:
+                    columns[col].append(to_float(row[col]))
+    return columns
+
+
+def read_per_speaker(results_dir, relpaths, vocab):
+    """ read the {corpus}_{subset}_perSpeaker.csv's"""
+    columns = defaultdict(list)
+    for relpath in relpaths:
+        match = PER_SPEAKER.match(os.path.basename(relpath))
+        with open(os.path.join(results_dir, relpath), 'r') as fin:
+            for row in csv.DictReader(fin):
+                columns['corpus'].append(vocab.code(match.group('corpus')))
+                columns['subset'].append(vocab.code(match.group('subset')))
+                columns['file'].append(vocab.code(row['file']))
+                columns['speaker'].append(vocab.code(row['speaker']))
+                columns['role'].append(vocab.code(row['role']))
+                for col in SPEAKER_COLUMNS:
+                    columns[col].append(to_float(row[col]))
+    return columns
+
+
+def read_per_chunk(results_dir, relpaths, vocab, groups):
+    """ read the chunk SNR csv's: with a header (file,onset,offset,snr, then
+        CHUNK_COLUMNS and optionally labels), or without one as they were
+        first written (file,onset,offset,labels,snr, then CHUNK_COLUMNS if
+        present). The labels are empty if they were not written."""
+    columns = defaultdict(list)
+    for relpath in relpaths:
+        match = PER_CHUNK.match(os.path.basename(relpath))
+        with open(os.path.join(results_dir, relpath), 'r') as fin:
+            reader = csv.reader(fin)
+            first = next(reader, None)
+            if first is None:
+                continue
+            if first[0] == 'file':
+                rows = (dict(zip(first, row)) for row in reader)
+            else:
+                legacy = ['file', 'onset', 'offset', 'labels', 'snr'] \
+                    + CHUNK_COLUMNS
+                rows = (dict(zip(legacy, row))
+                        for row in itertools.chain([first], reader))
+            for row in rows:
+                wav, onset, offset = row['file'], row['onset'], row['offset']
+                labels, snr = row.get('labels', ''), row['snr']
+                columns['group'].append(groups.code((match.group('corpus'),
+                                                     match.group('subset'),
+                                                     wav)))
+                columns['chunk_dur'].append(int(match.group('chunk_dur')))
+                columns['onset'].append(float(onset))
+                columns['offset'].append(float(offset))
+                columns['labels'].append(vocab.code(labels))
+                columns['snr'].append(to_float(snr))
+                for col in CHUNK_COLUMNS:
+                    columns[col].append(to_float(row.get(col, 'NA')))
+    return columns
+
+
+def read_local(results_dir, relpaths, groups, file2subset):
+    """ read the local SNR csv's (no header: onset,snr)"""
+    group, onset, snr = [], [], []
+    for relpath in relpaths:
+        corpus = os.path.basename(os.path.dirname(relpath))
+        wav = os.path.basename(relpath)[:-len('_snr.csv')]
+        code = groups.code((corpus, file2subset.get((corpus, wav), ''), wav))
+
+        path = os.path.join(results_dir, relpath)
+        if os.path.getsize(path) == 0:
+            continue
+        values = np.loadtxt(path, delimiter=',', ndmin=2)
+        onset.append(values[:, 0])
+        snr.append(values[:, 1])
+        group.append(np.full(len(values), code, dtype=np.int32))
+
+    if not group:
+        return {'group': [], 'onset': [], 'snr': []}
+    return {'group': np.concatenate(group),
+            'onset': np.concatenate(onset),
+            'snr': np.concatenate(snr)}
+
+
+def group_rows(columns):
+    """ sort the rows of a table by (group, onset) and return the [start, stop)
+        boundaries of each group"""
+    group = np.asarray(columns['group'], dtype=np.int32)
+    order = np.lexsort((np.asarray(columns['onset']), group))
+    for col in columns:
+        columns[col] = np.asarray(columns[col])[order]
+    return columns
+
+
+class ResultsStore(object):
+    """ indexed, memory mapped view of computation/results"""
+
+    def __init__(self, results_dir=RESULTS_DIR, rebuild=False):
+        self.results_dir = os.path.abspath(results_dir)
+        self.cache_dir = os.path.join(self.results_dir, CACHE_DIR)
+        self.update(force=rebuild)
+
+    # -- cache management --------------------------------------------------
+
+    def _manifest_path(self):
+        return os.path.join(self.cache_dir, 'manifest.json')
+
+    def _column_path(self, table, column):
+        return os.path.join(self.cache_dir, '{}.{}.npy'.format(table, column))
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path(), 'r') as fin:
+                manifest = json.load(fin)
+        except (IOError, ValueError):
+            return None
+        if manifest.get('version') != CACHE_VERSION:
+            return None
+        return manifest
+
+    def update(self, force=False):
+        """ rebuild the tables whose sources changed since the last build"""
+        sources = list_sources(self.results_dir)
+        manifest = self._read_manifest()
+
+        stale = set(TABLES)
+        if manifest is not None and not force:
+            for table in TABLES:
+                cached = {path: tuple(stat) for path, stat
+                          in manifest['sources'].get(table, {}).items()}
+                if cached == sources[table]:
+                    stale.discard(table)
+
+        # the local SNR table uses the per file tables to find the subsets
+        if 'files' in stale:
+            stale.add('local')
+
+        if stale:
+            self._build(sources, stale, manifest)
+        self._load()
+
+    def _build(self, sources, stale, manifest):
+        """ read the csv's of the stale tables and write their columns"""
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        # new codes are appended to the vocabularies, so that the codes
+        # of the tables that are not rebuilt stay valid
+        if manifest is None or set(TABLES) <= stale:
+            manifest = {'sources': {}, 'vocab': [], 'groups': []}
+        vocab = Vocabulary(manifest['vocab'])
+        groups = Vocabulary(tuple(g) for g in manifest['groups'])
+
+        tables = dict()
+        if 'files' in stale:
+            tables['files'] = read_per_file(self.results_dir,
+                                            sources['files'], vocab)
+        if 'speakers' in stale:
+            tables['speakers'] = read_per_speaker(self.results_dir,
+                                                  sources['speakers'], vocab)
+        if 'chunks' in stale:
+            tables['chunks'] = group_rows(read_per_chunk(
+                self.results_dir, sources['chunks'], vocab, groups))
+        if 'local' in stale:
+            if 'files' in tables:
+                per_file = tables['files']
+            else:
+                per_file = {col: np.load(self._column_path('files', col))
+                            for col in TABLES['files']}
+            file2subset = {(vocab.words[c], vocab.words[f]): vocab.words[s]
+                           for c, s, f in zip(per_file['corpus'],
+                                              per_file['subset'],
+                                              per_file['file'])}
+            tables['local'] = group_rows(read_local(
+                self.results_dir, sources['local'], groups, file2subset))
+
+        for table, columns in tables.items():
+            manifest.setdefault('columns', {})[table] = sorted(columns)
+            for col, values in columns.items():
+                values = np.asarray(values)
+                if col in TABLES[table]:
+                    values = values.astype(np.int32)
+                np.save(self._column_path(table, col), values)
+            manifest['sources'][table] = sources[table]
+
+        manifest['version'] = CACHE_VERSION
+        manifest['vocab'] = vocab.words
+        manifest['groups'] = [list(g) for g in groups.words]
+
+        # write manifest last, so that an interrupted build is detected
+        tmp = self._manifest_path() + '.tmp'
+        with open(tmp, 'w') as fout:
+            json.dump(manifest, fout)
+        os.replace(tmp, self._manifest_path())
+
+    def _load(self):
+        """ memory map the columns and build the indexes"""
+        manifest = self._read_manifest()
+        self.vocab = Vocabulary(manifest['vocab'])
+        self.tables = {table: {col: np.load(self._column_path(table, col),
+                                            mmap_mode='r')
+                               for col in manifest['columns'][table]}
+                       for table in TABLES}
+
+        # groups of the chunk/local tables, as arrays of codes
+        group_words = [tuple(g) for g in manifest['groups']]
+        self.groups = {
+            key: np.array([self.vocab.code(g[i]) for g in group_words],
+                          dtype=np.int32)
+            for i, key in enumerate(['corpus', 'subset', 'file'])}
+
+        # [start, stop) of each group in the chunk and local tables
+        self.bounds = dict()
+        for table in ['chunks', 'local']:
+            group = self.tables[table]['group']
+            n_groups = len(group_words)
+            start = np.searchsorted(group, np.arange(n_groups), side='left')
+            stop = np.searchsorted(group, np.arange(n_groups), side='right')
+            self.bounds[table] = (start, stop)
+
+    # -- queries -----------------------------------------------------------
+
+    def _mask(self, codes, **filters):
+        """ boolean mask of the rows matching all the (non None) filters"""
+        mask = None
+        for key, values in filters.items():
+            if values is None:
+                continue
+            selected = np.isin(codes[key], self.vocab.codes(values))
+            mask = selected if mask is None else mask & selected
+        return mask
+
+    def _select(self, table, mask, strings):
+        columns = self.tables[table]
+        rows = np.flatnonzero(mask) if mask is not None \
+            else slice(None)
+        return {col: (self.vocab.decode(np.asarray(values[rows]))
+                      if col in strings else np.asarray(values[rows]))
+                for col, values in columns.items()}
+
+    def files(self, corpus=None, subset=None, file=None):
+        """ rows of the per file tables. Each filter is either a string or
+            a list of strings.
+            OUTPUT
+            ------
+                dict {column: array}
+        """
+        mask = self._mask(self.tables['files'], corpus=corpus,
+                          subset=subset, file=file)
+        return self._select('files', mask, TABLES['files'])
+
+    def speakers(self, corpus=None, subset=None, file=None, speaker=None,
+                 role=None):
+        """ rows of the per speaker tables"""
+        mask = self._mask(self.tables['speakers'], corpus=corpus,
+                          subset=subset, file=file, speaker=speaker,
+                          role=role)
+        return self._select('speakers', mask, TABLES['speakers'])
+
+    def _time_range(self, table, corpus, subset, file, start, end):
+        """ select the groups matching the filters, and in each group the
+            rows overlapping [start, end)"""
+        mask = self._mask(self.groups, corpus=corpus, subset=subset,
+                          file=file)
+        groups = np.flatnonzero(mask) if mask is not None \
+            else np.arange(len(self.groups['file']))
+
+        columns = self.tables[table]
+        onset = columns['onset']
+        g_start, g_stop = self.bounds[table]
+        rows = []
+        for group in groups:
+            beg, stop = g_start[group], g_stop[group]
+            if end is not None:
+                stop = beg + np.searchsorted(onset[beg:stop], end,
+                                             side='left')
+            if start is not None:
+                if 'offset' in columns:
+                    # chunks of different durations can be mixed in a group,
+                    # so offsets are not necessarily sorted
+                    idx = beg + np.flatnonzero(
+                        np.asarray(columns['offset'][beg:stop]) > start)
+                    rows.append(idx)
+                    continue
+                # local SNR windows all last LOCAL_SNR_STEP
+                beg += np.searchsorted(onset[beg:stop], start - LOCAL_SNR_STEP,
+                                       side='right')
+            if stop > beg:
+                rows.append(np.arange(beg, stop))
+        rows = np.concatenate(rows) if rows else np.array([], dtype=int)
+
+        out = {col: np.asarray(values[rows]) for col, values in columns.items()
+               if col != 'group'}
+        group = np.asarray(columns['group'][rows])
+        for key in ['corpus', 'subset', 'file']:
+            out[key] = self.vocab.decode(self.groups[key][group])
+        return out
+
+    def chunk_snr(self, corpus=None, subset=None, file=None, start=None,
+                  end=None, chunk_dur=None):
+        """ chunk SNR of the requested files, for the chunks overlapping
+            [start, end) (in seconds)"""
+        out = self._time_range('chunks', corpus, subset, file, start, end)
+        if chunk_dur is not None:
+            keep = out['chunk_dur'] == chunk_dur
+            out = {col: values[keep] for col, values in out.items()}
+        out['labels'] = self.vocab.decode(out['labels'].astype(int))
+        return out
+
+    def local_snr(self, corpus=None, subset=None, file=None, start=None,
+                  end=None):
+        """ local SNR (100ms windows) of the requested files, for the windows
+            overlapping [start, end) (in seconds)"""
+        return self._time_range('local', corpus, subset, file, start, end)
+
+
+_STORES = dict()
+
+
+def load_results(results_dir=RESULTS_DIR, rebuild=False):
+    """ return the ResultsStore of results_dir. The store is built once per
+        process, and its cache checked for modified sources at each call"""
+    key = os.path.abspath(results_dir)
+    if key not in _STORES or rebuild:
+        _STORES[key] = ResultsStore(results_dir, rebuild=rebuild)
+    else:
+        _STORES[key].update()
+    return _STORES[key]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--results', type=str, default=RESULTS_DIR,
+                        help='(Optional) path to the results folder')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='(Optional) rebuild the cache even if the csv '
+                             'files did not change')
+    args = parser.parse_args()
+
+    store = load_results(args.results, rebuild=args.rebuild)
+    for table, columns in sorted(store.tables.items()):
+        n_rows = len(next(iter(columns.values()))) if columns else 0
+        print('{}: {} rows'.format(table, n_rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+""" Consolidated per speaker, per role and per corpus tables of the scores
+    of metrics_by_speaker.py.
+
+    The rows of the speakers are written as soon as a file is scored, and
+    their durations are kept in arrays along with interned ids of their
+    configuration, file and role (looked up in spk_map). At the end of the
+    run, the rows are summed by (configuration, file, role) and by
+    (configuration, role) with a single bincount per column, and written
+    after the speakers in the same table:
+
+        Level|Config|File|ID|Role|N|correct|miss_speaker|miss_speech|FA_speaker|FA_speech
+        speaker|collar0ms|S02_U01|P05|FEM|1|...
+        role|collar0ms|S02_U01|ALL|FEM|2|...
+        corpus|collar0ms|ALL|ALL|FEM|31|...
+
+    where N is the number of speakers summed in the row. The speakers that
+    are not in spk_map get the role NA.
+"""
+
+import numpy as np
+
+from spk_map import spk_map
+
+FIELDS = ['correct', 'miss_speaker', 'miss_speech', 'FA_speaker', 'FA_speech']
+HEADER = 'Level|Config|File|ID|Role|N|{}\n'.format('|'.join(FIELDS))
+
+
+class Interned(object):
+    """ ids of strings, in order of first appearance"""
+
+    def __init__(self):
+        self.names = []
+        self.ids = dict()
+
+    def __call__(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class RoleTable(object):
+    """ write the scores of the speakers of each file as they come, and their
+        sums by role (per file and for the whole corpus) at the end
+        ATTRIBUTES
+        ----------
+            fout: opened output file
+            configs, files, roles: interned names
+            keys: list of (config, file, role) ids of each speaker row
+            values: list of the durations of each speaker row (FIELDS)
+    """
+
+    def __init__(self, fout, roles=spk_map):
+        self.fout = fout
+        self.spk_map = roles
+        self.configs = Interned()
+        self.files = Interned()
+        self.roles = Interned()
+        self.keys = []
+        self.values = []
+        self.fout.write(HEADER)
+
+    def add(self, uri, results, vad=False):
+        """ add the scores of a file
+            INPUT
+            -----
+                results: dict {config name: (correct, FA_spk, FA_speech,
+                         miss_spk, miss_speech)}, as given by
+                         scoring.score_speakers
+                vad: if True, the speaker errors are not defined (NaN)
+        """
+        file_id = self.files(uri)
+        for name in results:
+            config_id = self.configs(name)
+            correct, FA_spk, FA_spch, miss_spk, miss_spch = results[name]
+            for spk in correct:
+                role = self.spk_map.get(spk, 'NA')
+                values = [correct[spk], miss_spk[spk], miss_spch[spk],
+                          FA_spk[spk], FA_spch[spk]]
+                if vad:
+                    values[1] = values[3] = np.nan
+                self.keys.append((config_id, file_id, self.roles(role)))
+                self.values.append(values)
+                self.write_row('speaker', name, uri, spk, role, 1, values)
+
+    def write_row(self, level, config, uri, spk, role, n, values):
+        self.fout.write('{}|{}|{}|{}|{}|{}|{}\n'.format(
+            level, config, uri, spk, role, n,
+            '|'.join('{}'.format(value) for value in values)))
+
+    def group(self, keys):
+        """ sum the speaker rows sharing the same keys
+            OUTPUT
+            ------
+                groups: unique keys, sorted
+                counts: number of speakers of each group
+                sums: array (groups x FIELDS) of summed durations
+        """
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        values = np.array(self.values, dtype=np.float64).reshape(-1, len(FIELDS))
+        counts = np.bincount(inverse, minlength=len(groups))
+        sums = np.stack([np.bincount(inverse, weights=values[:, k],
+                                     minlength=len(groups))
+                         for k in range(len(FIELDS))], axis=1)
+        return groups, counts, sums
+
+    def write_roles(self):
+        """ write the sums by (config, file, role) and by (config, role)"""
+        if not self.keys:
+            return
+        keys = np.array(self.keys, dtype=np.int64)
+
+        groups, counts, sums = self.group(keys)
+        for (config, file_id, role), n, values in zip(groups, counts, sums):
+            self.write_row('role', self.configs.names[config],
+                           self.files.names[file_id], 'ALL',
+                           self.roles.names[role], n, values)
+
+        groups, counts, sums = self.group(keys[:, [0, 2]])
+        for (config, role), n, values in zip(groups, counts, sums):
+            self.write_row('corpus', self.configs.names[config], 'ALL', 'ALL',
+                           self.roles.names[role], n, values)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#
+""" Index of the lines of each file (uri) in the rttm's and uem's of a
+    subset (all_{subset}.rttm, allU01_{subset}.rttm, ...), so that the
+    annotations of a few files can be read without parsing the whole set.
+
+    Example of use, to print the annotations of a single file (the index is
+    built the first time):
+
+        `python rttm_index.py /home/${USER}/CHiME5/dev/allU01_dev.rttm S02_U01`
+
+    The index is written next to the rttm, in {rttm}.idx:
+
+        {"version": 1, "size": ..., "mtime_ns": ...,
+         "uris": {uri: [[start, end], ...]}}
+
+    where [start, end) are the byte ranges of the consecutive lines of the
+    uri. It is rebuilt when the size or the modification time of the rttm
+    changes. If the folder of the rttm is not writable, the index is only
+    kept in memory.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+VERSION = 1
+
+# column of the uri in each format
+RTTM_FIELD = 1
+UEM_FIELD = 0
+
+_INDEXES = dict()
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def build_line_index(path, field=RTTM_FIELD):
+    """ read the file once and return {uri: [[start, end], ...]}, the byte
+        ranges of its lines, merged when consecutive"""
+    uris = dict()
+    offset = 0
+    with open(path, 'rb') as fin:
+        for line in fin:
+            start, offset = offset, offset + len(line)
+            fields = line.split()
+            if len(fields) <= field:
+                continue
+            uri = fields[field].decode('utf-8')
+            ranges = uris.setdefault(uri, [])
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = offset
+            else:
+                ranges.append([start, offset])
+    return uris
+
+
+def load_line_index(path, field=RTTM_FIELD):
+    """ return the index {uri: byte ranges} of path, (re)building it if
+        needed"""
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    if key in _INDEXES and _INDEXES[key][0] == (stat.st_size, stat.st_mtime_ns):
+        return _INDEXES[key][1]
+
+    uris = None
+    try:
+        with open(index_path(path), 'r') as fin:
+            index = json.load(fin)
+        if (index['version'] == VERSION and index['size'] == stat.st_size and
+                index['mtime_ns'] == stat.st_mtime_ns):
+            uris = index['uris']
+    except (IOError, ValueError, KeyError):
+        pass
+
+    if uris is None:
+        uris = build_line_index(path, field)
+        try:
+            tmp = index_path(path) + '.tmp'
+            with open(tmp, 'w') as fout:
+                json.dump({'version': VERSION, 'size': stat.st_size,
+                           'mtime_ns': stat.st_mtime_ns, 'uris': uris}, fout)
+            os.replace(tmp, index_path(path))
+        except (IOError, OSError):
+            # read only corpus: only keep the index in memory
+            pass
+
+    _INDEXES[key] = ((stat.st_size, stat.st_mtime_ns), uris)
+    return uris
+
+
+def list_uris(path, field=RTTM_FIELD):
+    """ uris of the file, in order of first appearance"""
+    uris = load_line_index(path, field)
+    return sorted(uris, key=lambda uri: uris[uri][0][0])
+
+
+def read_lines(path, uris=None, field=RTTM_FIELD):
+    """ return the lines of path, or only the lines of the given uris
+        (in the order of the file) if uris is not None"""
+    if uris is None:
+        with open(path, 'r') as fin:
+            return fin.readlines()
+
+    index = load_line_index(path, field)
+    ranges = sorted(r for uri in set(uris) for r in index.get(uri, []))
+    lines = []
+    with open(path, 'rb') as fin:
+        for start, end in ranges:
+            fin.seek(start)
+            lines.extend(fin.read(end - start).decode('utf-8').splitlines(True))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', type=str,
+                        help='path to the rttm (or uem, with --uem)')
+    parser.add_argument('uris', type=str, nargs='*',
+                        help='(Optional) print the lines of these files. If not '
+                             'given, only (re)build the index.')
+    parser.add_argument('--uem', action='store_true',
+                        help='(Optional) the file is a uem')
+    args = parser.parse_args()
+
+    field = UEM_FIELD if args.uem else RTTM_FIELD
+    load_line_index(args.path, field)
+    if args.uris:
+        sys.stdout.writelines(read_lines(args.path, args.uris, field))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+#
+""" Store of the scores of each file of a system, so that scoring again a
+    system of which only a few files changed only computes these files.
+
+    The store is a jsonl file, with one line appended (and flushed) each
+    time a file is scored:
+
+        {"file": "S02_U01", "options": "3f2a...", "key": "9c41...", "result": ...}
+
+    where options is the hash of the scoring options (configurations,
+    vad, mapping...), and key the hash of the options, of the segments of
+    the reference and of the segments of the system of the file. The
+    result of a file is reused when its key didn't change, i.e. when none
+    of them changed. The last entry of a (file, options) replaces the
+    previous ones, and the file is rewritten without the replaced entries
+    when they are the majority.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+# changed when the scores of a file change for the same inputs
+VERSION = 1
+
+
+def digest(*parts):
+    """ sha1 of strings and arrays"""
+    sha = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            sha.update(np.ascontiguousarray(part, dtype=np.float64).tobytes())
+        else:
+            sha.update(part.encode('utf-8'))
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def segments_digest(segments):
+    """ hash of the (onsets, offsets, labels) of a file"""
+    onsets, offsets, labels = segments
+    return digest(np.asarray(onsets), np.asarray(offsets),
+                  '\n'.join('{}'.format(label) for label in labels))
+
+
+def load_store(path):
+    """ read a store, the last entry of a (file, options) replacing the
+        previous ones. A truncated last line (killed while writing) is
+        ignored.
+        OUTPUT
+        ------
+            entries: dict {(file, options): entry}
+            n_lines: number of entries read
+    """
+    entries = dict()
+    n_lines = 0
+    if not os.path.isfile(path):
+        return entries, n_lines
+    with open(path, 'r') as fin:
+        for line in fin:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[(entry['file'], entry['options'])] = entry
+            n_lines += 1
+    return entries, n_lines
+
+
+class ScoreCache(object):
+    """ append only store of the scores of the files
+        ATTRIBUTES
+        ----------
+            path: path to the jsonl file
+            options: hash of the scoring options
+            entries: dict {(file, options): last entry}
+            hits, misses: number of files reused and computed
+    """
+
+    def __init__(self, path, options):
+        """ INPUT
+            -----
+                path: path to the store
+                options: json serializable scoring options
+        """
+        self.path = path
+        self.options = digest(json.dumps([VERSION, options], sort_keys=True))
+        self.entries, self.n_lines = load_store(path)
+        self.fout = None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, r_segments, s_segments):
+        """ hash of the options and of the segments of a file"""
+        return digest(self.options, segments_digest(r_segments),
+                      segments_digest(s_segments))
+
+    def record(self, wav, key, result):
+        """ append an entry to the store"""
+        entry = {'file': wav, 'options': self.options, 'key': key,
+                 'result': result}
+        if self.fout is None:
+            self.fout = open(self.path, 'a')
+        self.fout.write(json.dumps(entry) + '\n')
+        self.fout.flush()
+        self.entries[(wav, self.options)] = entry
+        self.n_lines += 1
+
+    def run(self, wav, r_segments, s_segments, func, *args):
+        """ return func(*args), the scores of wav, computed only if the
+            store doesn't have them for these segments and options.
+            As results are stored in json, tuples are returned as lists.
+        """
+        key = self.key(r_segments, s_segments)
+        entry = self.entries.get((wav, self.options))
+        if entry is not None and entry['key'] == key:
+            self.hits += 1
+            return entry['result']
+        self.misses += 1
+        result = func(*args)
+        self.record(wav, key, result)
+        return json.loads(json.dumps(result))
+
+    def close(self):
+        """ close the store, and rewrite it if most of its entries were
+            replaced"""
+        if self.fout is not None:
+            self.fout.close()
+            self.fout = None
+        print('{}: {} files reused, {} scored'.format(self.path, self.hits,
+                                                     self.misses))
+        if self.n_lines > 2 * len(self.entries):
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as fout:
+                for entry in self.entries.values():
+                    fout.write(json.dumps(entry) + '\n')
+            os.replace(tmp, self.path)
+            self.n_lines = len(self.entries)
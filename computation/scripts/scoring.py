@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+#
+""" Native per speaker scoring of a system against a reference, for several
+    scoring configurations (collar, overlap excluded or not) at once.
+
+    The boundaries of the reference, of the system and of the collars of a
+    file are sorted once, which splits the file in elementary intervals in
+    which nothing changes. The number of active segments of each label in
+    each elementary interval is computed with cumulative sums, and every
+    duration of the results table of metrics_by_speaker.py is then a
+    weighted sum over the elementary intervals, the weights being the
+    durations of the intervals that are scored in each configuration.
+
+    With a collar of 0 and the overlap included, the durations are the ones
+    metrics_by_speaker.py computes with pyannote (pairs of co-occurring
+    segments, gaps of each speaker inside its extent). The speaker mapping of
+    each configuration is computed on the scored intervals, as pyannote's
+    DiarizationErrorRate does with a collar or without the overlap.
+    As in pyannote, the collar is the total duration removed around each
+    boundary of the reference (collar / 2 on each side).
+"""
+
+import numpy as np
+
+from collections import defaultdict
+
+
+def config_name(collar, skip_overlap):
+    """ name of a scoring configuration, e.g. collar250ms_no_overlap"""
+    name = 'collar{}ms'.format(int(round(collar * 1000)))
+    if skip_overlap:
+        name += '_no_overlap'
+    return name
+
+
+def make_configs(collars=(0.,), overlap='include'):
+    """ list of (name, collar, skip_overlap) of the configurations crossing
+        the collars with overlap in ['include', 'exclude', 'both']"""
+    skips = {'include': [False], 'exclude': [True], 'both': [False, True]}
+    return [(config_name(collar, skip), collar, skip)
+            for collar in collars for skip in skips[overlap]]
+
+
+def optimal_mapping(matrix, r_names, s_names):
+    """ mapping between system and reference maximizing the total
+        co-occurrence, solved as pyannote's HungarianMapper does (same
+        orientation, so that ties give the same mapping)
+        INPUT
+        -----
+            matrix: array (len(r_names) x len(s_names)) of co-occurrence
+                    durations
+        OUTPUT
+        ------
+            mapping: dict {system label: reference label}
+    """
+    # imported here, scipy.optimize is slow to import
+    from scipy.optimize import linear_sum_assignment
+
+    mapping = dict()
+    if len(s_names) > len(r_names):
+        for r, s in zip(*linear_sum_assignment(-matrix)):
+            if matrix[r, s] > 0:
+                mapping[s_names[s]] = r_names[r]
+    else:
+        for s, r in zip(*linear_sum_assignment(-matrix.T)):
+            if matrix[r, s] > 0:
+                mapping[s_names[s]] = r_names[r]
+    return mapping
+
+
+def unique_segments(onsets, offsets, labels):
+    """ remove the segments of duration 0 and the duplicated segments (same
+        onset, offset and label), as a pyannote Timeline does
+        OUTPUT
+        ------
+            onsets, offsets: arrays
+            names: sorted labels
+            idx: index in names of the label of each segment
+    """
+    onsets = np.asarray(onsets, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.float64)
+    names, idx = np.unique(np.array(labels, dtype=str), return_inverse=True)
+    keep = offsets > onsets
+    onsets, offsets, idx = onsets[keep], offsets[keep], idx[keep]
+    if len(onsets):
+        _, first = np.unique(np.stack([onsets, offsets, idx]), axis=1,
+                             return_index=True)
+        first = np.sort(first)
+        onsets, offsets, idx = onsets[first], offsets[first], idx[first]
+    return onsets, offsets, [str(name) for name in names], idx
+
+
+def coverage(bounds, onsets, offsets, idx, n_labels):
+    """ number of active segments of each label in each elementary interval
+        [bounds[k], bounds[k + 1]), as an array (n_labels x len(bounds) - 1)
+    """
+    diff = np.zeros((n_labels, len(bounds)), dtype=np.int64)
+    np.add.at(diff, (idx, np.searchsorted(bounds, onsets)), 1)
+    np.add.at(diff, (idx, np.searchsorted(bounds, offsets)), -1)
+    return np.cumsum(diff, axis=1)[:, :-1]
+
+
+def gaps(count, bounds, onsets, offsets, idx, n_labels):
+    """ elementary intervals in the gaps of each label, inside the extent of
+        its segments (boolean array n_labels x len(bounds) - 1)"""
+    inside = np.zeros(count.shape, dtype=bool)
+    starts = bounds[:-1]
+    for label in range(n_labels):
+        sel = idx == label
+        if sel.any():
+            inside[label] = ((starts >= onsets[sel].min()) &
+                             (starts < offsets[sel].max()))
+    return inside & (count == 0)
+
+
+def scored_weights(bounds, r_count, r_onsets, r_offsets, configs):
+    """ duration of each elementary interval that is scored in each
+        configuration (array len(configs) x len(bounds) - 1).
+        Without the overlap, the intervals in which 2 segments of the
+        reference are active are not scored, whatever their labels: as
+        pyannote's uemify, two overlapping segments of the same speaker are
+        an overlap (the duplicated segments are only counted once, see
+        unique_segments)."""
+    lengths = np.diff(bounds)
+    n_active = r_count.sum(axis=0)
+    weights = np.zeros((len(configs), len(lengths)))
+    for c, (_, collar, skip_overlap) in enumerate(configs):
+        scored = np.ones(len(lengths), dtype=bool)
+        if collar > 0:
+            edges = np.r_[r_onsets, r_offsets]
+            zones = coverage(bounds, edges - collar / 2., edges + collar / 2.,
+                             np.zeros(len(edges), dtype=np.int64), 1)[0]
+            scored &= zones == 0
+        if skip_overlap:
+            scored &= n_active < 2
+        weights[c] = lengths * scored
+    return weights
+
+
+def score_speakers(r_segments, s_segments, configs, mapping=None, vad=False):
+    """ fill the results table of each speaker of the reference, for each
+        configuration, in one sweep over the boundaries of the file
+        INPUT
+        -----
+            r_segments, s_segments: (onsets, offsets, labels) of the
+                                    reference and of the system
+            configs: list of (name, collar, skip_overlap)
+            mapping: dict {system label: reference label}. If None, the
+                     optimal mapping of each configuration is used.
+            vad: if True, all the system labels are mapped to all the
+                 reference labels
+        OUTPUT
+        ------
+            results: dict {name: (correct, FA_spk, FA_speech, miss_spk,
+                      miss_speech)}, each one a dict {reference label:
+                      duration}, as in metrics_by_speaker.py
+    """
+    r_on, r_off, r_names, r_idx = unique_segments(*r_segments)
+    s_on, s_off, s_names, s_idx = unique_segments(*s_segments)
+    extra = [np.r_[r_on, r_off] + sign * collar / 2.
+             for _, collar, _ in configs if collar > 0 for sign in (-1, 1)]
+    bounds = np.unique(np.concatenate([r_on, r_off, s_on, s_off] + extra))
+
+    r_count = coverage(bounds, r_on, r_off, r_idx, len(r_names))
+    s_count = coverage(bounds, s_on, s_off, s_idx, len(s_names))
+    r_gaps = gaps(r_count, bounds, r_on, r_off, r_idx, len(r_names))
+    s_gaps = gaps(s_count, bounds, s_on, s_off, s_idx, len(s_names))
+    weights = scored_weights(bounds, r_count, r_on, r_off, configs)
+
+    results = dict()
+    for (name, _, _), weight in zip(configs, weights):
+        # co-occurrence of each pair of labels in the scored intervals
+        pairs = np.dot(r_count * weight, s_count.T)
+
+        # mapped[r, s]: whether the system label s counts as the reference r
+        mapped = np.ones((len(r_names), len(s_names)), dtype=bool)
+        if not vad:
+            config_mapping = mapping
+            if config_mapping is None:
+                config_mapping = optimal_mapping(pairs, r_names, s_names)
+            mapped[:] = False
+            for s, s_name in enumerate(s_names):
+                if config_mapping.get(s_name) in r_names:
+                    mapped[r_names.index(config_mapping[s_name]), s] = True
+
+        correct_ = (pairs * mapped).sum(axis=1)
+        confused = (pairs * ~mapped).sum(axis=1)
+        miss_speech_ = np.dot(r_count * weight, s_gaps.T).sum(axis=1)
+        FA_speech_ = np.dot(r_gaps * weight, s_count.T).sum(axis=1)
+
+        correct, FA_spk, FA_speech, miss_spk, miss_speech = [
+            defaultdict(int) for _ in range(5)]
+        if len(s_names):
+            for r, r_name in enumerate(r_names):
+                correct[r_name] = float(correct_[r])
+                FA_spk[r_name] = float(confused[r])
+                FA_speech[r_name] = float(FA_speech_[r])
+                miss_spk[r_name] = float(confused[r])
+                miss_speech[r_name] = float(miss_speech_[r])
+        results[name] = (correct, FA_spk, FA_speech, miss_spk, miss_speech)
+    return results
+
+
+def chunk_errors(r_segments, s_segments, onsets, end):
+    """ decompose the diarization error of each chunk of a file, under the
+        optimal mapping of the whole file (computed on [onsets[0], end]),
+        in one sweep over the boundaries of the segments and of the chunks.
+        In each elementary interval, with n_ref and n_sys the numbers of
+        speakers of the reference and of the system, and n_correct the
+        number of mapped pairs, the durations are counted as in pyannote's
+        DiarizationErrorRate:
+            speech: n_ref, correct: n_correct,
+            false alarm: max(0, n_sys - n_ref),
+            miss: max(0, n_ref - n_sys),
+            confusion: min(n_ref, n_sys) - n_correct
+        INPUT
+        -----
+            r_segments, s_segments: (onsets, offsets, labels) of the
+                                    reference and of the system
+            onsets: sorted onsets of the chunks (seconds), the last chunk
+                    ending at end
+        OUTPUT
+        ------
+            mapping: dict {system label: reference label}
+            speech, correct, false, miss, confusion: arrays of durations
+                                                     (seconds) per chunk
+    """
+    onsets = np.asarray(onsets, dtype=np.float64)
+    if len(onsets) == 0:
+        return dict(), tuple(np.zeros(0) for _ in range(5))
+    start = onsets[0]
+
+    r_on, r_off, r_names, r_idx = unique_segments(*r_segments)
+    s_on, s_off, s_names, s_idx = unique_segments(*s_segments)
+    r_on, r_off = np.clip(r_on, start, end), np.clip(r_off, start, end)
+    s_on, s_off = np.clip(s_on, start, end), np.clip(s_off, start, end)
+    bounds = np.unique(np.concatenate([r_on, r_off, s_on, s_off, onsets,
+                                       [end]]))
+    bounds = bounds[bounds <= end]
+    lengths = np.diff(bounds)
+
+    r_active = coverage(bounds, r_on, r_off, r_idx, len(r_names)) > 0
+    s_active = coverage(bounds, s_on, s_off, s_idx, len(s_names)) > 0
+    mapping = optimal_mapping(np.dot(r_active * lengths, s_active.T),
+                              r_names, s_names)
+    mapped = np.zeros((len(r_names), len(s_names)))
+    for s, s_name in enumerate(s_names):
+        if s_name in mapping:
+            mapped[r_names.index(mapping[s_name]), s] = 1
+
+    n_ref = r_active.sum(axis=0)
+    n_sys = s_active.sum(axis=0)
+    n_correct = (np.dot(mapped.T, r_active) * s_active).sum(axis=0)
+
+    # chunk of each elementary interval
+    chunk = np.searchsorted(onsets, bounds[:-1], side='right') - 1
+    return mapping, tuple(
+        np.bincount(chunk, weights=count * lengths, minlength=len(onsets))
+        for count in [n_ref, n_correct, np.maximum(n_sys - n_ref, 0),
+                      np.maximum(n_ref - n_sys, 0),
+                      np.minimum(n_ref, n_sys) - n_correct])
+
+
+def depth_errors(r_segments, s_segments, max_depth=3, start=None, end=None):
+    """ decompose the diarization error of a file by overlap depth (number
+        of reference speakers active at the same time, the depths above
+        max_depth being counted together), under the optimal mapping of the
+        file, in one sweep over the boundaries of the segments.
+        The error of a reference speaker that is not correct is split
+        between miss and confusion in the proportions of the interval, so
+        that the errors of the speakers sum to the errors of the file.
+        INPUT
+        -----
+            r_segments, s_segments: (onsets, offsets, labels) of the
+                                    reference and of the system
+            max_depth: last depth (e.g. 3 for 0, 1, 2, 3+)
+            start, end: (optional) scored part of the file, by default from
+                        the first to the last boundary
+        OUTPUT
+        ------
+            r_names: labels of the reference
+            totals: array (depths x 6) of duration, speech, correct,
+                    false alarm, miss and confusion of the file (as in
+                    chunk_errors)
+            speakers: array (labels x depths x 4) of speech, correct, miss
+                      and confusion of each reference label
+    """
+    r_on, r_off, r_names, r_idx = unique_segments(*r_segments)
+    s_on, s_off, s_names, s_idx = unique_segments(*s_segments)
+    n_depths = max_depth + 1
+    bounds = np.unique(np.concatenate(
+        [r_on, r_off, s_on, s_off] +
+        [[t] for t in (start, end) if t is not None]))
+    if start is not None or end is not None:
+        lo = bounds[0] if start is None else start
+        hi = bounds[-1] if end is None else end
+        r_on, r_off = np.clip(r_on, lo, hi), np.clip(r_off, lo, hi)
+        s_on, s_off = np.clip(s_on, lo, hi), np.clip(s_off, lo, hi)
+        bounds = bounds[(bounds >= lo) & (bounds <= hi)]
+    if len(bounds) < 2:
+        return r_names, np.zeros((n_depths, 6)), \
+            np.zeros((len(r_names), n_depths, 4))
+    lengths = np.diff(bounds)
+
+    r_active = coverage(bounds, r_on, r_off, r_idx, len(r_names)) > 0
+    s_active = coverage(bounds, s_on, s_off, s_idx, len(s_names)) > 0
+    mapping = optimal_mapping(np.dot(r_active * lengths, s_active.T),
+                              r_names, s_names)
+    mapped = np.zeros((len(r_names), len(s_names)))
+    for s, s_name in enumerate(s_names):
+        if s_name in mapping:
+            mapped[r_names.index(mapping[s_name]), s] = 1
+
+    # hit[r, k]: the reference r and its system speaker are both active
+    hit = r_active & (np.dot(mapped, s_active) > 0)
+    n_ref = r_active.sum(axis=0)
+    n_sys = s_active.sum(axis=0)
+    n_correct = hit.sum(axis=0)
+    n_miss = np.maximum(n_ref - n_sys, 0)
+    n_conf = np.minimum(n_ref, n_sys) - n_correct
+    depth = np.minimum(n_ref, max_depth)
+
+    def by_depth(count):
+        return np.bincount(depth, weights=count * lengths, minlength=n_depths)
+
+    totals = np.stack([by_depth(np.ones(len(lengths))), by_depth(n_ref),
+                       by_depth(n_correct),
+                       by_depth(np.maximum(n_sys - n_ref, 0)),
+                       by_depth(n_miss), by_depth(n_conf)], axis=1)
+
+    # share of the miss and confusion of each wrong reference speaker
+    wrong = n_ref - n_correct
+    with np.errstate(invalid='ignore', divide='ignore'):
+        miss_share = np.where(wrong > 0, n_miss / wrong, 0.)
+        conf_share = np.where(wrong > 0, n_conf / wrong, 0.)
+    missed = r_active & ~hit
+    speakers = np.stack([
+        np.stack([by_depth(r_active[r]), by_depth(hit[r]),
+                  by_depth(missed[r] * miss_share),
+                  by_depth(missed[r] * conf_share)], axis=1)
+        for r in range(len(r_names))]).reshape(len(r_names), n_depths, 4)
+    return r_names, totals, speakers
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+#
+""" Long-lived scoring service: the reference (a pyannote protocol, see
+    `metrics_by_speaker.py --serve`, or a rttm) is read once, and kept in
+    memory as the arrays of onsets, offsets and labels of each file. The
+    systems are then sent as rttm's over HTTP, on localhost, and scored with
+    scoring.score_speakers, without reading the reference again.
+
+    Endpoints:
+
+        GET  /        number of files of the reference
+        POST /score   body: the rttm of the system. The answer is the table
+                      of roles.py (per speaker, per role of each file and per
+                      role of the whole set of files scored), as text.
+                      Parameters (query string, all optional):
+                          collars=0,0.25   collars in seconds (default 0)
+                          overlap=both     include, exclude or both
+                          vad=1            score as a speech activity
+                                           detection (vad=0: score the
+                                           speakers, with the optimal
+                                           mapping)
+
+    Without the vad parameter, the default of the service is used: speaker
+    scoring for `service.py` (VAD scoring with its --vad flag), and the
+    default of metrics_by_speaker.py for `metrics_by_speaker.py --serve`,
+    i.e. VAD scoring unless its --vad flag is given (that flag is inverted,
+    it disables VAD scoring), so that a system gets the same scores from
+    the service and from the command line.
+
+    The files of the system that are not in the reference are skipped (as
+    in metrics_by_speaker.py), and their names are given in the header
+    X-Skipped-Files, the scoring time in ms in the header X-Scoring-Time.
+
+    Example of use:
+
+        `python service.py /home/${USER}/BabyTrain/test/all_test.rttm --port 8765`
+        `curl --data-binary @system.rttm 'http://localhost:8765/score?collars=0,0.25'`
+"""
+
+import io
+import time
+import argparse
+import numpy as np
+
+from collections import OrderedDict
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+from roles import RoleTable
+from corpus import get_segments, parse_lines
+from scoring import make_configs, score_speakers
+
+
+def as_arrays(segments):
+    """ (onsets, offsets, labels) of a list of (onset, offset, label)"""
+    if not segments:
+        return np.array([]), np.array([]), []
+    onsets, offsets, labels = zip(*segments)
+    return np.array(onsets), np.array(offsets), list(labels)
+
+
+class ScoringService(object):
+    """ score systems against a reference kept in memory
+        ATTRIBUTES
+        ----------
+            reference: dict {uri: (onsets, offsets, labels)}
+            vad: default of the requests, if True the systems are scored as
+                 speech activity detections
+    """
+
+    def __init__(self, reference, vad=False):
+        self.reference = reference
+        self.vad = vad
+
+    def score(self, lines, collars=(0.,), overlap='include', vad=None):
+        """ score the system given by the lines of its rttm (as a speech
+            activity detection if vad, by default the one of the service)
+            OUTPUT
+            ------
+                table: text of the table of roles.py
+                skipped: files of the system that are not in the reference
+        """
+        vad = self.vad if vad is None else vad
+        system = parse_lines(lines)
+        configs = make_configs(collars, overlap)
+        fout = io.StringIO()
+        table = RoleTable(fout)
+        for uri in self.reference:
+            if uri not in system:
+                continue
+            scores = score_speakers(self.reference[uri],
+                                    as_arrays(system[uri]), configs, vad=vad)
+            table.add(uri, scores, vad)
+        table.write_roles()
+        skipped = [uri for uri in system if uri not in self.reference]
+        return fout.getvalue(), skipped
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """ one thread per request (http.server has it from python 3.7)"""
+    daemon_threads = True
+
+
+def make_handler(service):
+    """ request handler class of the HTTP server of service"""
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def reply(self, code, text, headers=()):
+            body = text.encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self.reply(200, '{} files\n'.format(len(service.reference)))
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != '/score':
+                self.reply(404, 'unknown endpoint {}\n'.format(url.path))
+                return
+            query = parse_qs(url.query)
+            try:
+                collars = [float(c) for c in
+                           query.get('collars', ['0'])[0].split(',')]
+                overlap = query.get('overlap', ['include'])[0]
+                assert overlap in ('include', 'exclude', 'both'), \
+                    'overlap must be include, exclude or both'
+                vad = None
+                if 'vad' in query:
+                    vad = query['vad'][0] in ('1', 'true')
+                length = int(self.headers.get('Content-Length', 0))
+                lines = self.rfile.read(length).decode('utf-8').splitlines()
+
+                start = time.time()
+                table, skipped = service.score(lines, collars, overlap, vad)
+                elapsed = 1000. * (time.time() - start)
+            except (AssertionError, ValueError) as err:
+                self.reply(400, '{}\n'.format(err))
+                return
+            self.reply(200, table, [('X-Scoring-Time', '{:.1f}'.format(elapsed)),
+                                    ('X-Skipped-Files', ','.join(skipped))])
+
+    return Handler
+
+
+def serve(reference, port, host='127.0.0.1', vad=False):
+    """ serve the scores against reference (dict {uri: (onsets, offsets,
+        labels)}) until interrupted, as speech activity detections by
+        default if vad"""
+    # the mapping imports scipy when it's first used, import it now so that
+    # the first request doesn't wait for it
+    import scipy.optimize
+    service = ScoringService(reference, vad)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print('scoring against {} files on http://{}:{} ({} by default)'.format(
+        len(service.reference), host, server.server_address[1],
+        'speech activity detection' if vad else 'speakers'))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('reference', type=str,
+                        help='path to the rttm of the reference')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='(Optional) port of the service (default 8765)')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='(Optional) address the service listens on, '
+                             'localhost by default')
+    parser.add_argument('--vad', action='store_true',
+                        help='(Optional) score the systems as speech activity '
+                             'detections when the request has no vad parameter')
+    args = parser.parse_args()
+
+    reference = OrderedDict((uri, as_arrays(segments)) for uri, segments
+                            in get_segments(args.reference).items())
+    serve(reference, args.port, args.host, args.vad)
+
+
+if __name__ == '__main__':
+    main()
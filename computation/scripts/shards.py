@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#
+""" Split the files of a subset between several workers (e.g. several
+    machines) and merge their outputs.
+
+    A shard is given as "i/N" (1 <= i <= N). The files are assigned to the
+    shards by decreasing duration, each file going to the shard with the
+    smallest total duration so far (ties broken by uri and shard number),
+    so that every worker computes the same assignment without communicating,
+    and the shards have about the same amount of audio.
+
+    A sharded run writes the same files as a full run, in the folder
+    shards/{i}of{N}/ of its output folder. The merge step concatenates the
+    csv's of the shards in the order a full run would have written them,
+    moves the per wav files (local SNR, chunk rates) to the output folder,
+    and removes the folders of the shards.
+"""
+
+import os
+import shutil
+
+from collections import defaultdict
+
+
+def parse_shard(spec):
+    """ parse "i/N" into (i, N)"""
+    try:
+        i, n = [int(v) for v in spec.split('/')]
+    except ValueError:
+        raise ValueError('shard should be given as i/N, got {}'.format(spec))
+    if not 1 <= i <= n:
+        raise ValueError('shard {} should be between 1/{} and {}/{}'.format(
+            spec, n, n, n))
+    return i, n
+
+
+def assign_shards(durations, n_shards):
+    """ balance files between shards (longest processing time first)
+        INPUT
+        -----
+            durations: dict {uri: duration}
+            n_shards: number of shards
+        OUTPUT
+        ------
+            shards: dict {uri: shard}, with shard in 1..n_shards
+    """
+    loads = [0.] * n_shards
+    shards = dict()
+    for uri, dur in sorted(durations.items(), key=lambda x: (-x[1], x[0])):
+        shard = min(range(n_shards), key=lambda s: (loads[s], s))
+        loads[shard] += dur
+        shards[uri] = shard + 1
+    return shards
+
+
+def select(durations, shard):
+    """ return the set of uris processed by shard=(i, N)"""
+    i, n = shard
+    return set(uri for uri, s in assign_shards(durations, n).items() if s == i)
+
+
+def keep_only(table, uris):
+    """ remove (in place) the keys of table that are not in uris"""
+    for key in [key for key in table if key not in uris]:
+        del table[key]
+    return table
+
+
+def shard_dir(out_dir, shard):
+    """ folder in which shard=(i, N) writes its outputs"""
+    return os.path.join(out_dir, 'shards', '{}of{}'.format(*shard))
+
+
+def shard_dirs(out_dir, n_shards):
+    """ output folders of the N shards, which must all exist"""
+    dirs = [shard_dir(out_dir, (i, n_shards)) for i in range(1, n_shards + 1)]
+    for path in dirs:
+        assert os.path.isdir(path), '{} does not exist, has the shard been ' \
+                                    'computed ? exiting...'.format(path)
+    return dirs
+
+
+def merge_csv(dirs, fname, out_dir, order, header=True):
+    """ concatenate the csv fname of each shard folder in out_dir/fname,
+        grouping the rows by their first column (the file) and writing
+        the groups in the given order (the order of a full run).
+        Shards in which the csv doesn't exist are skipped, nothing is
+        written if it doesn't exist in any shard.
+        INPUT
+        -----
+            dirs: shard folders
+            fname: name of the csv
+            out_dir: output folder
+            order: list of uris
+            header: whether the csv's start with a header line
+    """
+    found = False
+    first_line = None
+    rows = defaultdict(list)
+    for path in dirs:
+        path = os.path.join(path, fname)
+        if not os.path.isfile(path):
+            continue
+        found = True
+        with open(path, 'r') as fin:
+            if header:
+                first_line = fin.readline()
+            for line in fin:
+                rows[line.split(',', 1)[0]].append(line)
+
+    if not found:
+        return
+
+    # files that are not in the order (shouldn't happen) are written last
+    order = list(order) + sorted(set(rows) - set(order))
+    with open(os.path.join(out_dir, fname), 'w') as fout:
+        if first_line is not None:
+            fout.write(first_line)
+        for uri in order:
+            for line in rows.get(uri, []):
+                fout.write(line)
+
+
+def move_files(dirs, subdir, out_dir, prefix='', suffix=''):
+    """ move the files starting with prefix and ending with suffix from
+        dirs/subdir to out_dir/subdir"""
+    dest = os.path.join(out_dir, subdir)
+    for path in dirs:
+        path = os.path.join(path, subdir)
+        if not os.path.isdir(path):
+            continue
+        if not os.path.isdir(dest):
+            os.makedirs(dest)
+        for fname in sorted(os.listdir(path)):
+            if fname.startswith(prefix) and fname.endswith(suffix):
+                shutil.move(os.path.join(path, fname),
+                            os.path.join(dest, fname))
+
+
+def remove_shard_dirs(out_dir, n_shards):
+    """ remove the folders of the N shards once merged, and the shards
+        folder if no other run left shards in it"""
+    for path in shard_dirs(out_dir, n_shards):
+        shutil.rmtree(path)
+    root = os.path.join(out_dir, 'shards')
+    if not os.listdir(root):
+        os.rmdir(root)
@@ -21,203 +21,362 @@
 """
 
 import os
-import ipdb
-import time
 import argparse
 import numpy as np
-import intervaltree
-import scipy.io.wavfile
 
 from collections import defaultdict
-from speaker_info_per_file import rms
+from spk_map import spk_map
+from intervals import frame_coverage, covered_until, intersection, \
+                      MergedSegments
+from corpus import get_energy, load_energy, get_segments, read_uem
+from debug import install_debugger
+from journal import Journal
+from activity import load_activities, empty_activity, FRAME_DUR, \
+                     chunk_rates as frame_rates
+from prefetch import Prefetcher
+from parallel import map_ranges
+from scoring import chunk_errors as scored_chunk_errors
+from shards import parse_shard, select, keep_only, shard_dir, shard_dirs, \
+                   merge_csv, move_files, remove_shard_dirs
+
+# roles whose seconds of speech are given for each chunk
+CHUNK_ROLES = ['KCHI', 'CHI', 'FEM', 'MAL', 'SPEECH']
+# columns of the chunk SNR csv's (with --labels, the labels of the chunk,
+# joined with '/', are added at the end)
+CHUNK_HEADER = ['file', 'onset', 'offset', 'snr'] + CHUNK_ROLES + ['nb_speakers']
+
+
+def get_intervals(rttm, uris=None, annot=None):
+    """ return a dict {file : MergedSegments} where, for each file, the
+        overlapping segments of the rttm are merged (to get a simple VAD)
+        and the labels speaking in each merged segment are kept as a
+        bitmask (see get_segments for the arguments, annot being the
+        segments if they're already read)
+    """
+    if annot is None:
+        annot = get_segments(rttm, uris)
 
+    # merge overlaps between segments to get simple VAD
+    intervals = defaultdict(MergedSegments)
+    for wav in annot:
+        onsets, offsets, labels = zip(*annot[wav])
+        intervals[wav] = MergedSegments(onsets, offsets, labels)
 
-def get_intervals(rttm):
-    """ rttm format used by jsalt is tab separated, the columns are the following:
-            SPEAKER file_name 1 onset duration <NA> <NA> label <NA>
-        
+    return intervals
+
+def chunk_composition(segments, n_chunks, chunk_dur):
+    """ seconds of speech of each role (CHUNK_ROLES, overlapping speakers of
+        a role counted once) and number of speakers in each chunk, the
+        chunks being [i * chunk_dur, (i + 1) * chunk_dur)
         INPUT
         -----
-            rttm: the path to the all_${SET}.rttm that contains all the annotations
-                  of the set
+            segments: list of (onset, offset, label) of the file
         OUTPUT
         ------
-            annot: a dict {file : [(onset, offset, label)]} where, for each file, 
-                   the list is order by onsets and offsets
+            seconds: array (n_chunks x roles) of durations
+            n_speakers: array (n_chunks) of speaker counts
     """
-    assert os.path.isfile(rttm), '{} does not exist! exiting...'.format(rttm)
-
-    annot = defaultdict(list)
-    intervals = defaultdict(intervaltree.IntervalTree)
-    with open(rttm, 'r') as fin:
-        annotations = fin.readlines()
-
-        for line in annotations:
-            #tree = intervaltree.IntervalTree()
-
-            try:
-                _, wav, _, onset, dur, _, _, label, _ = line.split()
-            except:
-                # some annotations are different 
-                # TODO Look into, they should all be the same (not latest version ?)
-                _, wav, _, onset, dur, _, _, label, _ , _= line.split()
-
-            if float(dur) > 0:
-                intervals[wav].addi(float(onset), float(onset) + float(dur), label)
-
-    # merge overlaps between segments to get simple VAD
-    for wav in intervals:
-        intervals[wav].merge_overlaps(data_reducer=lambda x,y: "%%".join([x, y]))
-
-    return intervals
-
-def chunk_SNR(intervals, corpus_path, subset, chunk_dur):
+    by_label = defaultdict(lambda: ([], []))
+    for on, off, label in segments:
+        by_label[label][0].append(on)
+        by_label[label][1].append(off)
+
+    seconds = np.zeros((n_chunks, len(CHUNK_ROLES)))
+    n_speakers = np.zeros(n_chunks, dtype=np.int64)
+    by_role = defaultdict(lambda: ([], []))
+    for label, (onsets, offsets) in by_label.items():
+        n_speakers += frame_coverage(onsets, offsets, n_chunks, chunk_dur) > 0
+        by_role[spk_map.get(label)][0].extend(onsets)
+        by_role[spk_map.get(label)][1].extend(offsets)
+    for k, role in enumerate(CHUNK_ROLES):
+        if role in by_role:
+            seconds[:, k] = frame_coverage(by_role[role][0], by_role[role][1],
+                                           n_chunks, chunk_dur)
+    return seconds, n_speakers
+
+def chunk_SNR(intervals, corpus_path, subset, chunk_dur, energy_dir=None,
+              sources=None, annot=None, threads=1):
     """
         Cut speech segments in chunk_dur segments and compute SNR on those.
-        For each chunk_dur chunk output SNR Value
+        For each chunk_dur chunk output SNR Value.
+        If energy_dir is given, the SNR is computed from the energy index of
+        the wavs instead of the audio.
+        If annot, the segments of the files (dict {file: [(onset, offset,
+        label), ...]}), is given, the seconds of speech of each role and the
+        number of speakers of each chunk are added (see chunk_composition),
+        otherwise they are NA.
+        The chunks of a wav are computed at once, or with threads > 1, split
+        in time ranges computed by a pool of threads (see parallel.py),
+        same output.
     """
 
     corpus_snr = defaultdict(list)
 
     for wav in intervals:
-        # load wav
-        wav_path = os.path.join(corpus_path,
-                            subset, "wav",
-                            "{}.wav".format(wav))
-
-        # read wav and get framerate w/ scipy
-        frate, wav_sig = scipy.io.wavfile.read(wav_path)
-
-        # get wav duration
-        dur = len(wav_sig) / float(frate)
-
-        # manage onsets and offsets in seconds
-        for onset in np.arange(0, dur, chunk_dur):
-            offset = onset + chunk_dur
-            
-            # get all labels occuring between onset and offset + silences
-            ovls = intervals[wav].overlap(onset, offset)
-            prev_on = onset
-            prev_off = onset
-            chunk_labels = []
-            sils = []
-            spch = []
-
-            # get silences occuring in the examined chunk
-            for interval in ovls: 
-                ov_on, ov_off, ov_lab = interval
-                spch.append((ov_on, ov_off))
-                if ov_on > prev_on:
-                    sils.append((prev_on, ov_on))
-                prev_on = ov_on
-                prev_off = ov_off
-
-                # keep track of all labels speaker in current chunk
-                chunk_labels += ov_lab.split('%%')
-            else:
-                if prev_off < offset:
-                    sils.append((prev_off, min(offset, dur)))
-        
-            # if the chunk doesn't contain speech or silence, juste put "NA" as SNR value
-            try:
-                sil_idxs = np.concatenate([np.arange(int(frate * on), int(frate * off)-1) for on, off in sils])
-            except:
-                corpus_snr[wav].append((onset, offset, chunk_labels, 'NA'))
-                continue
-            try:
-                spch_idxs = np.concatenate([np.arange(int(frate * on), int(frate * off)-1) for on, off in spch])
-            except:
-                corpus_snr[wav].append((onset, offset, chunk_labels, 0))
-                continue
-
-            sil_wav = wav_sig[sil_idxs]
-            try:
-                spch_wav = wav_sig[spch_idxs]
-            except:
-                # TODO: shouldn't happen, bad annotations ? to be checked..
-                ipdb.set_trace()
-                spch_wav = wav_sig[spch_idxs[spch_idxs < len(wav_sig)]]
-
-            chunk_snr = rms(spch_wav) / rms(sil_wav) if (len(sil_wav) > 0 and len(spch_wav) > 0) else "NA"
-            corpus_snr[wav].append((onset, offset, chunk_labels, chunk_snr))
+        segments = intervals[wav]
+
+        # energy of the wav, from its samples or from its energy index
+        energy = get_energy(corpus_path, subset, wav, energy_dir, sources)
+        dur = energy.duration
+
+        chunk_onsets = np.arange(0, dur, chunk_dur)
+        if annot is not None:
+            seconds, n_speakers = chunk_composition(annot.get(wav, []),
+                                                    len(chunk_onsets),
+                                                    chunk_dur)
+            composition = [list(values) + [n] for values, n
+                           in zip(seconds.tolist(), n_speakers.tolist())]
+        else:
+            composition = [['NA'] * (len(CHUNK_ROLES) + 1)] * len(chunk_onsets)
+
+        def chunk_rows(start, stop):
+            """ rows of the chunks [start, stop) of the wav, computed at once
+                for all the chunks of the range"""
+            onsets = chunk_onsets[start:stop]
+            offsets = onsets + chunk_dur
+            ends = np.minimum(offsets, dur)
+            n_chunks = len(onsets)
+
+            # merged segments overlapping each chunk (as overlap_range),
+            # clipped to the chunk
+            first = np.searchsorted(segments.offsets, onsets, side='right')
+            last = np.maximum(first, np.searchsorted(segments.onsets, offsets,
+                                                     side='left'))
+            counts = last - first
+            starts = np.cumsum(counts) - counts
+            chunk = np.repeat(np.arange(n_chunks), counts)
+            seg = np.arange(counts.sum()) - np.repeat(starts, counts) \
+                + np.repeat(first, counts)
+            spch_on = np.maximum(segments.onsets[seg], onsets[chunk])
+            spch_off = np.minimum(segments.offsets[seg], offsets[chunk])
+
+            # keep track of all labels speaking in each chunk
+            masks = np.concatenate([segments.masks,
+                                    np.zeros(1, dtype=segments.masks.dtype)])
+            chunk_masks = np.bitwise_or.reduceat(
+                masks, np.c_[first, last].ravel())[::2]
+            chunk_masks[counts == 0] = 0
+
+            # silences of each chunk (as intervals.gaps): before, between and
+            # after its segments, until the end of the wav
+            sil_on = np.insert(spch_off, starts, onsets)
+            sil_off = np.insert(spch_on, starts + counts, ends)
+            sil_chunk = np.repeat(np.arange(n_chunks), counts + 1)
+            sil_on = np.maximum(sil_on, onsets[sil_chunk])
+            sil_off = np.minimum(sil_off, ends[sil_chunk])
+            keep = sil_off > sil_on
+
+            def chunk_rms(on, off, chunk_ids):
+                """ RMS of the segments of each chunk, NaN if empty"""
+                energies, n = energy.sum_squares(on, off)
+                total = np.bincount(chunk_ids, weights=n, minlength=n_chunks)
+                sums = np.bincount(chunk_ids, weights=energies,
+                                   minlength=n_chunks)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    return np.where(total > 0, np.sqrt(sums / total), np.nan)
+
+            sil_rms = chunk_rms(sil_on[keep], sil_off[keep], sil_chunk[keep])
+            spch_rms = chunk_rms(spch_on, spch_off, chunk)
+
+            # if the chunk doesn't contain silence, juste put "NA" as SNR value,
+            # and 0 if it doesn't contain speech
+            rows = []
+            for k in range(n_chunks):
+                if np.isnan(sil_rms[k]) or sil_rms[k] == 0:
+                    chunk_snr = 'NA'
+                elif np.isnan(spch_rms[k]):
+                    chunk_snr = 0
+                else:
+                    chunk_snr = spch_rms[k] / sil_rms[k]
+                rows.append((onsets[k], offsets[k],
+                             segments.labels_of(chunk_masks[k]), chunk_snr,
+                             composition[start + k]))
+            return rows
+
+        # the chunks are independent, split them in time ranges computed
+        # by threads, and put them back in order
+        for rows in map_ranges(chunk_rows, len(chunk_onsets), threads,
+                               min_size=16):
+            corpus_snr[wav].extend(rows)
 
     return corpus_snr
 
-def read_uem(uem):
-    '''for each wav get beginning and end with uem file'''
-    with open(uem, 'r') as fin:
-        uem_dict = {line.split()[0]: (float(line.split()[2]), float(line.split()[3])) for line in fin.readlines()}
-    return uem_dict
-
 def get_silences(rttm, uem):
-    """ return interval tree of silences"""
-    # Assume merged overlaps
-    sils = defaultdict(intervaltree.IntervalTree)
+    """ return the silences between the (merged) segments, inside the
+        annotated part of each wav"""
+    sils = defaultdict(MergedSegments)
     for wav in uem:
         beg, end = uem[wav]
-        prev_on = beg
-        prev_off = beg
-        for interval in rttm[wav].iter():
-            on, off, _ = interval
-            if on > prev_on:
-                sils[wav].addi(prev_on, on)
-            prev_on = on
-            prev_off = off
-        else:
-            if prev_off < end: 
-                sils[wav].addi(prev_off, end)
+        sils[wav] = rttm[wav].gaps(beg, end)
     return sils
 
 
-def miss_FA_per_chunk(ref_tree, sys_tree, ref_sil_tree, sys_sil_tree, chunk_dur, uem):
+def miss_FA_per_chunk(ref_tree, sys_tree, ref_sil_tree, sys_sil_tree, chunk_dur, uem,
+                      out_dir='.'):
     ''' Iterate over Chunks of $chunk_dur seconds and compute'''
     ''' False Alarm and Miss rates overs these chunks'''
+    ''' (for all the chunks of a wav at once: the duration of the
+        intersection of two sets of segments in a chunk is the difference
+        of its covered durations at the bounds of the chunk, not threaded)'''
     chunk_rates = defaultdict(list) 
    
     for wav in ref_tree:
         # get annotated boundaries from uem
         beg, end = uem[wav]
-        for on in np.arange(beg, end, chunk_dur):
-            false_dur = 0
-            miss_dur = 0
-            true_dur = 0
-            spch_dur = 0
-            off = chunk_dur + on
-            ref_segs = ref_tree[wav].overlap(on, off)
-            
-            # duration of correct classification: overlap of system and reference
-            for ovl in ref_segs:
-                ref_on, ref_off, ov_lab = ovl
-                sys_ovls = sys_tree[wav].overlap(max(ref_on, on), min(ref_off, off))
-                spch_dur += min(off, ref_off) - max(on, ref_on)
-                for sys_on, sys_off, sys_lab in sys_ovls:
-                    true_dur += min(off, min(sys_off, ref_off)) - max(on, max(sys_on, ref_on))
-
-            # duration of false alarm: overlap of system with silence_reference
-            sil_segs = ref_sil_tree[wav].overlap(on,off)
-            for ovl in sil_segs:
-                sil_on, sil_off, sil_lab = ovl
-                sys_ovls = sys_tree[wav].overlap(max(sil_on, on), min(sil_off, off))
-                for sys_on, sys_off, sys_lab in sys_ovls:
-                    false_dur += min(off, min(sys_off, sil_off)) - max(on, max(sys_on, sil_on))
-
-            # duration of misses: overlap of silences from system with reference
-            sys_sil_segs = sys_sil_tree[wav].overlap(on, off)
-            for ovl in sys_sil_segs:
-                ssil_on, ssil_off, ssil_lab = ovl
-                ref_ovls = ref_tree[wav].overlap(max(ssil_on, on), min(ssil_off, off))
-                for ref_on, ref_off, ref_lab in ref_ovls:
-                    miss_dur += min(off, min(ref_off, ssil_off)) - max(on, max(ref_on, ssil_on))
-
-            chunk_rates[wav].append((on, min(end, off), true_dur,
-                                    false_dur, miss_dur))
-        with open('chunk_rates_{}.csv'.format(wav), 'w') as fout:
+        onsets = np.arange(beg, end, chunk_dur)
+        offsets = chunk_dur + onsets
+
+        def in_chunks(first, second):
+            """ duration of the intersection of first and second in each
+                chunk"""
+            on, off = intersection(first.onsets, first.offsets,
+                                   second.onsets, second.offsets)
+            return covered_until(on, off, offsets) - \
+                covered_until(on, off, onsets)
+
+        # duration of correct classification: overlap of system and reference
+        true_dur = in_chunks(ref_tree[wav], sys_tree[wav])
+        # duration of false alarm: overlap of system with silence_reference
+        false_dur = in_chunks(ref_sil_tree[wav], sys_tree[wav])
+        # duration of misses: overlap of silences from system with reference
+        miss_dur = in_chunks(ref_tree[wav], sys_sil_tree[wav])
+
+        chunk_rates[wav] = list(zip(onsets.tolist(),
+                                    np.minimum(end, offsets).tolist(),
+                                    true_dur.tolist(), false_dur.tolist(),
+                                    miss_dur.tolist()))
+        with open(os.path.join(out_dir, 'chunk_rates_{}.csv'.format(wav)), 'w') as fout:
             for on, off, true, false, miss in chunk_rates[wav]:
                 fout.write(u'{},{},{},{},{}\n'.format(on, off, true, false, miss))
 
     return chunk_rates
             
 
+def miss_FA_per_chunk_frames(ref_act, sys_act, wavs, chunk_dur, uem, out_dir='.'):
+    ''' same as miss_FA_per_chunk, computed from the frame level activities
+        of the reference and of the system (dicts {file: Activity}, see
+        activity.py)'''
+    chunk_rates = defaultdict(list)
+
+    for wav in wavs:
+        # get annotated boundaries from uem
+        beg, end = uem[wav]
+        ref = ref_act.get(wav)
+        sys = sys_act.get(wav)
+        if ref is None:
+            ref = empty_activity(sys.frame_dur if sys is not None else FRAME_DUR)
+        if sys is None:
+            sys = empty_activity(ref.frame_dur)
+
+        onsets = np.arange(beg, end, chunk_dur)
+        true, false, miss = frame_rates(ref, sys, onsets, end)
+        for on, true_dur, false_dur, miss_dur in zip(onsets, true, false, miss):
+            chunk_rates[wav].append((on, min(end, chunk_dur + on), true_dur,
+                                     false_dur, miss_dur))
+        with open(os.path.join(out_dir, 'chunk_rates_{}.csv'.format(wav)), 'w') as fout:
+            for on, off, true_dur, false_dur, miss_dur in chunk_rates[wav]:
+                fout.write(u'{},{},{},{},{}\n'.format(on, off, true_dur,
+                                                      false_dur, miss_dur))
+
+    return chunk_rates
+
+def speaker_errors_per_chunk(ref_segs, sys_segs, wavs, chunk_dur, uem,
+                             out_dir='.'):
+    ''' decompose the diarization error of the chunks of each wav in
+        correct, false alarm, miss and speaker confusion durations, under
+        the optimal mapping between the speakers of the system and of the
+        reference on the annotated part of the wav (see
+        scoring.chunk_errors). ref_segs and sys_segs are dicts
+        {file: [(onset, offset, label), ...]}.
+        The durations are written in chunk_errors_{wav}.csv:
+            onset, offset, speech, correct, false alarm, miss, confusion
+        where speech is the total speech of the reference speakers (an
+        overlap of two speakers counts twice).
+    '''
+    chunk_errors = defaultdict(list)
+
+    for wav in wavs:
+        beg, end = uem[wav]
+        onsets = np.arange(beg, end, chunk_dur)
+        r_segments = zip(*ref_segs[wav]) if ref_segs.get(wav) else ([], [], [])
+        s_segments = zip(*sys_segs[wav]) if sys_segs.get(wav) else ([], [], [])
+        _, errors = scored_chunk_errors(list(r_segments), list(s_segments),
+                                        onsets, end)
+        for on, speech, correct, false, miss, conf in zip(onsets, *errors):
+            chunk_errors[wav].append((on, min(end, chunk_dur + on), speech,
+                                      correct, false, miss, conf))
+        with open(os.path.join(out_dir, 'chunk_errors_{}.csv'.format(wav)), 'w') as fout:
+            for row in chunk_errors[wav]:
+                fout.write(u'{},{},{},{},{},{},{}\n'.format(*row))
+
+    return chunk_errors
+
+def write_chunk_snr(corpus_snr, path, labels=False):
+    """ write the SNR of the chunks (columns CHUNK_HEADER), and their labels
+        in a last column if labels"""
+    with open(path, 'w') as fout:
+        fout.write(u'{}\n'.format(','.join(CHUNK_HEADER +
+                                           (['labels'] if labels else []))))
+        for wav in corpus_snr:
+            for onset, offset, chunk_labels, chunk_snr, roles in corpus_snr[wav]:
+                row = [wav, onset, offset, chunk_snr] + list(roles)
+                if labels:
+                    row.append('/'.join(chunk_labels))
+                fout.write(u'{}\n'.format(','.join('{}'.format(value)
+                                                    for value in row)))
+
+def get_files(ref_rttm, uem):
+    """ files of a subset, in the order in which they are processed: the
+        files of the reference, then the files only found in the uem"""
+    return list(ref_rttm) + [wav for wav in uem if wav not in ref_rttm]
+
+def file_chunks(ref_rttm, sys_rttm, wav, corpus_path, subset, chunk_dur, uem,
+                energy_dir=None, out_dir='.', energy=None, activities=None,
+                segments=None, annot=None, threads=1):
+    """ compute (and write) the miss and false alarm rates of the chunks of
+        a single wav, and return the SNR of its chunks (energy is the wav,
+        or its energy index, if it's already loaded). If activities, the
+        frame level activities of the reference and of the system, is
+        given, the rates are computed from them. If segments, the segments
+        of the reference and of the system, is given, the speaker errors of
+        the chunks are also written. If annot, the segments of the
+        reference, is given, the seconds of each role and the number of
+        speakers of each chunk are returned with its SNR. The SNR of the
+        chunks is computed by threads threads.
+    """
+    ref_rttm = {wav: ref_rttm[wav]}
+    uem = {wav: uem[wav]}
+
+    if segments is not None:
+        speaker_errors_per_chunk(segments[0], segments[1], [wav], chunk_dur,
+                                 uem, out_dir)
+
+    if activities is not None:
+        miss_FA_per_chunk_frames(activities[0], activities[1], [wav],
+                                 chunk_dur, uem, out_dir)
+    else:
+        sys_sils = get_silences(sys_rttm, uem)
+        ref_sils = get_silences(ref_rttm, uem)
+
+        miss_FA_per_chunk(ref_rttm, sys_rttm, ref_sils, sys_sils, chunk_dur,
+                          uem, out_dir)
+    return chunk_SNR(ref_rttm, corpus_path, subset, chunk_dur, energy_dir,
+                     {wav: energy}, annot, threads)[wav]
+
+def merge_shards(corpus_name, subsets, chunk_dur, n_shards, out_dir='.'):
+    """ merge the outputs of the n_shards shards of a run in out_dir,
+        as if they had been computed by a single run.
+        subsets is a list of (subset, rttm, uem), giving the order in
+        which the files are written.
+    """
+    dirs = shard_dirs(out_dir, n_shards)
+    for subset, rttm, uem in subsets:
+        merge_csv(dirs, '{}_{}_{}.csv'.format(corpus_name, subset, chunk_dur),
+                  out_dir, get_files(get_intervals(rttm), read_uem(uem)))
+    move_files(dirs, '', out_dir, prefix='chunk_rates_', suffix='.csv')
+    move_files(dirs, '', out_dir, prefix='chunk_errors_', suffix='.csv')
+    remove_shard_dirs(out_dir, n_shards)
+
 def main():
     parser = argparse.ArgumentParser()
 
@@ -227,7 +386,51 @@ def main():
                         help='path to the system RTTM')
     parser.add_argument('--chunk_dur', type=int, default=10,
                         help='(Optional) duration in seconds of the chunks to be analysed')
+    parser.add_argument('--energy_index', type=str, default=None,
+                        help='(Optional) folder containing the energy index of the '
+                             'wavs (built if needed, see energy_index.py). If given, '
+                             'the SNRs are computed from the index instead of the audio.')
+    parser.add_argument('--shard', type=str, default=None,
+                        help='(Optional) i/N, only process the i-th of N shards of the '
+                             'files (balanced by duration), and write the outputs in '
+                             'shards/{i}of{N}/')
+    parser.add_argument('--merge_shards', type=int, default=None,
+                        help='(Optional) N, merge the outputs of the N shards of a run '
+                             '(to be called with the same arguments as the shards)')
+    parser.add_argument('--restart', action='store_true',
+                        help='(Optional) ignore the journal of a previous run that '
+                             'did not finish, and compute all the files again')
+    parser.add_argument('--frame_dur', type=float, default=None,
+                        help='(Optional) compute the miss and false alarm rates from '
+                             'the frame level activity of the speakers, with frames of '
+                             'frame_dur seconds (e.g. 0.01), instead of the segments')
+    parser.add_argument('--activity_cache', type=str, default=None,
+                        help='(Optional) folder in which the frame level activities '
+                             'are cached (see activity.py)')
+    parser.add_argument('--speaker_errors', action='store_true',
+                        help='(Optional) also decompose the diarization error of each '
+                             'chunk in correct, false alarm, miss and confusion, under '
+                             'the optimal mapping of the speakers of each file, in '
+                             'chunk_errors_{wav}.csv')
+    parser.add_argument('--labels', action='store_true',
+                        help='(Optional) add the labels speaking in each chunk '
+                             '(joined with /) in the last column of the SNR csv')
+    parser.add_argument('--prefetch', type=int, default=0,
+                        help='(Optional) N, read the next N wavs (or energy indexes) in '
+                             'memory in a background thread while the current one is '
+                             'processed. Disabled by default.')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='(Optional) N, compute the SNR of the chunks of each '
+                             'file with N threads, on time ranges of the file (same '
+                             'output, the miss and false alarm rates are not '
+                             'threaded). Disabled by default.')
+    parser.add_argument('--debug', action='store_true',
+                        help='(Optional) start a debugger (ipdb, or pdb) on errors, '
+                             'instead of skipping the files that fail')
     args = parser.parse_args()
+    if args.debug:
+        install_debugger()
+    shard = parse_shard(args.shard) if args.shard else None
     corpus_name = os.path.basename(os.path.abspath(args.corpus))
 
     ## for me, on oberon...
@@ -240,35 +443,80 @@ def main():
                    'AMI': 'allMix-Headset_{}.rttm',
                    'BabyTrain': 'all_{}.rttm',
                    'lena_eval': 'all_{}.rttm'}
-    sys_rttm = get_intervals(args.rttm)
+    subsets = []
     for subset in ['train', 'dev', 'test']:
         if corpus_name == "lena_eval" and subset != 'test':
             continue
         # read annotations
         rttm = os.path.join(args.corpus, subset,
                             corpus2rttm[corpus_name].format(subset))
-        
         uem = os.path.join(args.corpus, subset,
                             corpus2rttm[corpus_name].format(subset).replace('rttm', 'uem'))
-
-        ref_rttm = get_intervals(rttm)
+        subsets.append((subset, rttm, uem))
+
+    if args.merge_shards:
+        merge_shards(corpus_name, subsets, args.chunk_dur, args.merge_shards)
+        return
+
+    # shards write in their own folder
+    out_dir = '.'
+    if shard is not None:
+        out_dir = shard_dir(out_dir, shard)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+
+    # each file is recorded in the journal when done, so that a run that
+    # didn't finish can be resumed
+    journal = Journal(os.path.join(out_dir, '_journal_{}_{}.jsonl'.format(
+        corpus_name, args.chunk_dur)), args.restart, args.debug)
+
+    sys_segs = get_segments(args.rttm)
+    sys_rttm = get_intervals(args.rttm, annot=sys_segs)
+    if args.frame_dur:
+        sys_act = load_activities(args.rttm, args.frame_dur, args.activity_cache)
+    for subset, rttm, uem in subsets:
         uem_dict = read_uem(uem)
 
-        sys_sils = get_silences(sys_rttm, uem_dict)
-
-        ref_sils = get_silences(ref_rttm, uem_dict)
-
-
-        chunk_rates = miss_FA_per_chunk(ref_rttm, sys_rttm, ref_sils, sys_sils, args.chunk_dur, uem_dict)
-
-        corpus_snr = chunk_SNR(ref_rttm, args.corpus, subset, args.chunk_dur)
-
-        with open('{}_{}_{}.csv'.format(corpus_name, subset, args.chunk_dur), 'w') as fout:
-            for wav in corpus_snr:
-                for onset, offset, chunk_labels, chunk_snr in corpus_snr[wav]:
-                    fout.write(u'{},{},{},{},{}\n'.format(wav, onset, offset,
-                                                          '/'.join(list(set(chunk_labels))),
-                                                          chunk_snr))
+        # only read the annotations of the files of the shard, balanced by
+        # annotated duration
+        uris = None
+        if shard is not None:
+            uris = select({wav: end - beg for wav, (beg, end) in uem_dict.items()},
+                          shard)
+            keep_only(uem_dict, uris)
+        ref_segs = get_segments(rttm, uris)
+        ref_rttm = get_intervals(rttm, annot=ref_segs)
+        files = get_files(ref_rttm, uem_dict)
+        segments = (ref_segs, sys_segs) if args.speaker_errors else None
+        activities = None
+        if args.frame_dur:
+            activities = (load_activities(rttm, args.frame_dur,
+                                          args.activity_cache), sys_act)
+
+        # read the next files while computing the current one
+        prefetch = Prefetcher(
+            lambda wav: load_energy(args.corpus, subset, wav, args.energy_index),
+            [wav for wav in files if not journal.done('chunks', subset, wav)],
+            args.prefetch)
+
+        # files that fail are skipped
+        corpus_snr = defaultdict(list)
+        for wav in files:
+            result = journal.run('chunks', subset, wav, file_chunks, ref_rttm,
+                                 sys_rttm, wav, args.corpus, subset,
+                                 args.chunk_dur, uem_dict, args.energy_index,
+                                 out_dir, prefetch.get(wav), activities,
+                                 segments, ref_segs, args.threads)
+            if result is not None:
+                corpus_snr[wav] = result
+        prefetch.close()
+        if args.prefetch:
+            print('{}: {}'.format(subset, prefetch.report()))
+
+        write_chunk_snr(corpus_snr, os.path.join(out_dir, '{}_{}_{}.csv'.format(
+            corpus_name, subset, args.chunk_dur)), args.labels)
+
+    journal.close()
 
 if __name__ == '__main__': 
     main()
@@ -20,36 +20,34 @@
         avg_voc_dur, snr
 """
 
-import io
 import os
-import sys
-import sox
-import ipdb
-import wave
 import argparse
 import numpy as np
-import scipy.io.wavfile
 
 from spk_map import spk_map
+from intervals import union, gaps
+from energy_index import load_index
+from corpus import get_wav_path, get_energy, load_energy
+from debug import install_debugger
+from journal import Journal
+from rttm_index import read_lines, list_uris
+from prefetch import Prefetcher
+from parallel import map_ranges
+from shards import parse_shard, select, shard_dir, shard_dirs, \
+                   merge_csv, move_files, remove_shard_dirs
+from aggregates import Aggregates, AggregateRows, load_aggregates, \
+                       save_aggregates, load_aggregate_rows, \
+                       save_aggregate_rows, write_averages, replace_subsets, \
+                       STATE, ROWS
 from operator import itemgetter
 from collections import defaultdict
 
 # for debugging
 DEBUG = False
 
-def rms(x):
-    'compute RMS of signal x'
-    n = len(x)
-    return np.sqrt( (1/n) * np.sum(np.square(x)))
+RESULTS_DIR = os.path.join('..', 'results')
 
-# BUGFIX FOR AMI
-# from https://github.com/pyannote/pyannote-audio/issues/146#issuecomment-463657241
-def normalize_wav(input_file, output_file):
-    with wave.open(input_file, "rb") as r_wav, wave.open(output_file, "wb") as w_wav:
-        w_wav.setparams(r_wav.getparams())
-        w_wav.writeframes(r_wav.readframes(w_wav.getnframes()))
-
-def parse_rttms(rttm):
+def parse_rttms(rttm, uris=None):
     """ rttm format used by jsalt is tab separated, the columns are the following:
             SPEAKER file_name 1 onset duration <NA> <NA> label <NA>
         
@@ -57,6 +55,8 @@ def parse_rttms(rttm):
         -----
             rttm: the path to the all_${SET}.rttm that contains all the annotations
                   of the set
+            uris: (optional) only read the annotations of these files (using
+                  the index of the rttm, see rttm_index.py)
         OUTPUT
         ------
             annot: a dict {file : [(onset, offset, label)]} where, for each file, 
@@ -65,18 +65,17 @@ def parse_rttms(rttm):
     assert os.path.isfile(rttm), '{} does not exist! exiting...'.format(rttm)
 
     annot = defaultdict(list)
-    with open(rttm, 'r') as fin:
-        annotations = fin.readlines()
+    annotations = read_lines(rttm, uris)
 
-        for line in annotations:
-            try:
-                _, wav, _, onset, dur, _, _, label, _ = line.split()
-            except:
-                # some annotations are different 
-                # TODO Look into, they should all be the same (not latest version ?)
-                _, wav, _, onset, dur, _, _, label, _ , _= line.split()
+    for line in annotations:
+        try:
+            _, wav, _, onset, dur, _, _, label, _ = line.split()
+        except:
+            # some annotations are different 
+            # TODO Look into, they should all be the same (not latest version ?)
+            _, wav, _, onset, dur, _, _, label, _ , _= line.split()
 
-            annot[wav].append((float(onset), float(onset) + float(dur), label))
+        annot[wav].append((float(onset), float(onset) + float(dur), label))
 
     # the output needs to be sorted
     for wav in annot:
@@ -84,8 +83,9 @@ def parse_rttms(rttm):
     
     return annot
 
-def get_wav_len(annot, corpus_path, subset, info):
-    """ for each wav file in the annotation get its duration using sox
+def get_wav_len(annot, corpus_path, subset, info, energy_dir=None):
+    """ for each wav file in the annotation get its duration using sox,
+        or using its energy index if energy_dir is given
         OUTPUT
         ------
         info: defaultdict(list) with the wav duration appended
@@ -93,26 +93,20 @@ def get_wav_len(annot, corpus_path, subset, info):
     """
 
     for wav in annot:
-        wav_path = os.path.join(corpus_path,
-                                subset, "wav",
-                                "{}.wav".format(wav))
+        wav_path = get_wav_path(corpus_path, subset, wav)
+
+        if energy_dir is not None:
+            info[wav].append(load_index(wav_path, energy_dir).duration)
+            continue
 
-        # get wav duration w/ sox
+        # get wav duration w/ sox (only imported when needed, it's slow to
+        # import)
+        import sox
         duration = sox.file_info.duration(wav_path)
 
         # update information dict
         info[wav].append(duration)
 
-        # add SNR
-        # Compute SNR as mean(wav) / std(wav)
-        try:
-            sig = scipy.io.wavfile.read(wav_path)[1] # scipy return (sample_rate, array)
-        except:
-            buff = io.BytesIO()
-            normalize_wav(wav_path, buff)
-            buff.seek(0)
-            rate, sig = scipy.io.wavfile.read(buff)
-
     return info
 
 def count_labels(annot, info):
@@ -126,16 +120,13 @@ def count_labels(annot, info):
             print('different speaker for {} are'.format(wav))
             print(set(labels))
         
-        # count number of children, femal adult, male adult, uncertain 
-        CHIs = [lab for on, off, lab in annot[wav] if spk_map[lab] == "CHI" 
-                                                   or spk_map[lab] == "KCHI"]
-        FAs = [lab for on, off, lab in annot[wav] if spk_map[lab] == "FEM"]
-        MAs = [lab for on, off, lab in annot[wav] if spk_map[lab] == "MAL"]
-        uncertains = [lab for on, off, lab in annot[wav] if spk_map[lab] == "SPEECH"]
-        the_rest = [lab for on, off, lab in annot[wav] if spk_map[lab] != 'CHI'
-                                                       and spk_map[lab] != 'FEM'
-                                                       and spk_map[lab] != 'MAL'
-                                                       and spk_map[lab] != 'SPEECH']
+        # count number of children, femal adult, male adult, uncertain
+        # (the labels that are not in spk_map only count as speakers)
+        roles = [(lab, spk_map.get(lab, 'NA')) for on, off, lab in annot[wav]]
+        CHIs = [lab for lab, role in roles if role == "CHI" or role == "KCHI"]
+        FAs = [lab for lab, role in roles if role == "FEM"]
+        MAs = [lab for lab, role in roles if role == "MAL"]
+        uncertains = [lab for lab, role in roles if role == "SPEECH"]
         # append information about speaker for wav
         info[wav].append(len(set(labels))) ## number of speakers in total
         info[wav].append(len(set(CHIs))) ## number of children
@@ -151,24 +142,10 @@ def vad_no_ovl(annot):
     """
 
     vad = defaultdict(list)
-    for wav in  annot:
-        prev_on = annot[wav][0][0]
-        prev_off = annot[wav][0][1]
-        for i, (on, off, lab) in enumerate(annot[wav]):
-            if on > prev_off: 
-                # on > prev_off implies theres a gap between
-                # previous annotation and current one
-                vad[wav].append((prev_on, prev_off))
-                prev_on = on
-                prev_off = off
-            elif on < prev_off and off > prev_off:
-                # previous and current annotation overlap
-                prev_off = off
-            elif i == len(annot[wav]) and off < prev_off:
-                # append last segment when last and second to 
-                # last overlap (otherwise would not be added by
-                # previous cases)
-                vad[wav].append((prev_on, prev_off))
+    for wav in annot:
+        onsets, offsets = union([on for on, off, lab in annot[wav]],
+                                [off for on, off, lab in annot[wav]])
+        vad[wav] = list(zip(onsets.tolist(), offsets.tolist()))
 
     return vad
 
@@ -215,10 +192,11 @@ def measure_overlap(annot, info, info_perSpk):
 
     return info, info_perSpk
 
-def write_info_per_file(corpus_name, subset, info):
-    """ write information per file """
+def write_info_per_file(corpus_name, subset, info, aggregates=None,
+                        results_dir=RESULTS_DIR):
+    """ write information per file, and add each row to the aggregates"""
 
-    with open(os.path.join('..','results',"{}_{}.csv".format(corpus_name, subset)), "w") as fout: 
+    with open(os.path.join(results_dir,"{}_{}.csv".format(corpus_name, subset)), "w") as fout: 
         fout.write(u'file,key_child_age,clip_length,nb_diff_speakers,nb_children,nb_fem_ad,nb_mal_ad,nb_uncertain,prop_ovl_speech,prop_nonovl_speech,avg_voc_dur,snr\n')
         for wav in info:
             try:
@@ -233,19 +211,37 @@ def write_info_per_file(corpus_name, subset, info):
                                                  snr=snr))
             except:
                 print(wav)
+                continue
 
-def write_info_per_speaker(corpus_name, subset, info_perSpk):
-    """ write information per speaker """
+            if aggregates is not None:
+                aggregates.add_file(corpus_name, subset,
+                                    {'file': wav, 'clip_length': dur, 'nb_diff_speakers': n_spk,
+                                     'nb_children': n_chi, 'nb_fem_ad': n_fa,
+                                     'nb_mal_ad': n_ma, 'nb_uncertain': n_unk,
+                                     'prop_ovl_speech': ovl,
+                                     'prop_nonovl_speech': non_ovl,
+                                     'avg_voc_dur': mean_voc, 'snr': snr})
 
-    with open(os.path.join('..', 'results', '{}_{}_perSpeaker.csv'.format(corpus_name,
+def write_info_per_speaker(corpus_name, subset, info_perSpk, aggregates=None,
+                           results_dir=RESULTS_DIR):
+    """ write information per speaker, and add each row to the aggregates"""
+
+    with open(os.path.join(results_dir, '{}_{}_perSpeaker.csv'.format(corpus_name,
               subset)), 'w') as fout:
         fout.write(u'file,speaker,role,tot_ovl_speech,tot_nonovl_speech,snr\n')
         for wav in info_perSpk:
             dur_ovl, dur_nonovl, dur_speech, snr= info_perSpk[wav]
             for spk in dur_speech:
-                fout.write(u'{w},{s},{r},{o},{no},{snr}\n'.format(w=wav, s=spk, r=spk_map[spk],
+                fout.write(u'{w},{s},{r},{o},{no},{snr}\n'.format(w=wav, s=spk, r=spk_map.get(spk, 'NA'),
                                                                 o=dur_ovl[spk],no= dur_nonovl[spk],
                                                                 snr=snr[spk]))
+                if aggregates is not None:
+                    aggregates.add_speaker(corpus_name, subset,
+                                           spk_map.get(spk, 'NA'),
+                                           {'file': wav,
+                                            'tot_ovl_speech': dur_ovl[spk],
+                                            'tot_nonovl_speech': dur_nonovl[spk],
+                                            'snr': snr[spk]})
 
 def get_silence_times(annot, info):
     """ Extract silences timestamps from annotations.
@@ -253,98 +249,61 @@ def get_silence_times(annot, info):
 
     sils = defaultdict(list)
 
-    # annotations are already sorted
     for wav in annot:
-        prev_on = 0
-        prev_off = 0
+        # count as silence from 0 to first annotation, the gaps
+        # between annotations, and from last offset to end of wav
         wav_dur = info[wav][0]
-        for i, (on, off, lab) in enumerate(annot[wav]):
-            # count as silence from 0 to first annotation,
-            # if there's a gap between previous offset and 
-            # current onset, and from last offset to end of wav
-            if on > prev_off:
-                sils[wav].append((prev_off, on, "SIL"))
-            if off > prev_off:
-                prev_off = off
-            prev_on = on
-        # check last label vs wav duration
-        if wav_dur > annot[wav][-1][1]:
-            sils[wav].append((annot[wav][-1][1], wav_dur, "SIL"))
+        onsets, offsets = gaps([on for on, off, lab in annot[wav]],
+                               [off for on, off, lab in annot[wav]],
+                               0, max(wav_dur, 0))
+        sils[wav] = [(on, off, "SIL")
+                     for on, off in zip(onsets.tolist(), offsets.tolist())]
 
     return sils
 
                 
-def extract_wav_from_label(wav, corpus_path, subset, annot, label):
-    """ extract array from wav file that contain only parts indicated by label
-        in annotation.
-        input 
-            wav: array containing the wav file
-            annot : annotations of the wav
-            label: label you want to extract - if label is "ALL", get all speech 
-                   intervals
-        output
-            label_wav : array containing parts of the wav indicated by label
+def label_segments(annot, label):
+    """ get onsets and offsets of the segments of the annotation that are
+        indicated by label - if label is "ALL", get all speech intervals
     """
-    wav_path = os.path.join(corpus_path,
-                            subset, "wav",
-                            "{}.wav".format(wav))
-
-    frate, wav = scipy.io.wavfile.read(wav_path)
-
-    # get onsets and offsets
-    if label == "ALL":
-        labs = [np.arange(int(frate*on), int(frate*off))
-                for on, off, lab in annot]
-    else:
-        labs = [np.arange(int(frate*on), int(frate*off))
-                for on, off, lab in annot 
-                if (spk_map[lab] == label or 
-                    lab == label)]
-    try:
-        lab_idx = np.concatenate(labs)
-    except:
-        return
+    segs = [(on, off) for on, off, lab in annot
+            if label == "ALL" or lab == label or spk_map.get(lab, 'NA') == label]
+    return [on for on, off in segs], [off for on, off in segs]
 
-    # get array that contains signal only from requested label
-    try:
-        lab_sig = wav[lab_idx]
-    except:
-        ### shouldn't happen, investigate... Bad annotations ?
-        lab_sig = wav[lab_idx[lab_idx < len(wav)]] 
-
-    return lab_sig
+def label_rms(annot, label, energy):
+    """ RMS of the parts of the wav indicated by label in annotation,
+        None if there is no such part.
+    """
+    return energy.rms(*label_segments(annot, label))
 
-def estimate_snr(annot, corpus, subset, sils, info, info_perSpk):
+def estimate_snr(annot, corpus, subset, sils, info, info_perSpk, energy_dir=None,
+                 sources=None):
     """ Estimate SNR by computing ration of regions w/ signal and 
         region without signal"""
     
-    per_label_snr = defaultdict(list)
-
     for wav in annot:
-        # get wavform of annotated part and of silence
-        sil_sig = extract_wav_from_label(wav, corpus, subset, sils[wav], "SIL")
-        speech_sig = extract_wav_from_label(wav, corpus, subset, annot[wav], "ALL")
-      
-        # global SNR
-        try:
-            sil_rms = rms(sil_sig)
-        except:
-            sil_rms = None
+        per_label_snr = defaultdict(list)
+        energy = get_energy(corpus, subset, wav, energy_dir, sources)
 
+        # get rms of annotated part and of silence
+        sil_rms = label_rms(sils[wav], "SIL", energy)
+        speech_rms = label_rms(annot[wav], "ALL", energy)
+
+        # global SNR
         # if one or both signals are empty just put "NA"
-        if (speech_sig is not None) and (sil_sig is not None):
-            info[wav].append(rms(speech_sig) / sil_rms)
+        if (speech_rms is not None) and (sil_rms is not None):
+            info[wav].append(speech_rms / sil_rms)
         else:
             info[wav].append("NA")
 
         dur_ovl, dur_nonovl, dur_speech= info_perSpk[wav]
 
         for label in dur_speech:
-            lab_sig = extract_wav_from_label(wav, corpus, subset, annot[wav], label)
+            lab_rms = label_rms(annot[wav], label, energy)
              
             # per label SNR
-            if (lab_sig is not None) and (sil_sig is not None):
-                per_label_snr[label] = rms(lab_sig) / sil_rms
+            if (lab_rms is not None) and (sil_rms is not None):
+                per_label_snr[label] = lab_rms / sil_rms
             else:
                 per_label_snr[label] = "NA"
 
@@ -353,42 +312,124 @@ def estimate_snr(annot, corpus, subset, sils, info, info_perSpk):
 
     return info, info_perSpk       
 
-def local_snr(annot, vad, corpus_path, subset, sils):
+def local_snr(annot, vad, corpus_path, subset, sils, energy_dir=None,
+              sources=None, threads=1):
     """Cut speech segments in 100 ms frames and compute SNR on those.
        for each 100s chunk output SNR Value + all current labels
+       With threads > 1, the windows of a wav are split in time ranges
+       computed by a pool of threads (see parallel.py), same output.
     """
 
     local_snr = defaultdict(list)
 
     for wav in vad:
-        # load wav
-        wav_path = os.path.join(corpus_path,
-                            subset, "wav",
-                            "{}.wav".format(wav))
-        frate, wav_sig = scipy.io.wavfile.read(wav_path)
-       
-        sil_sig = extract_wav_from_label(wav, corpus_path, subset, sils[wav], "SIL")
-        speech_sig = extract_wav_from_label(wav, corpus_path, subset, annot[wav], "ALL")
+        energy = get_energy(corpus_path, subset, wav, energy_dir, sources)
 
         # rms of all silences
-        sil_rms = rms(sil_sig)
-        snr_speech = []
-        for on, off in vad[wav]:
-            # compute SNR values for short windows of 0.1 seconds
-            segments = np.arange(on, off, 0.1)
-            snr_speech += [(b, rms(wav_sig[int(frate * b):int(frate * (b+0.1))]) / sil_rms)
-                         for b in segments[:-1]]
-        local_snr[wav].append(snr_speech)
+        sil_rms = label_rms(sils[wav], "SIL", energy)
+        if sil_rms is None:
+            sil_rms = np.nan
+
+        # compute SNR values for short windows of 0.1 seconds
+        windows = np.concatenate([np.arange(on, off, 0.1)[:-1]
+                                  for on, off in vad[wav]] + [[]])
+        snr_values = np.concatenate([[]] + map_ranges(
+            lambda start, stop: energy.rms_each(windows[start:stop],
+                                                windows[start:stop] + 0.1),
+            len(windows), threads)) / sil_rms
+        local_snr[wav].append(list(zip(windows.tolist(), snr_values.tolist())))
 
     return local_snr
 
-def write_local_snr(snr):
+def write_local_snr(snr, results_dir=RESULTS_DIR):
 
     for wav in snr:
-        with open('../results/snr/{}_snr.csv'.format(wav), 'w') as fout:
+        with open(os.path.join(results_dir, 'snr', '{}_snr.csv'.format(wav)), 'w') as fout:
             for on, val in snr[wav][0]:
                 fout.write(u'{},{}\n'.format(on, val))
-   
+
+def file_info(annot, wav, corpus, subset, energy_dir=None, energy=None):
+    """ compute the information of a single wav (energy is the wav, or its
+        energy index, if it's already loaded)
+        OUTPUT
+        ------
+            info: per file information (duration, speakers, overlap, SNR)
+            info_perSpk: per speaker information (overlap, non overlap and
+                         total speech durations, SNR)
+    """
+    annot = {wav: annot[wav]}
+    info = defaultdict(list)
+    info_perSpk = defaultdict(list)
+
+    info = get_wav_len(annot, corpus, subset, info, energy_dir)
+
+    # get speakers info
+    info = count_labels(annot, info)
+
+    # measure overlap
+    info, info_perSpk = measure_overlap(annot, info, info_perSpk)
+
+    # estimate SNR
+    sils = get_silence_times(annot, info)
+    info, info_perSpk = estimate_snr(annot, corpus, subset, sils,
+                                     info, info_perSpk, energy_dir,
+                                     {wav: energy})
+    return info[wav], info_perSpk[wav]
+
+def file_local_snr(annot, wav, corpus, subset, energy_dir=None,
+                   results_dir=RESULTS_DIR, energy=None, threads=1):
+    """ compute and write the local SNR of a single wav (energy is the wav,
+        or its energy index, if it's already loaded), with threads threads"""
+    annot = {wav: annot[wav]}
+    info = get_wav_len(annot, corpus, subset, defaultdict(list), energy_dir)
+    vad = vad_no_ovl(annot)
+    sils = get_silence_times(annot, info)
+
+    snr = local_snr(annot, vad, corpus, subset, sils, energy_dir, {wav: energy},
+                    threads)
+    write_local_snr(snr, results_dir)
+
+def shard_files(rttm, shard):
+    """ return the files of the rttm that belong to the shard, balanced by
+        the extent of their annotations: the wavs (or their energy indexes)
+        are not read to plan the shards, each shard only reads its own"""
+    extents = {wav: max(off for on, off, lab in segments)
+               for wav, segments in parse_rttms(rttm).items()}
+    return select(extents, shard)
+
+def merge_shards(corpus_name, subsets, n_shards, results_dir=RESULTS_DIR):
+    """ merge the outputs of the n_shards shards of a run in results_dir,
+        as if they had been computed by a single run.
+        INPUT
+        -----
+            corpus_name: name of the corpus
+            subsets: list of (subset, rttm), the rttm giving the order in
+                     which the files are written
+            n_shards: number of shards
+    """
+    dirs = shard_dirs(results_dir, n_shards)
+
+    orders = dict()
+    for subset, rttm in subsets:
+        orders[subset] = list_uris(rttm)
+        for fname in ['{}_{}.csv', '{}_{}_perSpeaker.csv']:
+            merge_csv(dirs, fname.format(corpus_name, subset), results_dir,
+                      orders[subset])
+    move_files(dirs, 'snr', results_dir, suffix='_snr.csv')
+
+    # add the rows of all the shards in the order of a single run, the
+    # subsets computed by the shards replace the ones already known
+    rows = AggregateRows()
+    for path in dirs:
+        rows.extend(load_aggregate_rows(os.path.join(path, ROWS)))
+    incoming = rows.replay(Aggregates(), orders)
+    aggregates_path = os.path.join(results_dir, STATE)
+    aggregates = replace_subsets(
+        load_aggregates(aggregates_path, results_dir), incoming)
+    save_aggregates(aggregates, aggregates_path)
+    write_averages(aggregates, results_dir)
+    remove_shard_dirs(results_dir, n_shards)
+
 def main():
     parser = argparse.ArgumentParser()
 
@@ -401,8 +442,37 @@ def main():
     parser.add_argument('--SRI_far', action='store_true',
                         help='if analysing the SRI corpus, enable to take FAR field '
                              'instead of close field')
+    parser.add_argument('--energy_index', type=str, default=None,
+                        help='(Optional) folder containing the energy index of the '
+                             'wavs (built if needed, see energy_index.py). If given, '
+                             'the SNRs are computed from the index instead of the audio.')
+    parser.add_argument('--shard', type=str, default=None,
+                        help='(Optional) i/N, only process the i-th of N shards of the '
+                             'files (balanced by duration), and write the outputs in '
+                             '../results/shards/{i}of{N}/')
+    parser.add_argument('--merge_shards', type=int, default=None,
+                        help='(Optional) N, merge the outputs of the N shards of a run '
+                             'in ../results (to be called with the same arguments as '
+                             'the shards)')
+    parser.add_argument('--restart', action='store_true',
+                        help='(Optional) ignore the journal of a previous run that '
+                             'did not finish, and compute all the files again')
+    parser.add_argument('--prefetch', type=int, default=0,
+                        help='(Optional) N, read the next N wavs (or energy indexes) in '
+                             'memory in a background thread while the current one is '
+                             'processed. Disabled by default.')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='(Optional) N, compute the local SNR of each file '
+                             'with N threads, on time ranges of the file (same '
+                             'output). Disabled by default.')
+    parser.add_argument('--debug', action='store_true',
+                        help='(Optional) start a debugger (ipdb, or pdb) on errors, '
+                             'instead of skipping the files that fail')
 
     args = parser.parse_args()
+    if args.debug:
+        install_debugger()
+    shard = parse_shard(args.shard) if args.shard else None
 
     # get name of corpus
     ## first do abspath to remove possible trailing /
@@ -421,7 +491,7 @@ def main():
                    'SRI': 'close_{}.rttm',
                    'SRI_far': 'far_{}.rttm'}
 
-    # get global estimations
+    subsets = []
     for subset in ['train', 'dev', 'test']:
         # skip some subset for some corpora
         if "SRI" in corpus_name and subset == "train":
@@ -437,29 +507,75 @@ def main():
             rttm = os.path.join(args.corpus, subset,
                                 corpus2rttm.setdefault(corpus_name,
                                     "all_{}.rttm").format(subset))
+        subsets.append((subset, rttm))
 
-        annot = parse_rttms(rttm)
-
-        # get wav info
-        info = defaultdict(list)
-        info_perSpk = defaultdict(list)
-
-        info = get_wav_len(annot, args.corpus, subset, info)
+    if args.merge_shards:
+        merge_shards(corpus_name, subsets, args.merge_shards)
+        return
 
-        # get speakers info
-        info = count_labels(annot, info)
+    # shards write in their own folder, and only keep the rows of the
+    # summaries, which are computed when merging
+    results_dir = RESULTS_DIR
+    aggregates_path = os.path.join(results_dir, STATE)
+    if shard is not None:
+        results_dir = shard_dir(RESULTS_DIR, shard)
+        if not os.path.isdir(os.path.join(results_dir, 'snr')):
+            os.makedirs(os.path.join(results_dir, 'snr'))
+        aggregates_path = os.path.join(results_dir, ROWS)
+        aggregates = AggregateRows()
+    else:
+        # corpus level summaries, updated as the subsets are computed (and
+        # started from the csv's already in the results on the first run)
+        aggregates = load_aggregates(aggregates_path, results_dir)
 
-        # measure overlap
-        info, info_perSpk = measure_overlap(annot, info, info_perSpk)
+    # each file is recorded in the journal when done, so that a run that
+    # didn't finish can be resumed
+    journal = Journal(os.path.join(results_dir, '_journal_{}.jsonl'.format(
+        corpus_name)), args.restart, args.debug)
 
-        # estimate SNR
-        sils = get_silence_times(annot, info)
-        info, info_perSpk = estimate_snr(annot, args.corpus, subset, sils,
-                                         info, info_perSpk)
+    # get global estimations
+    for subset, rttm in subsets:
+        # only read the annotations of the files of the shard
+        uris = None
+        if shard is not None:
+            uris = shard_files(rttm, shard)
+        annot = parse_rttms(rttm, uris)
+
+        # read the next files while computing the current one
+        prefetch = Prefetcher(
+            lambda wav: load_energy(args.corpus, subset, wav, args.energy_index),
+            [wav for wav in annot if not journal.done('info', subset, wav)],
+            args.prefetch)
+
+        # get wav info, files that fail are skipped
+        info = defaultdict(list)
+        info_perSpk = defaultdict(list)
+        for wav in annot:
+            result = journal.run('info', subset, wav, file_info, annot, wav,
+                                 args.corpus, subset, args.energy_index,
+                                 prefetch.get(wav))
+            if result is None:
+                continue
+            info[wav], (dur_ovl, dur_nonovl, dur_speech, snr) = result
+            info_perSpk[wav] = [defaultdict(float, dur_ovl),
+                                defaultdict(float, dur_nonovl),
+                                defaultdict(float, dur_speech), snr]
+        prefetch.close()
+        if args.prefetch:
+            print('{}: {}'.format(subset, prefetch.report()))
 
         # write output
-        write_info_per_file(corpus_name, subset, info)
-        write_info_per_speaker(corpus_name, subset, info_perSpk)
+        if shard is None:
+            aggregates.reset(corpus_name, subset)
+        write_info_per_file(corpus_name, subset, info, aggregates, results_dir)
+        write_info_per_speaker(corpus_name, subset, info_perSpk, aggregates,
+                               results_dir)
+
+        if shard is None:
+            save_aggregates(aggregates, aggregates_path)
+            write_averages(aggregates, results_dir)
+        else:
+            save_aggregate_rows(aggregates, aggregates_path)
 
     # if requested, get local snr
     if args.local_snr:
@@ -473,15 +589,28 @@ def main():
                                 corpus2rttm.setdefault(corpus_name,
                                     "all_{}.rttm").format(subset))
 
-            annot = parse_rttms(rttm)
-            vad = vad_no_ovl(annot)
-            info = defaultdict(list)
-
-            info = get_wav_len(annot, args.corpus, subset, info)
-            sils = get_silence_times(annot, info)
-
-            snr = local_snr(annot, vad, args.corpus, subset, sils)
-            write_local_snr(snr)
+            uris = None
+            if shard is not None:
+                uris = shard_files(rttm, shard)
+            annot = parse_rttms(rttm, uris)
+
+            prefetch = Prefetcher(
+                lambda wav: load_energy(args.corpus, subset, wav,
+                                        args.energy_index),
+                [wav for wav in annot
+                 if not journal.done('local_snr', subset, wav)],
+                args.prefetch)
+
+            # the local snr of each file is written as soon as it's computed
+            for wav in annot:
+                journal.run('local_snr', subset, wav, file_local_snr, annot,
+                            wav, args.corpus, subset, args.energy_index,
+                            results_dir, prefetch.get(wav), args.threads)
+            prefetch.close()
+            if args.prefetch:
+                print('{} (local SNR): {}'.format(subset, prefetch.report()))
+
+    journal.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+#
+""" Read the evaluation reports written by pyannote-metrics (for example
+    system_eval/AMI_MixHeadset__test__v1.txt), and join them with the
+    descriptors of computation/results.
+
+    A report is a fixed width table:
+
+        Diarization (collar = 0 ms)      diarization error rate    purity ...
+        -----------------------------  ------------------------  -------- ...
+        EN2002b.Mix-Headset                               55.46     55.73 ...
+        ...
+        TOTAL                                             48.96     68.88 ...
+
+    It is parsed once into one float array per column, plus the array of
+    uris and a hash index {uri: row}. The "%" columns are renamed after the
+    column they follow (e.g. "false alarm" -> "false_alarm_pc").
+
+    Example of use, to write a csv with the evaluation of each file and its
+    descriptors:
+
+        `python system_eval.py ../../system_eval/BabyTrain_RNN.txt ../../system_eval/BabyTrain_ConvRNN.txt -o eval.csv`
+"""
+
+import os
+import re
+import argparse
+import numpy as np
+
+from collections import OrderedDict
+
+from results_store import load_results, RESULTS_DIR
+
+COLLAR = re.compile(r'collar\s*=\s*(?P<collar>[\d.]+)\s*ms')
+
+
+def column_name(name, previous):
+    """ normalise a column name of a pyannote report"""
+    if name == '%':
+        return '{}_pc'.format(previous)
+    return re.sub(r'\W+', '_', name.strip().lower())
+
+
+class EvalReport(object):
+    """ columns of a pyannote-metrics report
+        ATTRIBUTES
+        ----------
+            name: name of the system (basename of the report)
+            task: first header cell, e.g. "Diarization", "Detection"
+            collar: collar used for the evaluation, in ms
+            uri: array of uris (TOTAL excluded)
+            columns: OrderedDict {column: float array aligned with uri}
+            total: dict {column: value} of the TOTAL row
+            index: dict {uri: row}
+    """
+
+    def __init__(self, name, task, collar, uri, columns, total):
+        self.name = name
+        self.task = task
+        self.collar = collar
+        self.uri = uri
+        self.columns = columns
+        self.total = total
+        self.index = {u: i for i, u in enumerate(uri)}
+
+    def __len__(self):
+        return len(self.uri)
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def row(self, uri):
+        """ return the values of uri as a dict {column: value}"""
+        i = self.index[uri]
+        return {col: values[i] for col, values in self.columns.items()}
+
+
+def parse_report(path):
+    """ parse a pyannote-metrics report
+        INPUT
+        -----
+            path: path to the report
+        OUTPUT
+        ------
+            report: EvalReport
+    """
+    assert os.path.isfile(path), '{} does not exist! exiting...'.format(path)
+
+    with open(path, 'r') as fin:
+        lines = [line.rstrip('\r\n') for line in fin if line.strip()]
+
+    header, dashes = lines[0], lines[1]
+    # the line of dashes gives the span of each column
+    spans = [m.span() for m in re.finditer(r'-+', dashes)]
+    names = []
+    for i, (beg, end) in enumerate(spans):
+        # headers are right aligned, except the first one
+        start = 0 if i == 0 else spans[i - 1][1]
+        names.append(header[start:end].strip())
+
+    task = names[0].split('(')[0].strip()
+    collar = COLLAR.search(names[0])
+    collar = float(collar.group('collar')) if collar else None
+
+    metrics = []
+    for name in names[1:]:
+        metrics.append(column_name(name, metrics[-1] if metrics else ''))
+
+    uris = []
+    values = []
+    total = None
+    for line in lines[2:]:
+        fields = line.split()
+        if len(fields) != len(names):
+            # warnings, or lines not part of the table
+            continue
+        row = [float(v) for v in fields[1:]]
+        if fields[0] == 'TOTAL':
+            total = dict(zip(metrics, row))
+        else:
+            uris.append(fields[0])
+            values.append(row)
+
+    values = np.array(values, dtype=np.float64).reshape(-1, len(metrics))
+    columns = OrderedDict((col, values[:, j]) for j, col in enumerate(metrics))
+    name = os.path.splitext(os.path.basename(path))[0]
+    return EvalReport(name, task, collar, np.array(uris, dtype=object),
+                      columns, total)
+
+
+_REPORTS = dict()
+
+
+def load_report(path):
+    """ parse a report once per process (reparsed if the file changed)"""
+    key = os.path.abspath(path)
+    mtime = os.stat(key).st_mtime_ns
+    if key not in _REPORTS or _REPORTS[key][0] != mtime:
+        _REPORTS[key] = (mtime, parse_report(key))
+    return _REPORTS[key][1]
+
+
+def hash_join(uri, table, key='file'):
+    """ inner join of an array of uris with a table of descriptors.
+        INPUT
+        -----
+            uri: array of uris (the left side of the join)
+            table: dict {column: array}, as returned by ResultsStore,
+                   containing the column "key"
+        OUTPUT
+        ------
+            left, right: arrays of row indices, such that uri[left] and
+                         table[key][right] are equal. If a uri matches
+                         several rows (e.g. one per speaker), it is repeated.
+    """
+    # build the hash index on the table side
+    index = dict()
+    for row, value in enumerate(table[key]):
+        index.setdefault(value, []).append(row)
+
+    left, right = [], []
+    for i, u in enumerate(uri):
+        for row in index.get(u, ()):
+            left.append(i)
+            right.append(row)
+    return (np.array(left, dtype=np.int64), np.array(right, dtype=np.int64))
+
+
+def join_descriptors(report, store=None, per_speaker=False, **filters):
+    """ join a report with the per file (or per speaker) descriptors
+        INPUT
+        -----
+            report: EvalReport
+            store: ResultsStore, by default the one of computation/results
+            per_speaker: if True, join with the per speaker descriptors,
+                         otherwise with the per file descriptors
+            filters: passed to ResultsStore.files/speakers (e.g. corpus=...)
+        OUTPUT
+        ------
+            joined: dict {column: array}, with the columns of the report
+                    and the columns of the descriptors (the columns with the
+                    same name as a metric are prefixed by "desc_")
+    """
+    if store is None:
+        store = load_results(RESULTS_DIR)
+    table = store.speakers(**filters) if per_speaker else store.files(**filters)
+
+    left, right = hash_join(report.uri, table)
+    joined = OrderedDict()
+    joined['uri'] = report.uri[left]
+    for col, values in report.columns.items():
+        joined[col] = values[left]
+    for col, values in table.items():
+        name = 'desc_{}'.format(col) if col in joined else col
+        joined[name] = values[right]
+    return joined
+
+
+def format_value(value):
+    """ write missing values as NA, like the other csv's of the results"""
+    if isinstance(value, float) and np.isnan(value):
+        return 'NA'
+    return str(value)
+
+
+def write_joined(reports, output, store=None, per_speaker=False):
+    """ write the joined tables of several reports in a single csv, with a
+        column "system" containing the name of the report"""
+    tables = [(report.name, join_descriptors(report, store, per_speaker))
+              for report in reports]
+
+    columns = ['system']
+    for _, table in tables:
+        columns += [col for col in table if col not in columns]
+
+    with open(output, 'w') as fout:
+        fout.write(u','.join(columns) + '\n')
+        for name, table in tables:
+            n_rows = len(table['uri'])
+            for i in range(n_rows):
+                row = [name] + [table[col][i] if col in table else 'NA'
+                                for col in columns[1:]]
+                fout.write(u','.join(format_value(v) for v in row) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('reports', type=str, nargs='+',
+                        help='pyannote-metrics reports to read')
+    parser.add_argument('-o', '--output', type=str, required=True,
+                        help='path to the output csv')
+    parser.add_argument('--results', type=str, default=RESULTS_DIR,
+                        help='(Optional) path to the results folder')
+    parser.add_argument('--per_speaker', action='store_true',
+                        help='(Optional) join with the per speaker descriptors'
+                             ' instead of the per file descriptors')
+    args = parser.parse_args()
+
+    reports = [load_report(path) for path in args.reports]
+    write_joined(reports, args.output, load_results(args.results),
+                 args.per_speaker)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+""" The scripts are not a package: they import each other from their folder,
+    which is added to the path of the tests."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
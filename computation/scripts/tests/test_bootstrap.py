@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from bootstrap import FileStats, rates, resample_rates, bootstrap
+
+FIELDS = ['total', 'miss']
+METRICS = OrderedDict([('miss', (['miss'], ['total']))])
+
+
+def system(name, totals, misses, uri=None):
+    uri = uri or ['f{}'.format(i) for i in range(len(totals))]
+    values = np.c_[totals, misses][:, None, :].astype(np.float64)
+    return FileStats(name, uri, ['ALL'], FIELDS, values, METRICS)
+
+
+def test_rates_of_summed_durations():
+    sums = np.array([[10., 1.], [0., 0.]])
+    out = rates(sums, FIELDS, METRICS)
+    assert out[0, 0] == 10. and np.isnan(out[1, 0])
+
+
+def test_resamples_are_sums_of_drawn_files():
+    rng = np.random.RandomState(0)
+    values = np.c_[rng.uniform(1, 10, 7), rng.uniform(0, 1, 7)][:, None, :]
+    boot = resample_rates([values], FIELDS, METRICS, n_boot=50, seed=3)[0]
+
+    # the same resamples, drawn one by one
+    rng = np.random.RandomState(3)
+    for b in range(50):
+        counts = rng.multinomial(7, np.full(7, 1. / 7))
+        sums = (counts[:, None] * values[:, 0]).sum(axis=0)
+        assert boot[b, 0, 0] == pytest.approx(100. * sums[1] / sums[0])
+
+
+def test_resamples_do_not_depend_on_the_block():
+    values = np.random.RandomState(0).uniform(1, 10, (9, 1, 2))
+    boot = [resample_rates([values], FIELDS, METRICS, n_boot=100, seed=1,
+                           block=block)[0] for block in [7, 100]]
+    assert np.array_equal(boot[0], boot[1])
+
+
+def test_interval_contains_the_value():
+    rng = np.random.RandomState(0)
+    stats = system('a', rng.uniform(10, 20, 30), rng.uniform(0, 5, 30))
+    row, = bootstrap([stats], n_boot=2000)
+    assert row['n_files'] == 30
+    assert row['low'] < row['value'] < row['high']
+    assert row['value'] == pytest.approx(
+        100. * stats.values[:, 0, 1].sum() / stats.values[:, 0, 0].sum())
+
+
+def test_single_file():
+    row, = bootstrap([system('a', [10.], [2.])], n_boot=100)
+    assert row['low'] == row['value'] == row['high'] == 20.
+
+
+def test_paired_comparison():
+    rng = np.random.RandomState(0)
+    totals = rng.uniform(10, 20, 30)
+    misses = rng.uniform(0, 5, 30)
+    first = system('a', totals, misses)
+    # the same system, on files in another order and with an extra file
+    same = system('b', np.r_[totals[::-1], 10.], np.r_[misses[::-1], 10.],
+                  uri=first.uri[::-1] + ['extra'])
+    worse = system('c', totals, misses + 1.)
+    rows = bootstrap([first, same, worse], n_boot=1000, compare=True)
+    diffs = {row['system']: row for row in rows if 'p_value' in row}
+
+    assert diffs['a - b']['n_files'] == 30
+    assert diffs['a - b']['value'] == pytest.approx(0.)
+    assert diffs['a - b']['low'] == pytest.approx(0.)
+    assert diffs['a - b']['high'] == pytest.approx(0.)
+    assert diffs['a - b']['p_value'] == 1.
+    # every file is worse: every paired resample is worse
+    assert diffs['a - c']['high'] < 0
+    assert diffs['a - c']['p_value'] == 0.
+
+
+def test_compare_different_inputs():
+    other = FileStats('b', ['f0'], ['ALL'], ['total', 'missed'],
+                      np.ones((1, 1, 2)),
+                      OrderedDict([('miss', (['missed'], ['total']))]))
+    with pytest.raises(AssertionError):
+        bootstrap([system('a', [1.], [0.]), other], n_boot=10, compare=True)
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from det_curve import file_weights, merge_files, curve, rates, \
+                      equal_error_rate
+
+FRAME_DUR = 0.1
+# the segments are on a grid of STEP seconds, and are compared with their
+# coverage of the centers of the cells of the grid
+STEP = 0.01
+
+
+def random_file(rng, n_frames, labels=('A', 'B')):
+    """ reference segments (that can overlap and go past the frames) and
+        frame scores with ties"""
+    onsets = np.round(rng.uniform(0, n_frames * FRAME_DUR, 6), 2)
+    offsets = onsets + np.round(rng.uniform(0.05, 2., 6), 2)
+    segments = [(on, off, labels[rng.randint(len(labels))])
+                for on, off in zip(onsets, offsets)]
+    return segments, np.round(rng.uniform(0, 1, n_frames), 1)
+
+
+def brute_force(segments, scores, end):
+    """ miss and false alarm at each threshold, cell by cell"""
+    centers = np.arange(0, end, STEP) + STEP / 2
+    speech = np.zeros(len(centers), dtype=bool)
+    for on, off, _ in segments:
+        speech |= (centers > on) & (centers < off)
+    frame = (centers // FRAME_DUR).astype(int)
+    # the speech after the last frame is never detected
+    cell_scores = np.where(frame < len(scores),
+                           scores[np.minimum(frame, len(scores) - 1)], -np.inf)
+    points = np.r_[np.unique(scores), np.inf]
+    miss = [np.sum(speech & (cell_scores < t)) * STEP for t in points]
+    false_alarm = [np.sum(~speech & (cell_scores >= t)) * STEP
+                   for t in points]
+    return points, np.array(miss), np.array(false_alarm)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_curve_against_thresholding(seed):
+    rng = np.random.RandomState(seed)
+    segments, scores = random_file(rng, 40)
+    thresholds, non_speech, speech, unscored = file_weights(
+        segments, scores, FRAME_DUR)
+    points, miss, false_alarm = curve(thresholds, speech['ALL'], non_speech,
+                                      unscored['ALL'])
+
+    end = max(len(scores) * FRAME_DUR, max(off for _, off, _ in segments))
+    expected = brute_force(segments, scores, end)
+    assert np.array_equal(points, expected[0])
+    assert miss == pytest.approx(expected[1], abs=1e-9)
+    assert false_alarm == pytest.approx(expected[2], abs=1e-9)
+    # never saying speech misses all the speech, and has no false alarm
+    assert miss[-1] == pytest.approx(np.sum(speech['ALL']) + unscored['ALL'])
+    assert false_alarm[-1] == 0.
+
+
+def test_roles():
+    segments = [(0., 1., 'FA1'), (0.5, 2., 'C1')]
+    scores = np.array([0.9] * 10 + [0.1] * 10)
+    thresholds, non_speech, speech, unscored = file_weights(
+        segments, scores, FRAME_DUR, uem=(0., 2.))
+    assert list(speech) == ['ALL', 'FEM', 'CHI']
+    assert thresholds.tolist() == [0.1, 0.9]
+    assert speech['FEM'].tolist() == pytest.approx([0., 1.])
+    assert speech['CHI'].tolist() == pytest.approx([1., 0.5])
+    assert speech['ALL'].tolist() == pytest.approx([1., 1.])
+    assert non_speech.sum() == 0.
+
+
+def test_merged_files_are_one_curve():
+    rng = np.random.RandomState(0)
+    files = [random_file(rng, n) for n in [30, 50]]
+    weights = [file_weights(segments, scores, FRAME_DUR)
+               for segments, scores in files]
+    thresholds, non_speech, speech, unscored = merge_files(weights)
+    points, miss, false_alarm = curve(thresholds, speech['ALL'], non_speech,
+                                      unscored['ALL'])
+    for k, t in enumerate(points):
+        # the miss of the corpus at t is the sum of the misses of the files
+        expected = 0.
+        for w in weights:
+            file_points, file_miss, _ = curve(w[0], w[2]['ALL'], w[1],
+                                              w[3]['ALL'])
+            expected += file_miss[np.searchsorted(file_points, t)]
+        assert miss[k] == pytest.approx(expected)
+
+
+def test_equal_error_rate():
+    points = np.array([0., 0.5, 1., np.inf])
+    miss_rate, fa_rate = rates(np.array([0., 2., 6., 10.]),
+                               np.array([10., 4., 1., 0.]), 10., 10.)
+    assert equal_error_rate(points, miss_rate, fa_rate) == (0.5, 30.)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from energy import segments_sum_squares, sum_squares, frame_energy, \
+                   SignalEnergy
+
+
+def naive_sum_squares(sig, starts, ends):
+    x = sig.astype(np.float64)
+    if sig.dtype == np.uint8:
+        x -= 128.
+    return (np.array([np.square(x[beg:end]).sum()
+                      for beg, end in zip(starts, ends)]),
+            np.array([x[beg:end].size for beg, end in zip(starts, ends)]))
+
+
+def random_segments(rng, n_samples, n):
+    starts = rng.randint(-100, n_samples + 100, n)
+    return starts, starts + rng.randint(0, 5000, n)
+
+
+@pytest.mark.parametrize('dtype', [np.int16, np.int32, np.uint8, np.float32])
+@pytest.mark.parametrize('channels', [1, 2])
+@pytest.mark.parametrize('block', [64, 1000, 1 << 16])
+def test_segments_sum_squares(dtype, channels, block):
+    rng = np.random.RandomState(0)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        sig = rng.randint(info.min, info.max, size=(20000, channels),
+                          dtype=np.int64).astype(dtype)
+    else:
+        sig = rng.randn(20000, channels).astype(dtype)
+    if channels == 1:
+        sig = sig[:, 0]
+    starts, ends = random_segments(rng, len(sig), 200)
+
+    energy, n = segments_sum_squares(sig, starts, ends, block=block)
+    expected, expected_n = naive_sum_squares(
+        sig, np.clip(starts, 0, len(sig)), np.clip(ends, 0, len(sig)))
+    assert np.array_equal(n, expected_n)
+    if np.issubdtype(dtype, np.integer) and dtype != np.int32:
+        # exact for integer PCM (as long as the sums are below 2**53)
+        assert np.array_equal(energy, expected)
+    else:
+        assert energy == pytest.approx(expected, rel=1e-9)
+
+
+def test_segments_sum_squares_empty():
+    sig = np.arange(10, dtype=np.int16)
+    energy, n = segments_sum_squares(sig, [5, 20], [5, 30])
+    assert energy.tolist() == [0., 0.] and n.tolist() == [0, 0]
+    energy, n = segments_sum_squares(sig, [], [])
+    assert len(energy) == 0 and len(n) == 0
+
+
+def test_sum_squares_and_frames():
+    sig = np.arange(-50, 55, dtype=np.int16)
+    energy, n = sum_squares(sig, 10, 40, block=7)
+    assert energy == np.square(np.arange(-40, -10)).sum() and n == 30
+    frames = frame_energy(sig, 10, block_frames=3)
+    assert len(frames) == 11
+    assert frames.sum() == np.square(sig.astype(np.float64)).sum()
+    assert frames[-1] == np.square(np.arange(50, 55)).sum()
+
+
+def test_signal_energy():
+    sig = np.r_[np.zeros(100), np.ones(100) * 2].astype(np.int16)
+    energy = SignalEnergy(100, sig)
+    assert energy.duration == 2.
+    assert energy.rms([1.], [2.]) == 2.
+    assert energy.rms([0.5], [1.5]) == pytest.approx(np.sqrt(2.))
+    assert energy.rms([3.], [4.]) is None
+    rms = energy.rms_each([0., 1., 3.], [1., 2., 4.])
+    assert rms[:2].tolist() == [0., 2.] and np.isnan(rms[2])
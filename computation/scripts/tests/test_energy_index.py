@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+from energy import SignalEnergy, frame_energy
+from energy_index import load_index, sidecar_paths
+
+RATE = 1000
+
+
+def write_wav(path, sig):
+    import scipy.io.wavfile
+    scipy.io.wavfile.write(path, RATE, sig)
+
+
+@pytest.fixture
+def wav(tmp_path):
+    rng = np.random.RandomState(0)
+    sig = (rng.randn(RATE * 5 + 3) * 1000).astype(np.int16)
+    path = str(tmp_path / 'file.wav')
+    write_wav(path, sig)
+    return path, sig
+
+
+def test_index_frames(wav, tmp_path):
+    path, sig = wav
+    index_dir = str(tmp_path / 'index')
+    assert load_index(path, index_dir, build=False) is None
+    index = load_index(path, index_dir)
+    assert all(os.path.isfile(p) for p in sidecar_paths(path, index_dir))
+    assert index.duration == len(sig) / float(RATE)
+    assert index.frame_len == 10
+    assert np.allclose(index.energy, frame_energy(sig, 10), rtol=1e-6)
+
+
+def test_index_rms_of_whole_frames(wav, tmp_path):
+    path, sig = wav
+    index = load_index(path, str(tmp_path / 'index'))
+    signal = SignalEnergy(RATE, sig)
+    # on frame boundaries, the index is the same as the samples
+    onsets, offsets = [0., 1.25, 4.5], [0.5, 2.5, 5.003]
+    assert index.rms(onsets, offsets) == \
+        pytest.approx(signal.rms(onsets, offsets), rel=1e-6)
+    assert index.rms_each(onsets, offsets) == \
+        pytest.approx(signal.rms_each(onsets, offsets), rel=1e-6)
+    # otherwise, only the frames entirely inside a segment are used
+    assert index.rms([0.005], [0.025]) == \
+        pytest.approx(signal.rms([0.01], [0.02]), rel=1e-6)
+    assert index.rms([0.001], [0.009]) is None
+
+
+def test_index_rebuilt_when_the_wav_changes(wav, tmp_path):
+    path, sig = wav
+    index_dir = str(tmp_path / 'index')
+    load_index(path, index_dir)
+    write_wav(path, sig[:RATE])
+    assert load_index(path, index_dir).duration == 1.
+    assert load_index(path, index_dir, mmap=False).duration == 1.
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from intervals import union, gaps, intersection, overlap_pairs, \
+                      total_duration, covered_until, MergedSegments
+
+# the random intervals are on a grid of STEP seconds, and are compared with
+# their coverage of the centers of the cells of the grid
+STEP = 0.1
+END = 30.
+
+
+def random_intervals(rng, n):
+    onsets = np.round(rng.uniform(0, END - 5, n) / STEP) * STEP
+    offsets = onsets + np.round(rng.uniform(0, 5, n) / STEP) * STEP
+    return onsets, offsets
+
+
+def cells(onsets, offsets):
+    """ boolean array of the cells of the grid covered by the intervals"""
+    centers = np.arange(0, END, STEP) + STEP / 2
+    covered = np.zeros(len(centers), dtype=bool)
+    for on, off in zip(onsets, offsets):
+        covered |= (centers > on) & (centers < off)
+    return covered
+
+
+def test_union_merges_overlapping_and_touching():
+    onsets, offsets = union([5., 0., 2., 8.], [6., 2., 3., 8.5])
+    assert onsets.tolist() == [0., 5., 8.]
+    assert offsets.tolist() == [3., 6., 8.5]
+
+
+def test_union_empty():
+    onsets, offsets = union([], [])
+    assert len(onsets) == 0 and len(offsets) == 0
+
+
+def test_gaps():
+    onsets, offsets = gaps([1., 4.], [2., 6.])
+    assert onsets.tolist() == [2.] and offsets.tolist() == [4.]
+    onsets, offsets = gaps([1., 4.], [2., 6.], 0., 10.)
+    assert onsets.tolist() == [0., 2., 6.]
+    assert offsets.tolist() == [1., 4., 10.]
+    # the support can cut the intervals
+    onsets, offsets = gaps([1., 4.], [2., 6.], 1.5, 5.)
+    assert onsets.tolist() == [2.] and offsets.tolist() == [4.]
+
+
+def test_gaps_without_intervals():
+    onsets, offsets = gaps([], [], 0., 3.)
+    assert onsets.tolist() == [0.] and offsets.tolist() == [3.]
+    assert len(gaps([], [])[0]) == 0
+
+
+def test_intersection():
+    onsets, offsets = intersection([0., 5.], [4., 8.], [3., 6.], [6., 10.])
+    assert onsets.tolist() == [3., 5.]
+    assert offsets.tolist() == [4., 8.]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_against_grid(seed):
+    rng = np.random.RandomState(seed)
+    a_on, a_off = random_intervals(rng, rng.randint(1, 15))
+    b_on, b_off = random_intervals(rng, rng.randint(1, 15))
+    a, b = cells(a_on, a_off), cells(b_on, b_off)
+
+    onsets, offsets = union(a_on, a_off)
+    assert np.all(onsets[1:] > offsets[:-1])
+    assert np.array_equal(cells(onsets, offsets), a)
+    assert total_duration(a_on, a_off) == pytest.approx(a.sum() * STEP)
+
+    onsets, offsets = gaps(a_on, a_off, 0., END)
+    assert np.array_equal(cells(onsets, offsets), ~a)
+
+    onsets, offsets = intersection(a_on, a_off, b_on, b_off)
+    assert np.array_equal(cells(onsets, offsets), a & b)
+
+    i, j, durations = overlap_pairs(a_on, a_off, b_on, b_off)
+    expected = [(p, q) for p in range(len(a_on)) for q in range(len(b_on))
+                if min(a_off[p], b_off[q]) > max(a_on[p], b_on[q])]
+    assert sorted(zip(i.tolist(), j.tolist())) == expected
+    assert np.all(durations > 0)
+
+    times = np.arange(0, END + STEP, STEP)
+    assert covered_until(a_on, a_off, times) == pytest.approx(
+        np.r_[0, np.cumsum(a) * STEP])
+
+
+def test_merged_segments_labels():
+    segments = MergedSegments([0., 3., 8., 9.], [4., 6., 10., 9.5],
+                              ['A', 'B', 'A', 'C'])
+    assert segments.labels == ['A', 'B', 'C']
+    assert list(segments) == [(0., 6., ['A', 'B']), (8., 10., ['A', 'C'])]
+    assert segments.overlap(5., 8.5) == list(segments)
+    assert [tuple(seg[:2]) for seg in segments.gaps(0., 12.)] == \
+        [(6., 8.), (10., 12.)]
@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from scoring import make_configs, score_speakers, unique_segments, \
+                    coverage, scored_weights
+
+# toy reference and system, whose durations were computed by hand:
+#
+#     reference   A [0, 4)   B [3, 6)   A [8, 10)
+#     system      s1 [0, 3.5)   s2 [3.5, 7)   s1 [9, 11)
+#
+# The optimal mapping is s1 -> A, s2 -> B. As in metrics_by_speaker.py, the
+# missed speech of a reference speaker is its speech inside the gaps of each
+# system speaker (inside the extent of its segments), e.g. A in the gap
+# [3.5, 9) of s1, and the false alarm speech is the speech of the system
+# speakers inside the gaps of the reference speaker (s2 in the gap [4, 8) of
+# A). The collar of 1s removes 0.5s on each side of the reference
+# boundaries, and only keeps [0.5, 2.5), [4.5, 5.5), [6.5, 7.5), [8.5, 9.5)
+# and the end of the file. Without the overlap, [3, 4) is not scored.
+REFERENCE = ([0., 3., 8.], [4., 6., 10.], ['A', 'B', 'A'])
+SYSTEM = ([0., 3.5, 9.], [3.5, 7., 11.], ['s1', 's2', 's1'])
+
+FIELDS = ['correct', 'FA_spk', 'FA_speech', 'miss_spk', 'miss_speech']
+# expected (correct, FA_spk, FA_speech, miss_spk, miss_speech) of A and B
+EXPECTED = {
+    'collar0ms': ((4.5, 2.5), (0.5, 0.5), (3., 0.), (0.5, 0.5), (1.5, 2.5)),
+    'collar0ms_no_overlap': ((4., 2.), (0., 0.), (3., 0.), (0., 0.),
+                             (1., 2.)),
+    'collar1000ms': ((2.5, 1.), (0., 0.), (1.5, 0.), (0., 0.), (0.5, 1.)),
+    'collar1000ms_no_overlap': ((2.5, 1.), (0., 0.), (1.5, 0.), (0., 0.),
+                                (0.5, 1.)),
+}
+# with the mapping s1 -> B, s2 -> A, and scored as a speech activity
+# detection (every system speaker counts as every reference speaker)
+EXPECTED_MAPPING = ((0.5, 0.5), (4.5, 2.5), (3., 0.), (4.5, 2.5), (1.5, 2.5))
+EXPECTED_VAD = ((5., 3.), (0., 0.), (3., 0.), (0., 0.), (1.5, 2.5))
+
+
+def random_segments(rng, labels, n, duration):
+    """ (onsets, offsets, labels) of n random segments, in steps of 0.1s, the
+        segments of a label can overlap"""
+    onsets = np.round(rng.uniform(0, duration, n), 1)
+    offsets = onsets + np.round(rng.uniform(0.1, 5, n), 1)
+    return (onsets.tolist(), offsets.tolist(),
+            [labels[i] for i in rng.randint(len(labels), size=n)])
+
+
+def check_table(results, expected):
+    for field, values, durations in zip(FIELDS, results, expected):
+        for spk, duration in zip(['A', 'B'], durations):
+            assert values[spk] == pytest.approx(duration), (field, spk)
+
+
+@pytest.mark.parametrize('name', sorted(EXPECTED))
+def test_toy_configs(name):
+    results = score_speakers(REFERENCE, SYSTEM, make_configs([0., 1.], 'both'))
+    check_table(results[name], EXPECTED[name])
+
+
+def test_toy_mapping():
+    results = score_speakers(REFERENCE, SYSTEM, make_configs([0.]),
+                             mapping={'s1': 'B', 's2': 'A'})
+    check_table(results['collar0ms'], EXPECTED_MAPPING)
+
+
+def test_toy_vad():
+    results = score_speakers(REFERENCE, SYSTEM, make_configs([0.]), vad=True)
+    check_table(results['collar0ms'], EXPECTED_VAD)
+
+
+def test_configs_scored_at_once():
+    """ scoring all the configurations in one sweep gives the tables of
+        each configuration scored alone"""
+    rng = np.random.RandomState(0)
+    reference = random_segments(rng, ['A', 'B', 'C'], 15, 40.)
+    system = random_segments(rng, ['s1', 's2', 's3'], 15, 40.)
+    configs = make_configs([0., 0.25, 1.], 'both')
+    results = score_speakers(reference, system, configs)
+    for config in configs:
+        alone = score_speakers(reference, system, [config])[config[0]]
+        for values, expected in zip(results[config[0]], alone):
+            assert dict(values) == pytest.approx(dict(expected))
+
+
+def test_empty_system():
+    results = score_speakers(REFERENCE, ([], [], []), make_configs([0.]))
+    correct = results['collar0ms'][0]
+    assert correct['A'] == 0. and correct['B'] == 0.
+
+
+def test_skip_overlap_same_speaker():
+    # [2, 4) is covered by 2 segments of A: an overlap, as in pyannote
+    reference = ([0., 2., 8.], [4., 6., 10.], ['A', 'A', 'B'])
+    system = ([0.], [10.], ['s1'])
+    results = score_speakers(reference, system, make_configs([0.], 'both'))
+    assert results['collar0ms'][0]['A'] == pytest.approx(8.)
+    assert results['collar0ms_no_overlap'][0]['A'] == pytest.approx(4.)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_scored_time_as_pyannote(seed):
+    """ the time scored for each speaker of the reference is the time kept by
+        pyannote's uemify, with and without collar and overlap"""
+    pytest.importorskip('pyannote.metrics')
+    from pyannote.core import Annotation, Segment
+    from pyannote.metrics.diarization import DiarizationErrorRate
+
+    rng = np.random.RandomState(seed)
+    reference = random_segments(rng, ['A', 'B', 'C'], 12, 40.)
+    system = random_segments(rng, ['s1', 's2'], 8, 40.)
+    annotations = []
+    for onsets, offsets, labels in [reference, system]:
+        annotation = Annotation(uri='random')
+        for track, (on, off, label) in enumerate(zip(onsets, offsets, labels)):
+            annotation[Segment(on, off), track] = label
+        annotations.append(annotation)
+
+    r_on, r_off, r_names, r_idx = unique_segments(*reference)
+    configs = make_configs([0., 0.5], 'both')
+    extra = [np.r_[r_on, r_off] + sign * collar / 2.
+             for _, collar, _ in configs if collar > 0 for sign in (-1, 1)]
+    bounds = np.unique(np.concatenate([r_on, r_off] + extra))
+    r_count = coverage(bounds, r_on, r_off, r_idx, len(r_names))
+    weights = scored_weights(bounds, r_count, r_on, r_off, configs)
+
+    metric = DiarizationErrorRate()
+    for (name, collar, skip_overlap), weight in zip(configs, weights):
+        scored, _ = metric.uemify(annotations[0], annotations[1],
+                                  collar=collar, skip_overlap=skip_overlap)
+        for k, label in enumerate(r_names):
+            expected = scored.label_timeline(label).support().duration()
+            assert np.sum(weight * (r_count[k] > 0)) == \
+                pytest.approx(expected, abs=1e-6), (name, label)